@@ -1,9 +1,10 @@
+import base64
+import io
 import os
 import sys
+
 import django
 from django.core.wsgi import get_wsgi_application
-from django.http import HttpResponse
-from django.conf import settings
 
 # Add the project directory to the Python path
 sys.path.insert(0, os.path.dirname(__file__))
@@ -18,58 +19,182 @@ django.setup()
 # Get the WSGI application
 application = get_wsgi_application()
 
-def handler(request):
-    """
-    Vercel handler function that processes HTTP requests
-    """
-    # Convert Vercel request to Django WSGI environ
+# Content types returned as plain text; anything else is base64 encoded
+TEXT_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'application/x-ndjson')
+TEXT_SUFFIXES = ('+json', '+xml')
+
+# Vercel rejects responses over 4.5 MB; base64 grows binary bodies by a third
+MAX_BODY_BYTES = int(os.getenv('SERVERLESS_MAX_RESPONSE_BYTES', str(3 * 1024 * 1024)))
+
+
+class ResponseTooLarge(Exception):
+    """The body does not fit in a single serverless response"""
+
+
+def _body_bytes(body):
+    """Request body as a bytes-like object; BytesIO shares a bytes buffer instead of copying it"""
+    if not body:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return body if isinstance(body, bytes) else memoryview(body)
+
+
+def build_environ(request):
+    """Convert a Vercel request to a WSGI environ"""
+    body = _body_bytes(request.body)
     environ = {
         'REQUEST_METHOD': request.method,
         'SCRIPT_NAME': '',
         'PATH_INFO': request.path,
         'QUERY_STRING': request.query_string or '',
         'CONTENT_TYPE': request.headers.get('content-type', ''),
-        'CONTENT_LENGTH': str(len(request.body) if request.body else 0),
+        'CONTENT_LENGTH': str(len(body)),
         'SERVER_NAME': 'vercel',
         'SERVER_PORT': '443',
         'wsgi.version': (1, 0),
         'wsgi.url_scheme': 'https',
-        'wsgi.input': request.body or b'',
+        # BytesIO over the original buffer: Django reads it lazily and only what it needs
+        'wsgi.input': io.BytesIO(body),
         'wsgi.errors': sys.stderr,
         'wsgi.multithread': False,
         'wsgi.multiprocess': False,
         'wsgi.run_once': False,
     }
 
-    # Add headers
+    # Add headers (Content-Type and Content-Length already have their own keys)
     for key, value in request.headers.items():
-        environ[f'HTTP_{key.upper().replace("-", "_")}'] = value
+        name = key.upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[f'HTTP_{name}'] = value
+    return environ
+
+
+class WSGIResponse:
+    """Status, headers and body iterator of a WSGI call; iterating does not buffer, body() does"""
+
+    def __init__(self, environ, app=None):
+        self.status = 500
+        self.headers = []
+        self._result = (app or application)(environ, self._start_response)
 
-    # Response handling
-    status = [200]
-    headers = []
-    body_parts = []
+    def _start_response(self, status_line, response_headers, exc_info=None):
+        self.status = int(status_line.split()[0])
+        self.headers = list(response_headers)
 
-    def start_response(status_line, response_headers, exc_info=None):
-        status[0] = int(status_line.split()[0])
-        headers.extend(response_headers)
+    def header(self, name, default=''):
+        name = name.lower()
+        return next((value for key, value in self.headers if key.lower() == name), default)
 
-    # Call the Django application
+    def __iter__(self):
+        # Chunks are yielded as the application produces them (StreamingHttpResponse, FileResponse)
+        try:
+            for chunk in self._result:
+                if chunk:
+                    yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        # Django fires request_finished (and closes DB connections) on close()
+        close = getattr(self._result, 'close', None)
+        if close is not None:
+            close()
+            self._result = ()
+
+    def body(self, limit=None):
+        """
+        Whole body as a bytes-like object, copying only when there is more than
+        one chunk. Raises ResponseTooLarge (and closes the response) past `limit` bytes.
+        """
+        chunks = iter(self)
+        try:
+            first = next(chunks, b'')
+            second = next(chunks, None)
+            if second is None:
+                if limit is not None and len(first) > limit:
+                    raise ResponseTooLarge
+                return first
+            buffer = io.BytesIO()
+            buffer.write(first)
+            buffer.write(second)
+            for chunk in chunks:
+                if limit is not None and buffer.tell() > limit:
+                    raise ResponseTooLarge
+                buffer.write(chunk)
+            if limit is not None and buffer.tell() > limit:
+                raise ResponseTooLarge
+            return buffer.getbuffer()
+        finally:
+            chunks.close()
+
+    def is_text(self):
+        content_type = self.header('content-type').split(';')[0].strip().lower()
+        if self.header('content-encoding'):
+            return False
+        return content_type.startswith(TEXT_TYPES) or content_type.endswith(TEXT_SUFFIXES)
+
+
+def _headers(response):
+    headers, multi = {}, {}
+    for key, value in response.headers:
+        headers[key] = value
+        multi.setdefault(key, []).append(value)
+    return headers, {key: values for key, values in multi.items() if len(values) > 1}
+
+
+def handler(request, app=None):
+    """
+    Vercel handler function that processes HTTP requests.
+
+    The function returns the response as a single payload, so streaming
+    responses (StreamingHttpResponse, FileResponse) are fully buffered here
+    and nothing reaches the client before the view finishes. Endpoints that
+    stream large or long-lived bodies do not belong behind this adapter: the
+    FHIR export runs with the export_fhir command or a regular WSGI server,
+    and bodies over MAX_BODY_BYTES are answered with 502 instead of being
+    cut off by the platform.
+    """
     try:
-        response = application(environ, start_response)
-        body_parts.extend(response)
+        response = WSGIResponse(build_environ(request), app)
+        body = response.body(MAX_BODY_BYTES)
+    except ResponseTooLarge:
+        return {
+            'statusCode': 502,
+            'headers': {'Content-Type': 'text/plain'},
+            'body': f'Response larger than {MAX_BODY_BYTES} bytes: not served by the serverless function',
+            'isBase64Encoded': False,
+        }
     except Exception as e:
         # Error handling
-        status[0] = 500
-        headers = [('Content-Type', 'text/plain')]
-        body_parts = [f'Internal Server Error: {str(e)}'.encode()]
-
-    # Return response in Vercel format
-    return {
-        'statusCode': status[0],
-        'headers': dict(headers),
-        'body': b''.join(body_parts).decode('utf-8', errors='ignore')
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'text/plain'},
+            'body': f'Internal Server Error: {str(e)}',
+            'isBase64Encoded': False,
+        }
+
+    # Text is returned as is; binary payloads (PDFs, images, gzip) go base64 encoded
+    encoded = not response.is_text()
+    if not encoded:
+        try:
+            body = str(body, 'utf-8')
+        except UnicodeDecodeError:
+            encoded = True
+    if encoded:
+        body = base64.b64encode(body).decode('ascii')
+
+    headers, multi_headers = _headers(response)
+    result = {
+        'statusCode': response.status,
+        'headers': headers,
+        'body': body,
+        'isBase64Encoded': encoded,
     }
+    if multi_headers:
+        # Repeated headers such as Set-Cookie would be lost in a dict
+        result['multiValueHeaders'] = multi_headers
+    return result
 
 # For local development
 if __name__ == '__main__':
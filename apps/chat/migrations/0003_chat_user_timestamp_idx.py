@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_alter_chatmessage_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['user', 'timestamp'], name='chat_user_timestamp_idx'),
+        ),
+    ]
@@ -28,6 +28,10 @@ class ChatMessage(models.Model):
         verbose_name = "Chat Message"
         verbose_name_plural = "Chat Messages"
         ordering = ['-timestamp', '-created_at']
+        indexes = [
+            # Historial del chat de cada usuario
+            models.Index(fields=['user', 'timestamp'], name='chat_user_timestamp_idx'),
+        ]
     
     def __str__(self):
         username = self.user.username if self.user else "Anonymous"
@@ -0,0 +1,126 @@
+"""
+Asignación de camas a pacientes.
+
+La carga de cada enfermero (camas ocupadas a su cargo) se calcula antes con
+una consulta agrupada sobre `cama_enfermero_estado_idx` y entra a la consulta
+de candidatas como constante (CASE por enfermero), en lugar de una subconsulta
+correlacionada por cada cama libre. La cama se elige en una sola consulta
+sobre el índice parcial de camas disponibles, ordenando por sala preferida,
+carga del enfermero y cercanía al número de cama pedido. La fila
+elegida se bloquea con `select_for_update(skip_locked=True)`: dos admisiones
+simultáneas nunca reciben la misma cama y ninguna espera a la otra, la
+segunda simplemente toma la siguiente candidata.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Abs
+
+from . import ocupacion
+from .models import Cama
+
+
+class AsignacionError(Exception):
+    """No se pudo asignar o liberar la cama pedida"""
+
+
+class SinCamaDisponible(AsignacionError):
+    """No quedan camas libres que cumplan los criterios"""
+
+
+def _cargas_ocupadas():
+    """{enfermero_id: camas ocupadas a su cargo}"""
+    return dict(
+        Cama.objects.filter(estado=ocupacion.ESTADO_OCUPADA, enfermero_asignado__isnull=False)
+        .order_by().values_list('enfermero_asignado').annotate(total=Count('id'))
+    )
+
+
+def _candidatas(sala=None, cerca_de=None):
+    """Camas libres ordenadas de mejor a peor candidata"""
+    cargas = [When(enfermero_asignado=pk, then=Value(total)) for pk, total in _cargas_ocupadas().items()]
+    camas = Cama.objects.filter(estado=ocupacion.ESTADO_DISPONIBLE, paciente__isnull=True).annotate(
+        sin_enfermero=Case(When(enfermero_asignado__isnull=True, then=Value(1)), default=Value(0),
+                           output_field=IntegerField()),
+        carga_enfermero=Case(*cargas, default=Value(0), output_field=IntegerField()),
+    )
+    orden = []
+    if sala is not None:
+        camas = camas.annotate(otra_sala=Case(When(sala=sala, then=Value(0)), default=Value(1),
+                                              output_field=IntegerField()))
+        orden.append('otra_sala')
+    orden += ['sin_enfermero', 'carga_enfermero']
+    if cerca_de is not None:
+        camas = camas.annotate(distancia=Abs(F('numero') - cerca_de))
+        orden.append('distancia')
+    return camas.order_by(*orden, 'sala_id', 'numero')
+
+
+def asignar_cama(paciente, sala=None, cerca_de=None, solo_sala=False):
+    """
+    Reserva la mejor cama libre para el paciente y la marca ocupada.
+
+    `sala` es la sala preferida (con `solo_sala=True`, obligatoria) y
+    `cerca_de` un número de cama de referencia para elegir la más próxima.
+    """
+    try:
+        with transaction.atomic():
+            if Cama.objects.filter(paciente=paciente).exists():
+                raise AsignacionError(f"{paciente} ya tiene una cama asignada")
+            camas = _candidatas(sala, cerca_de)
+            if solo_sala and sala is not None:
+                camas = camas.filter(sala=sala)
+            cama = camas.select_for_update(skip_locked=True, of=('self',)).first()
+            if cama is None:
+                raise SinCamaDisponible("No hay camas disponibles")
+            cama.paciente = paciente
+            cama.estado = ocupacion.ESTADO_OCUPADA
+            cama.save(update_fields=['paciente', 'estado'])
+    except IntegrityError:
+        # Otra admisión simultánea le asignó una cama entre la verificación y el UPDATE
+        raise AsignacionError(f"{paciente} ya tiene una cama asignada")
+    return cama
+
+
+def asignar_camas(pacientes, sala=None):
+    """
+    Asignación masiva (picos de admisiones): reserva todas las camas en una
+    transacción y las actualiza con bulk_update. Devuelve {paciente_id: cama};
+    los pacientes que ya tenían cama o que no alcanzaron una quedan fuera.
+    """
+    pacientes = list(pacientes)
+    try:
+        with transaction.atomic():
+            con_cama = set(Cama.objects.filter(paciente__in=pacientes).values_list('paciente_id', flat=True))
+            pendientes = [p for p in pacientes if p.pk not in con_cama]
+            camas = list(_candidatas(sala).select_for_update(skip_locked=True, of=('self',))[:len(pendientes)])
+
+            asignadas = {}
+            deltas = Counter()
+            for paciente, cama in zip(pendientes, camas):
+                cama.paciente = paciente
+                cama.estado = ocupacion.ESTADO_OCUPADA
+                cama._ocupacion_original = (cama.sala_id, cama.estado)
+                deltas[cama.sala_id] += 1
+                asignadas[paciente.pk] = cama
+            Cama.objects.bulk_update(camas[:len(asignadas)], ['paciente', 'estado'])
+
+            # bulk_update no emite señales: se aplica el delta agregado de cada sala
+            for sala_id, total in deltas.items():
+                ocupacion.aplicar_delta(sala_id, -total, total)
+    except IntegrityError:
+        raise AsignacionError("Algún paciente recibió una cama en otra admisión simultánea")
+    return asignadas
+
+
+def liberar_cama(cama_id):
+    """Da de alta la cama: queda disponible y sin paciente"""
+    with transaction.atomic():
+        cama = Cama.objects.select_for_update().get(pk=cama_id)
+        if cama.paciente_id is None and cama.estado == ocupacion.ESTADO_DISPONIBLE:
+            raise AsignacionError(f"La cama {cama.numero} ya está libre")
+        cama.paciente = None
+        cama.estado = ocupacion.ESTADO_DISPONIBLE
+        cama.save(update_fields=['paciente', 'estado'])
+    return cama
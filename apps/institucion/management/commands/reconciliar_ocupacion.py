@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.institucion.ocupacion import purgar_cambios, reconciliar
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la ocupación por sala y purga los eventos viejos del feed (ejecutar periódicamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=None,
+                            help='Retención de eventos en horas (por defecto OCUPACION_RETENCION_HORAS)')
+
+    def handle(self, *args, **options):
+        reconciliar()
+        eliminados = purgar_cambios(options['horas'])
+        self.stdout.write(f'Eventos purgados: {eliminados}')
+        self.stdout.write(self.style.SUCCESS('Ocupación reconciliada'))
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def inicializar_ocupacion(apps, schema_editor):
+    Sala = apps.get_model('institucion', 'Sala')
+    Cama = apps.get_model('institucion', 'Cama')
+    OcupacionSala = apps.get_model('institucion', 'OcupacionSala')
+    for sala in Sala.objects.all():
+        camas = Cama.objects.filter(sala=sala)
+        OcupacionSala.objects.create(
+            sala=sala,
+            disponibles=camas.filter(estado='disponible').count(),
+            ocupadas=camas.filter(estado='ocupada').count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institucion', '0002_alter_sala_nombre_alter_cama_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionSala',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disponibles', models.PositiveIntegerField(default=0)),
+                ('ocupadas', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('sala', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ocupacion', to='institucion.sala')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CambioOcupacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disponibles', models.PositiveIntegerField()),
+                ('ocupadas', models.PositiveIntegerField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('sala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios_ocupacion', to='institucion.sala')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(inicializar_ocupacion, migrations.RunPython.noop),
+    ]
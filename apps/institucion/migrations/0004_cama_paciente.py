@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_blockchain_hash_chain'),
+        ('institucion', '0003_ocupacion_sala'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cama',
+            name='paciente',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cama', to='users.paciente'),
+        ),
+        migrations.AddIndex(
+            model_name='cama',
+            index=models.Index(condition=models.Q(('estado', 'disponible')), fields=['sala', 'numero'], name='cama_disponible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cama',
+            index=models.Index(fields=['enfermero_asignado', 'estado'], name='cama_enfermero_estado_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:19
+
+import unicodedata
+
+from django.db import migrations, models
+
+# Copia de apps.institucion.scheduling al momento de la migración: si el módulo
+# cambia, la migración tiene que seguir produciendo el mismo resultado
+_ALIAS_TURNO = {
+    'manana': 'mañana', 'am': 'mañana', 'matutino': 'mañana', 'dia': 'mañana',
+    'tarde': 'tarde', 'pm': 'tarde', 'vespertino': 'tarde',
+    'noche': 'noche', 'nocturno': 'noche',
+}
+
+
+def normalizar_turno(texto):
+    base = unicodedata.normalize('NFKD', (texto or '').strip().lower())
+    base = ''.join(c for c in base if not unicodedata.combining(c))
+    return _ALIAS_TURNO.get(base, '')
+
+
+def normalizar_turnos(apps, schema_editor):
+    # Los valores no reconocidos se dejan como están para revisarlos a mano
+    Enfermero = apps.get_model('institucion', 'Enfermero')
+    for enfermero in Enfermero.objects.all():
+        turno = normalizar_turno(enfermero.turno)
+        if turno and turno != enfermero.turno:
+            Enfermero.objects.filter(pk=enfermero.pk).update(turno=turno)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institucion', '0004_cama_paciente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='enfermero',
+            name='turno',
+            field=models.CharField(choices=[('mañana', 'Mañana'), ('tarde', 'Tarde'), ('noche', 'Noche')], max_length=50),
+        ),
+        migrations.RunPython(normalizar_turnos, migrations.RunPython.noop),
+    ]
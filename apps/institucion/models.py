@@ -2,10 +2,15 @@ from django.db import models
 
 # Create your models here.
 class Enfermero(models.Model):
+    TURNOS = [
+        ('mañana', 'Mañana'),
+        ('tarde', 'Tarde'),
+        ('noche', 'Noche'),
+    ]
     nombre = models.CharField(max_length=100)
     apellido = models.CharField(max_length=100)
     especialidad = models.CharField(max_length=100)
-    turno = models.CharField(max_length=50)
+    turno = models.CharField(max_length=50, choices=TURNOS)
 
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
@@ -42,9 +47,55 @@ class Cama(models.Model):
         blank=True,
         related_name='camas'
     )
+    paciente = models.OneToOneField(
+        'users.Paciente',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='cama'
+    )
     class Meta:
         unique_together = ('numero', 'sala')
+        indexes = [
+            # Búsqueda de camas libres del asignador (apps.institucion.allocation)
+            models.Index(fields=['sala', 'numero'], condition=models.Q(estado='disponible'),
+                         name='cama_disponible_idx'),
+            # Carga de cada enfermero (camas ocupadas a su cargo)
+            models.Index(fields=['enfermero_asignado', 'estado'], name='cama_enfermero_estado_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado tal como se leyó, para calcular el delta de ocupación al guardar
+        instance._ocupacion_original = (instance.__dict__.get('sala_id'), instance.__dict__.get('estado'))
+        return instance
 
     def __str__(self):
         enfermero = f" - Enfermero: {self.enfermero_asignado}" if self.enfermero_asignado else " - Sin enfermero asignado"
-        return f"Cama {self.numero} en {self.sala.nombre} ({self.estado}){enfermero}"
\ No newline at end of file
+        return f"Cama {self.numero} en {self.sala.nombre} ({self.estado}){enfermero}"
+
+
+class OcupacionSala(models.Model):
+    """Contadores de ocupación por sala, mantenidos por apps.institucion.ocupacion"""
+    sala = models.OneToOneField(Sala, on_delete=models.CASCADE, related_name='ocupacion')
+    disponibles = models.PositiveIntegerField(default=0)
+    ocupadas = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.sala.nombre}: {self.ocupadas} ocupadas / {self.disponibles} disponibles"
+
+
+class CambioOcupacion(models.Model):
+    """Cambio de ocupación de una sala; el id sirve de cursor para el feed de eventos"""
+    sala = models.ForeignKey(Sala, on_delete=models.CASCADE, related_name='cambios_ocupacion')
+    disponibles = models.PositiveIntegerField()
+    ocupadas = models.PositiveIntegerField()
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.sala_id} @ {self.fecha}: {self.ocupadas}/{self.disponibles}"
@@ -0,0 +1,139 @@
+"""
+Motor de ocupación de camas.
+
+Cada sala tiene una fila `OcupacionSala` con los contadores de camas
+disponibles y ocupadas. Las señales de `Cama` aplican el delta de cada alta,
+baja o transición de estado con un UPDATE atómico y registran un
+`CambioOcupacion`, cuyo id es el cursor del feed de deltas: los tableros
+reciben solo las salas que cambiaron en lugar de volver a pedir la lista de
+camas completa.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Cama, CambioOcupacion, OcupacionSala, Sala
+
+ESTADO_DISPONIBLE = 'disponible'
+ESTADO_OCUPADA = 'ocupada'
+
+# Columnas de la respuesta compacta de resumen_ocupacion
+COLUMNAS = ['sala_id', 'nombre', 'capacidad', 'disponibles', 'ocupadas']
+
+
+def _deltas(estado, signo):
+    """Convierte un estado de cama en (delta_disponibles, delta_ocupadas)"""
+    if estado == ESTADO_DISPONIBLE:
+        return signo, 0
+    if estado == ESTADO_OCUPADA:
+        return 0, signo
+    return 0, 0
+
+
+def aplicar_delta(sala_id, delta_disponibles, delta_ocupadas):
+    """Ajusta los contadores de una sala y registra el cambio para el feed"""
+    if not delta_disponibles and not delta_ocupadas:
+        return
+    with transaction.atomic():
+        updated = OcupacionSala.objects.filter(sala_id=sala_id).update(
+            disponibles=F('disponibles') + delta_disponibles,
+            ocupadas=F('ocupadas') + delta_ocupadas,
+            actualizado=timezone.now(),
+        )
+        if not updated:
+            reconciliar(sala_ids=[sala_id])
+            return
+        disponibles, ocupadas = OcupacionSala.objects.filter(sala_id=sala_id).values_list(
+            'disponibles', 'ocupadas').get()
+        CambioOcupacion.objects.create(sala_id=sala_id, disponibles=disponibles, ocupadas=ocupadas)
+
+
+def registrar_guardado(cama, created):
+    """Aplica el delta de ocupación de una cama recién guardada"""
+    nuevo = (cama.sala_id, cama.estado)
+    anterior = None if created else getattr(cama, '_ocupacion_original', None)
+    cama._ocupacion_original = nuevo
+    if anterior == nuevo:
+        return
+    if anterior is not None and anterior[0] is not None:
+        aplicar_delta(anterior[0], *_deltas(anterior[1], -1))
+    aplicar_delta(nuevo[0], *_deltas(nuevo[1], 1))
+
+
+def registrar_baja(cama):
+    """
+    Las bajas son poco frecuentes y la instancia puede estar desactualizada:
+    se recuenta la sala en lugar de confiar en el estado en memoria.
+    """
+    if OcupacionSala.objects.filter(sala_id=cama.sala_id).exists():
+        reconciliar(sala_ids=[cama.sala_id])
+
+
+def cambiar_estado_cama(cama_id, estado):
+    """
+    Transición de estado de una cama. La fila se bloquea y se relee dentro de
+    la transacción, de modo que dos transiciones simultáneas sobre la misma
+    cama no aplican el mismo delta dos veces.
+    """
+    with transaction.atomic():
+        cama = Cama.objects.select_for_update().get(pk=cama_id)
+        if cama.estado != estado:
+            cama.estado = estado
+            cama.save(update_fields=['estado'])
+    return cama
+
+
+def reconciliar(sala_ids=None):
+    """Recalcula los contadores desde la tabla de camas (todas las salas o las indicadas)"""
+    salas = Sala.objects.all()
+    if sala_ids is not None:
+        salas = salas.filter(id__in=sala_ids)
+    conteos = salas.annotate(
+        n_disponibles=Count('camas', filter=Q(camas__estado=ESTADO_DISPONIBLE)),
+        n_ocupadas=Count('camas', filter=Q(camas__estado=ESTADO_OCUPADA)),
+    ).values_list('id', 'n_disponibles', 'n_ocupadas')
+
+    with transaction.atomic():
+        for sala_id, disponibles, ocupadas in conteos:
+            OcupacionSala.objects.update_or_create(
+                sala_id=sala_id, defaults={'disponibles': disponibles, 'ocupadas': ocupadas},
+            )
+            CambioOcupacion.objects.create(sala_id=sala_id, disponibles=disponibles, ocupadas=ocupadas)
+
+
+def ultimo_cambio_id():
+    return CambioOcupacion.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def resumen_ocupacion():
+    """
+    Ocupación de todas las salas en formato compacto (filas con las columnas de
+    COLUMNAS). Las salas cargadas sin señales aparecen tras reconciliar_ocupacion.
+    """
+    filas = OcupacionSala.objects.order_by('sala__nombre').values_list(
+        'sala_id', 'sala__nombre', 'sala__capacidad', 'disponibles', 'ocupadas')
+    return {'cursor': ultimo_cambio_id(), 'columnas': COLUMNAS, 'salas': [list(fila) for fila in filas]}
+
+
+def cambios_desde(cursor, limite=500):
+    """
+    Cambios posteriores al cursor, compactados a la última foto de cada sala.
+    Devuelve (nuevo_cursor, filas [sala_id, disponibles, ocupadas]).
+    """
+    cambios = list(CambioOcupacion.objects.filter(id__gt=cursor).order_by('id').values_list(
+        'id', 'sala_id', 'disponibles', 'ocupadas')[:limite])
+    if not cambios:
+        return cursor, []
+    ultimos = {}
+    for cambio_id, sala_id, disponibles, ocupadas in cambios:
+        ultimos[sala_id] = [sala_id, disponibles, ocupadas]
+    return cambios[-1][0], list(ultimos.values())
+
+
+def purgar_cambios(horas=None):
+    """Elimina eventos viejos del feed; los clientes más atrasados vuelven a pedir el resumen"""
+    if horas is None:
+        horas = getattr(settings, 'OCUPACION_RETENCION_HORAS', 24)
+    limite = timezone.now() - timezone.timedelta(hours=horas)
+    return CambioOcupacion.objects.filter(fecha__lt=limite).delete()[0]
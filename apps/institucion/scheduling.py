@@ -0,0 +1,142 @@
+"""
+Balanceo de la carga de enfermería.
+
+La asignación enfermero-cama se calcula con un greedy sobre un heap de cargas
+(variante LPT): las camas se recorren de mayor a menor peso y cada una va al
+enfermero menos cargado del turno. Es O(n log m) y para un hospital completo
+son dos consultas de lectura y un bulk_update.
+
+La carga por enfermero que muestra `registrar_cama` se lee de la base en cada
+request (una consulta agregada): un caché por proceso mostraría cargas viejas
+en los demás workers después de cada asignación.
+"""
+import heapq
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Cama, Enfermero
+from .ocupacion import ESTADO_OCUPADA
+
+# Una cama ocupada requiere más atención que una libre
+PESO_OCUPADA = 2
+PESO_DISPONIBLE = 1
+
+_ALIAS_TURNO = {
+    'manana': 'mañana', 'am': 'mañana', 'matutino': 'mañana', 'dia': 'mañana',
+    'tarde': 'tarde', 'pm': 'tarde', 'vespertino': 'tarde',
+    'noche': 'noche', 'nocturno': 'noche',
+}
+
+
+def normalizar_turno(texto):
+    """Lleva el texto libre de un turno a uno de Enfermero.TURNOS (o '' si no se reconoce)"""
+    base = unicodedata.normalize('NFKD', (texto or '').strip().lower())
+    base = ''.join(c for c in base if not unicodedata.combining(c))
+    return _ALIAS_TURNO.get(base, '')
+
+
+def peso_cama(estado):
+    return PESO_OCUPADA if estado == ESTADO_OCUPADA else PESO_DISPONIBLE
+
+
+def balancear(camas, enfermeros, cargas_iniciales=None):
+    """
+    Reparte las camas entre los enfermeros minimizando la carga máxima.
+
+    `camas` es una lista de (cama_id, peso, enfermero_actual_id) y `enfermeros`
+    una lista de ids. Ante empates se conserva el enfermero actual para no
+    mover camas sin necesidad. Devuelve {cama_id: enfermero_id}.
+    """
+    if not enfermeros:
+        return {}
+    cargas_iniciales = cargas_iniciales or {}
+    carga = {enfermero_id: cargas_iniciales.get(enfermero_id, 0) for enfermero_id in enfermeros}
+    heap = [(valor, enfermero_id) for enfermero_id, valor in carga.items()]
+    heapq.heapify(heap)
+
+    asignacion = {}
+    for cama_id, peso, actual in sorted(camas, key=lambda c: (-c[1], c[0])):
+        # Descartar entradas viejas del heap (carga ya actualizada)
+        while heap[0][0] != carga[heap[0][1]]:
+            heapq.heappop(heap)
+        minima, elegido = heap[0]
+        if actual in carga and carga[actual] == minima:
+            elegido = actual
+        carga[elegido] += peso
+        heapq.heappush(heap, (carga[elegido], elegido))
+        asignacion[cama_id] = elegido
+    return asignacion
+
+
+def _aplicar(asignacion, actuales):
+    """Guarda solo las camas cuyo enfermero cambia; devuelve cuántas se movieron"""
+    cambios = [
+        Cama(pk=cama_id, enfermero_asignado_id=enfermero_id)
+        for cama_id, enfermero_id in asignacion.items()
+        if actuales.get(cama_id) != enfermero_id
+    ]
+    if cambios:
+        Cama.objects.bulk_update(cambios, ['enfermero_asignado'], batch_size=500)
+    return len(cambios)
+
+
+def rebalancear_sala(sala, turno=None):
+    """
+    Rebalancea las camas de una sala entre los enfermeros que ya la atienden.
+    Con `turno` se usan los de ese turno que la atienden o, si no hay ninguno,
+    todos los del turno. La carga que cada uno tiene en otras salas cuenta como
+    carga inicial. Devuelve la cantidad de camas movidas.
+    """
+    sala_id = getattr(sala, 'pk', sala)
+    with transaction.atomic():
+        camas = list(Cama.objects.select_for_update().filter(sala_id=sala_id)
+                     .values_list('id', 'estado', 'enfermero_asignado_id'))
+        enfermeros = Enfermero.objects.filter(camas__sala_id=sala_id)
+        if turno:
+            enfermeros = enfermeros.filter(turno=turno)
+            if not enfermeros.exists():
+                enfermeros = Enfermero.objects.filter(turno=turno)
+        enfermeros = list(enfermeros.distinct().values_list('id', flat=True))
+
+        cargas = {}
+        otras = (Cama.objects.filter(enfermero_asignado__in=enfermeros).exclude(sala_id=sala_id)
+                 .values_list('enfermero_asignado', 'estado').annotate(total=Count('id')))
+        for enfermero_id, estado, total in otras:
+            cargas[enfermero_id] = cargas.get(enfermero_id, 0) + peso_cama(estado) * total
+
+        asignacion = balancear(
+            [(cama_id, peso_cama(estado), actual) for cama_id, estado, actual in camas],
+            enfermeros, cargas,
+        )
+        return _aplicar(asignacion, {cama_id: actual for cama_id, _, actual in camas})
+
+
+def rebalancear_hospital(turno):
+    """Reparte todas las camas del hospital entre los enfermeros de un turno"""
+    with transaction.atomic():
+        camas = list(Cama.objects.select_for_update().values_list('id', 'estado', 'enfermero_asignado_id'))
+        enfermeros = list(Enfermero.objects.filter(turno=turno).values_list('id', flat=True))
+        asignacion = balancear(
+            [(cama_id, peso_cama(estado), actual) for cama_id, estado, actual in camas], enfermeros,
+        )
+        return _aplicar(asignacion, {cama_id: actual for cama_id, _, actual in camas})
+
+
+def cargas_enfermeros():
+    """
+    Carga actual por enfermero: lista de dicts con id, nombre, turno, camas y
+    ocupadas, ordenada de mayor a menor carga. Una consulta, sin caché.
+    """
+    filas = Enfermero.objects.annotate(
+        total_camas=Count('camas'),
+        total_ocupadas=Count('camas', filter=Q(camas__estado=ESTADO_OCUPADA)),
+    ).values_list('id', 'nombre', 'apellido', 'turno', 'total_camas', 'total_ocupadas')
+    cargas = [
+        {'id': pk, 'nombre': f'{nombre} {apellido}', 'turno': turno, 'camas': total,
+         'ocupadas': ocupadas, 'carga': ocupadas * PESO_OCUPADA + (total - ocupadas) * PESO_DISPONIBLE}
+        for pk, nombre, apellido, turno, total, ocupadas in filas
+    ]
+    cargas.sort(key=lambda c: (-c['carga'], c['nombre']))
+    return cargas
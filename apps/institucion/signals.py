@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ocupacion
+from .models import Cama, OcupacionSala, Sala
+
+
+@receiver(post_save, sender=Sala)
+def crear_ocupacion_sala(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        OcupacionSala.objects.get_or_create(sala=instance)
+
+
+@receiver(post_save, sender=Cama)
+def actualizar_ocupacion(sender, instance, created, raw=False, **kwargs):
+    """Alta o transición de estado de una cama: se aplica solo el delta"""
+    if not raw:
+        ocupacion.registrar_guardado(instance, created)
+
+
+@receiver(post_delete, sender=Cama)
+def descontar_ocupacion(sender, instance, **kwargs):
+    ocupacion.registrar_baja(instance)
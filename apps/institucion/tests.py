@@ -1,3 +1,229 @@
-from django.test import TestCase
+import importlib
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db.models import Count
+from django.urls import reverse
+
+from core.testing import HospitalTestCase
+
+from . import allocation, ocupacion, scheduling
+from .models import Cama, Enfermero, OcupacionSala, Sala
+
+
+class InstitucionViewsQueryBudgetTests(HospitalTestCase):
+    """Presupuestos de consultas de las vistas de gestión institucional"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin_perf', password='password123')
+        self.login(self.admin)
+
+    def test_lista_camas(self):
+        self.assertQueryBudget(reverse('institucion:lista_camas'))
+
+    def test_institutional_management(self):
+        self.assertQueryBudget(reverse('institucion:institutional_management'))
+
+    def test_ocupacion_salas(self):
+        response = self.assertQueryBudget(reverse('institucion:ocupacion_salas'))
+        data = response.json()
+        self.assertEqual(len(data['salas']), Sala.objects.count())
+        self.assertEqual(data['columnas'], ocupacion.COLUMNAS)
+
+    def test_ocupacion_salas_delta(self):
+        cursor = ocupacion.ultimo_cambio_id()
+        self.assertQueryBudget(f"{reverse('institucion:ocupacion_salas')}?desde={cursor}")
+
+
+class OcupacionTests(HospitalTestCase):
+    """Contadores de ocupación mantenidos por las transiciones de estado de las camas"""
+
+    def assertOcupacionConsistente(self):
+        for sala in Sala.objects.all():
+            fila = OcupacionSala.objects.get(sala=sala)
+            self.assertEqual(fila.disponibles, sala.camas.filter(estado='disponible').count())
+            self.assertEqual(fila.ocupadas, sala.camas.filter(estado='ocupada').count())
+
+    def test_transiciones_actualizan_contadores(self):
+        cama = Cama.objects.filter(estado='disponible').first()
+        ocupacion.cambiar_estado_cama(cama.pk, 'ocupada')
+        ocupacion.cambiar_estado_cama(cama.pk, 'ocupada')
+        ocupacion.cambiar_estado_cama(Cama.objects.filter(estado='ocupada').last().pk, 'mantenimiento')
+
+        sala = Sala.objects.create(nombre='Sala nueva', capacidad=2)
+        Cama.objects.create(numero=1, sala=sala, estado='disponible')
+        otra = Cama.objects.create(numero=2, sala=sala, estado='ocupada')
+        otra.sala = cama.sala
+        otra.numero = 999
+        otra.save()
+        cama.delete()
+        self.assertOcupacionConsistente()
+
+    def test_cambios_desde_devuelve_solo_salas_modificadas(self):
+        cursor = ocupacion.ultimo_cambio_id()
+        cama = Cama.objects.filter(estado='disponible').first()
+        ocupacion.cambiar_estado_cama(cama.pk, 'ocupada')
+        ocupacion.cambiar_estado_cama(cama.pk, 'disponible')
+
+        nuevo_cursor, salas = ocupacion.cambios_desde(cursor)
+        self.assertGreater(nuevo_cursor, cursor)
+        fila = OcupacionSala.objects.get(sala_id=cama.sala_id)
+        self.assertEqual(salas, [[cama.sala_id, fila.disponibles, fila.ocupadas]])
+        self.assertEqual(ocupacion.cambios_desde(nuevo_cursor), (nuevo_cursor, []))
+
+    def test_deltas_solo_para_staff(self):
+        url = reverse('institucion:ocupacion_salas')
+        self.login(self.paciente.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.login(User.objects.create_user('staff_ocupacion', password='password123', is_staff=True))
+        cursor = ocupacion.ultimo_cambio_id()
+        cama = Cama.objects.filter(estado='disponible').first()
+        ocupacion.cambiar_estado_cama(cama.pk, 'ocupada')
+        datos = self.client.get(url, {'desde': cursor}).json()
+        self.assertEqual([fila[0] for fila in datos['salas']], [cama.sala_id])
+        self.assertEqual(self.client.get(url, {'desde': datos['cursor']}).json()['salas'], [])
+
+
+class AsignacionCamasTests(HospitalTestCase):
+    """Asignador de camas: elección de candidata, exclusividad y contadores de ocupación"""
+
+    def test_asigna_cama_en_sala_preferida_con_enfermero_menos_cargado(self):
+        sala = Sala.objects.order_by('id').last()
+        cama = allocation.asignar_cama(self.paciente, sala=sala.pk)
+        self.assertEqual(cama.sala_id, sala.pk)
+        self.assertEqual(cama.estado, 'ocupada')
+        self.assertEqual(Cama.objects.get(paciente=self.paciente), cama)
+
+        cargas = dict(
+            Cama.objects.filter(estado='ocupada').exclude(pk=cama.pk)
+            .values_list('enfermero_asignado').annotate(total=Count('id'))
+        )
+        for libre in Cama.objects.filter(sala=sala, estado='disponible').exclude(enfermero_asignado=None):
+            self.assertLessEqual(cargas.get(cama.enfermero_asignado_id, 0),
+                                 cargas.get(libre.enfermero_asignado_id, 0))
+        self.assertEqual(OcupacionSala.objects.get(sala=sala).ocupadas,
+                         sala.camas.filter(estado='ocupada').count())
+
+    def test_no_asigna_dos_camas_al_mismo_paciente(self):
+        allocation.asignar_cama(self.paciente)
+        with self.assertRaises(allocation.AsignacionError):
+            allocation.asignar_cama(self.paciente)
+
+    def test_sin_camas_disponibles(self):
+        sala = Sala.objects.create(nombre='Sala llena', capacidad=1)
+        Cama.objects.create(numero=1, sala=sala, estado='ocupada')
+        with self.assertRaises(allocation.SinCamaDisponible):
+            allocation.asignar_cama(self.paciente, sala=sala.pk, solo_sala=True)
+
+    def test_asignacion_masiva_y_liberacion(self):
+        pacientes = self.data['pacientes'][:8]
+        libres_antes = Cama.objects.filter(estado='disponible').count()
+        asignadas = allocation.asignar_camas(pacientes)
+
+        self.assertEqual(len(asignadas), 8)
+        self.assertEqual(len({cama.pk for cama in asignadas.values()}), 8)
+        self.assertEqual(Cama.objects.filter(estado='disponible').count(), libres_antes - 8)
+        self.assertEqual(allocation.asignar_camas(pacientes), {})
+
+        cama = asignadas[pacientes[0].pk]
+        allocation.liberar_cama(cama.pk)
+        cama.refresh_from_db()
+        self.assertIsNone(cama.paciente_id)
+        for sala in Sala.objects.all():
+            self.assertEqual(sala.ocupacion.disponibles, sala.camas.filter(estado='disponible').count())
+
+    def test_endpoints(self):
+        self.login(User.objects.create_superuser('admin_camas', password='password123'))
+        response = self.client.post(reverse('institucion:asignar_cama'), {'paciente_id': self.paciente.pk})
+        self.assertEqual(response.status_code, 201)
+        cama_id = response.json()['id']
+        response = self.client.post(reverse('institucion:asignar_cama'), {'paciente_id': self.paciente.pk})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(reverse('institucion:liberar_cama', args=[cama_id]))
+        self.assertEqual(response.json()['estado'], 'disponible')
+        response = self.client.post(reverse('institucion:asignar_cama'), {'paciente_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_endpoints_solo_staff(self):
+        self.login(self.profesional.user)
+        response = self.client.post(reverse('institucion:asignar_cama'), {'paciente_id': self.paciente.pk})
+        self.assertEqual(response.status_code, 403)
+        cama = Cama.objects.filter(estado='ocupada').first()
+        self.assertEqual(self.client.post(reverse('institucion:liberar_cama', args=[cama.pk])).status_code, 403)
+
+    def test_asignacion_concurrente_es_conflicto(self):
+        # Otra admisión le asigna una cama entre la verificación y el UPDATE
+        otra = Cama.objects.filter(estado='disponible').last()
+        Cama.objects.filter(pk=otra.pk).update(paciente=self.paciente, estado='ocupada')
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            with self.assertRaises(allocation.AsignacionError):
+                allocation.asignar_cama(self.paciente)
+        self.assertEqual(Cama.objects.get(paciente=self.paciente), otra)
+
+
+class BalanceoEnfermeriaTests(HospitalTestCase):
+    """Scheduler de carga de enfermería y caché de cargas por enfermero"""
+
+    def test_balancear_reparte_carga_y_respeta_asignacion_actual(self):
+        camas = [(i, 2 if i % 3 == 0 else 1, None) for i in range(1, 31)]
+        asignacion = scheduling.balancear(camas, [1, 2, 3])
+        cargas = {1: 0, 2: 0, 3: 0}
+        for cama_id, peso, _ in camas:
+            cargas[asignacion[cama_id]] += peso
+        self.assertLessEqual(max(cargas.values()) - min(cargas.values()), 2)
+
+        # Una asignación ya equilibrada no se modifica
+        actuales = [(cama_id, peso, asignacion[cama_id]) for cama_id, peso, _ in camas]
+        self.assertEqual(scheduling.balancear(actuales, [1, 2, 3]), asignacion)
+
+    def test_normalizar_turno(self):
+        self.assertEqual(scheduling.normalizar_turno(' Mañana '), 'mañana')
+        self.assertEqual(scheduling.normalizar_turno('MANANA'), 'mañana')
+        self.assertEqual(scheduling.normalizar_turno('Nocturno'), 'noche')
+        self.assertEqual(scheduling.normalizar_turno('guardia'), '')
+
+    def test_rebalancear_sala(self):
+        sala = Sala.objects.order_by('id').first()
+        enfermero = Enfermero.objects.first()
+        sala.camas.update(enfermero_asignado=enfermero)
+        Cama.objects.filter(sala=sala, numero__lte=5).update(enfermero_asignado=Enfermero.objects.last())
+
+        self.assertGreater(scheduling.rebalancear_sala(sala), 0)
+        por_enfermero = list(sala.camas.values('enfermero_asignado').annotate(total=Count('id'))
+                             .values_list('total', flat=True))
+        self.assertEqual(len(por_enfermero), 2)
+        self.assertEqual(scheduling.rebalancear_sala(sala), 0)
+
+    def test_rebalancear_hospital(self):
+        movidas = scheduling.rebalancear_hospital('mañana')
+        self.assertGreater(movidas, 0)
+        cargas = [c['carga'] for c in scheduling.cargas_enfermeros() if c['camas']]
+        self.assertLessEqual(max(cargas) - min(cargas), 2)
+
+    def test_registrar_cama_muestra_cargas_actuales(self):
+        self.login(User.objects.create_superuser('admin_carga', password='password123'))
+        self.assertQueryBudget(reverse('institucion:registrar_cama'))
+
+        # Sin caché: el cambio se ve aunque no se ejecuten los callbacks on_commit de este proceso
+        cama = Cama.objects.filter(estado='disponible').first()
+        ocupacion.cambiar_estado_cama(cama.pk, 'ocupada')
+        carga = next(c for c in scheduling.cargas_enfermeros() if c['id'] == cama.enfermero_asignado_id)
+        self.assertEqual(carga['ocupadas'], Cama.objects.filter(
+            enfermero_asignado=cama.enfermero_asignado_id, estado='ocupada').count())
+
+    def test_rebalancear_sala_endpoint(self):
+        sala = Sala.objects.first()
+        url = reverse('institucion:rebalancear_sala', args=[sala.pk])
+        self.login(self.paciente.user)
+        self.assertEqual(self.client.post(url, {'turno': ''}).status_code, 403)
+        self.login(User.objects.create_superuser('admin_rebalanceo', password='password123'))
+        response = self.client.post(url, {'turno': ''})
+        self.assertRedirects(response, reverse('institucion:registrar_sala'))
+
+    def test_migracion_normaliza_sin_importar_scheduling(self):
+        migracion = importlib.import_module('apps.institucion.migrations.0005_enfermero_turnos')
+        for texto in (' Mañana ', 'MANANA', 'Nocturno', 'guardia', 'pm'):
+            self.assertEqual(migracion.normalizar_turno(texto), scheduling.normalizar_turno(texto))
@@ -9,5 +9,10 @@ urlpatterns = [
     path('registrar/sala/', views.registrar_sala, name='registrar_sala'),
     path('registrar/cama/', views.registrar_cama, name='registrar_cama'),
     path('lista/sala/', views.lista_salas, name='lista_salas'),
+    path('lista/cama/', views.lista_camas, name='lista_camas'),
+    path('ocupacion/', views.ocupacion_salas, name='ocupacion_salas'),
+    path('camas/asignar/', views.asignar_cama, name='asignar_cama'),
+    path('camas/<int:cama_id>/liberar/', views.liberar_cama, name='liberar_cama'),
+    path('salas/<int:sala_id>/rebalancear/', views.rebalancear_sala, name='rebalancear_sala'),
     path('management/', views.institutional_management, name='institutional_management'),
 ]
\ No newline at end of file
@@ -1,16 +1,24 @@
 
 # Create your views here.
-from django.shortcuts import render, redirect
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.views.decorators.http import require_http_methods
+from apps.users.models import Paciente
 from .forms import EnfermeroForm, OperarioForm, SalaForm, CamaForm
 from .models import Enfermero, Operario, Sala, Cama
-from apps.users.models import Profesional, Paciente  # Asegúrate de que estos modelos existan
+from . import allocation, ocupacion, scheduling
+from core.counters import get_counters
 
 def registrar_enfermero(request):
     if request.method == 'POST':
         form = EnfermeroForm(request.POST)
         if form.is_valid():
             form.save()
-            return redirect('registrar_enfermero')
+            return redirect('institucion:registrar_enfermero')
     else:
         form = EnfermeroForm()
         enfermeros = Enfermero.objects.all()
@@ -21,7 +29,7 @@ def registrar_operario(request):
         form = OperarioForm(request.POST)
         if form.is_valid():
             form.save()
-            return redirect('registrar_operario') 
+            return redirect('institucion:registrar_operario') 
     else:
         form = OperarioForm()
         operarios = Operario.objects.all()
@@ -32,46 +40,131 @@ def registrar_sala(request):
         form = SalaForm(request.POST)
         if form.is_valid():
             form.save()
-            return redirect('registrar_sala')
+            return redirect('institucion:registrar_sala')
     else:
         form = SalaForm()
     salas = Sala.objects.all()
-    return render(request, 'management/registrar_sala.html', {'form': form, 'salas': salas})
+    return render(request, 'management/registrar_sala.html', {
+        'form': form,
+        'salas': salas,
+        'turnos': Enfermero.TURNOS,
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def rebalancear_sala(request, sala_id):
+    """Reparte las camas de la sala entre sus enfermeros de forma equilibrada; solo staff"""
+    if not request.role.is_admin:
+        raise PermissionDenied
+    sala = get_object_or_404(Sala, pk=sala_id)
+    turno = request.POST.get('turno') or None
+    movidas = scheduling.rebalancear_sala(sala, turno=turno)
+    messages.success(request, f'Sala {sala.nombre} rebalanceada: {movidas} camas reasignadas.')
+    return redirect('institucion:registrar_sala')
 
 def registrar_cama(request):
     if request.method == 'POST':
         form = CamaForm(request.POST)
         if form.is_valid():
             form.save()
-            return redirect('registrar_cama')
+            return redirect('institucion:registrar_cama')
     else:
         form = CamaForm()
     camas = Cama.objects.select_related('sala', 'enfermero_asignado').all()
-    return render(request, 'management/registrar_cama.html', {'form': form, 'camas': camas})
+    return render(request, 'management/registrar_cama.html', {
+        'form': form,
+        'camas': camas,
+        'cargas_enfermeros': scheduling.cargas_enfermeros(),
+    })
 
 def lista_camas(request):
     camas = Cama.objects.select_related('sala', 'enfermero_asignado').all()
-    return render(request, 'management/lista_camas.html', {'camas': camas})
+    return render(request, 'management/lista_camas.html', {
+        'camas': camas,
+        'ocupacion': ocupacion.resumen_ocupacion(),
+        'poll_intervalo_ms': int(settings.OCUPACION_POLL_INTERVALO * 1000),
+    })
+
+
+def _parse_cursor(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+@login_required
+def ocupacion_salas(request):
+    """
+    Ocupación por sala en formato compacto, solo para staff y administradores.
+    Con `?desde=<cursor>` devuelve solo las salas que cambiaron desde ese
+    cursor: la lista de camas lo consulta cada OCUPACION_POLL_INTERVALO
+    segundos, una request corta que no ocupa un worker mientras espera.
+    """
+    if not request.role.is_admin:
+        raise PermissionDenied
+    desde = _parse_cursor(request.GET.get('desde'))
+    if desde is None:
+        return JsonResponse(ocupacion.resumen_ocupacion())
+    cursor, salas = ocupacion.cambios_desde(desde)
+    return JsonResponse({'cursor': cursor, 'columnas': ['sala_id', 'disponibles', 'ocupadas'], 'salas': salas})
+
 
 def lista_salas(request):
     salas = Sala.objects.all()
     return render(request, 'management/lista_salas.html', {'salas': salas})
 
 def institutional_management(request):
-    total_camas = Cama.objects.count()
-    total_enfermeros = Enfermero.objects.count()
-    total_operarios = Operario.objects.count()
-    total_salas = Sala.objects.count()
-    # Si tienes modelos Medico y Paciente, usa sus nombres reales
-    total_medicos = Profesional.objects.count()  # Reemplaza por Medico.objects.count() si tienes el modelo
-    total_pacientes = Paciente.objects.count()  # Reemplaza por Paciente.objects.count() si tienes el modelo
+    # Contadores materializados y repartidos en shards (core.counters): un SUM agrupado
+    # sobre la tabla de contadores, leído de la base en cada request, en lugar de seis COUNT(*)
+    totales = get_counters('camas', 'enfermeros', 'operarios', 'salas', 'profesionales', 'pacientes')
 
     context = {
-        'total_camas': total_camas,
-        'total_enfermeros': total_enfermeros,
-        'total_operarios': total_operarios,
-        'total_salas': total_salas,
-        'total_medicos': total_medicos,
-        'total_pacientes': total_pacientes,
+        'total_camas': totales['camas'],
+        'total_enfermeros': totales['enfermeros'],
+        'total_operarios': totales['operarios'],
+        'total_salas': totales['salas'],
+        'total_medicos': totales['profesionales'],
+        'total_pacientes': totales['pacientes'],
     }
-    return render(request, 'management/institutional_management.html', context)
\ No newline at end of file
+    return render(request, 'management/institutional_management.html', context)
+
+
+def _cama_json(cama):
+    return {'id': cama.id, 'numero': cama.numero, 'sala_id': cama.sala_id,
+            'enfermero_id': cama.enfermero_asignado_id, 'paciente_id': cama.paciente_id, 'estado': cama.estado}
+
+
+@login_required
+@require_http_methods(["POST"])
+def asignar_cama(request):
+    """Asigna la mejor cama libre a un paciente (paciente_id, sala y cerca_de opcionales); solo staff"""
+    if not request.role.is_admin:
+        raise PermissionDenied
+    paciente_id = _parse_cursor(request.POST.get('paciente_id'))
+    if paciente_id is None:
+        return JsonResponse({'error': 'paciente_id inválido'}, status=400)
+    paciente = get_object_or_404(Paciente, pk=paciente_id)
+    sala = _parse_cursor(request.POST.get('sala'))
+    cerca_de = _parse_cursor(request.POST.get('cerca_de'))
+    try:
+        cama = allocation.asignar_cama(paciente, sala=sala, cerca_de=cerca_de,
+                                       solo_sala=request.POST.get('solo_sala') == '1')
+    except allocation.AsignacionError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(_cama_json(cama), status=201)
+
+
+@login_required
+@require_http_methods(["POST"])
+def liberar_cama(request, cama_id):
+    """Libera la cama (alta del paciente); solo staff"""
+    if not request.role.is_admin:
+        raise PermissionDenied
+    get_object_or_404(Cama.objects.only('id'), pk=cama_id)
+    try:
+        cama = allocation.liberar_cama(cama_id)
+    except allocation.AsignacionError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(_cama_json(cama))
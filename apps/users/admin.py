@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path
 from django.shortcuts import redirect
-from .models import Paciente, Profesional, Alergia, CondicionMedica, Tratamiento, Antecedente, PruebaLaboratorio, Cirugia, BlockchainHash, AccesoBlockchain
+from .models import Paciente, Profesional, Alergia, CondicionMedica, Tratamiento, Antecedente, PruebaLaboratorio, Cirugia, BlockchainHash, AccesoBlockchain, DisponibilidadProfesional, SnapshotPaciente
 from .views import admin_index
 
 
@@ -10,7 +10,7 @@ class PacienteAdmin(admin.ModelAdmin):
     list_display = ['cedula', 'user', 'genero', 'fecha_nacimiento', 'tipo_sangre']
     list_filter = ['genero', 'tipo_sangre', 'fecha_nacimiento']
     search_fields = ['cedula', 'user__first_name', 'user__last_name', 'user__email']
-    readonly_fields = ['user']
+    readonly_fields = ['user', 'chain_head', 'chain_length']
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user')
@@ -24,6 +24,14 @@ class ProfesionalAdmin(admin.ModelAdmin):
     readonly_fields = ['user']
 
 
+@admin.register(DisponibilidadProfesional)
+class DisponibilidadProfesionalAdmin(admin.ModelAdmin):
+    list_display = ['profesional', 'dia_semana', 'hora_inicio', 'hora_fin', 'duracion_turno', 'activo']
+    list_filter = ['dia_semana', 'activo']
+    search_fields = ['profesional__user__first_name', 'profesional__user__last_name', 'profesional__matricula']
+    list_select_related = ['profesional__user']
+
+
 @admin.register(Alergia)
 class AlergiaAdmin(admin.ModelAdmin):
     list_display = ['paciente', 'sustancia', 'severidad', 'fecha_diagnostico']
@@ -71,17 +79,25 @@ class BlockchainHashAdmin(admin.ModelAdmin):
     list_display = ['paciente', 'categoria', 'hash_value', 'timestamp', 'transaction_hash']
     list_filter = ['categoria', 'timestamp']
     search_fields = ['paciente__cedula', 'paciente__user__first_name', 'paciente__user__last_name', 'hash_value']
-    readonly_fields = ['hash_value', 'transaction_hash', 'block_number', 'timestamp']
+    readonly_fields = ['hash_value', 'prev_hash', 'transaction_hash', 'block_number', 'timestamp']
 
 
 @admin.register(AccesoBlockchain)
 class AccesoBlockchainAdmin(admin.ModelAdmin):
-    list_display = ['hash_record', 'profesional', 'fecha_acceso', 'motivo_acceso']
+    list_display = ['hash_record', 'profesional', 'usuario', 'fecha_acceso', 'motivo_acceso']
     list_filter = ['fecha_acceso', 'profesional__especialidad']
     search_fields = ['hash_record__paciente__cedula', 'profesional__user__first_name', 'profesional__user__last_name']
     readonly_fields = ['fecha_acceso']
 
 
+@admin.register(SnapshotPaciente)
+class SnapshotPacienteAdmin(admin.ModelAdmin):
+    list_display = ['paciente', 'fecha', 'registros', 'tamano', 'hash_value']
+    list_filter = ['fecha']
+    search_fields = ['paciente__cedula', 'hash_value']
+    readonly_fields = ['paciente', 'fecha', 'hash_value', 'registros', 'tamano']
+
+
 # Configurar el sitio admin personalizado
 admin.site.site_header = "ARQA Medical System - Admin"
 admin.site.site_title = "ARQA Admin"
@@ -110,3 +126,4 @@ custom_admin_site.register(PruebaLaboratorio, PruebaLaboratorioAdmin)
 custom_admin_site.register(Cirugia, CirugiaAdmin)
 custom_admin_site.register(BlockchainHash, BlockchainHashAdmin)
 custom_admin_site.register(AccesoBlockchain, AccesoBlockchainAdmin)
+custom_admin_site.register(SnapshotPaciente, SnapshotPacienteAdmin)
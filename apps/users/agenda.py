@@ -0,0 +1,417 @@
+"""
+Motor de turnos: slots disponibles, detección de conflictos y reservas.
+
+Todas las consultas sobre `Turno` son rangos semiabiertos [inicio, fin) sobre
+`fecha_hora`, que usan el índice (profesional, fecha_hora) sin envolver la
+columna en un cast a fecha. Un turno que empieza antes del rango todavía
+puede pisarlo, por eso la búsqueda de conflictos arranca
+DURACION_MAXIMA_MINUTOS antes del inicio pedido.
+
+Las reservas bloquean la fila del profesional (`select_for_update`), de modo
+que dos reservas simultáneas del mismo horario se serializan y la segunda ve
+el turno de la primera.
+"""
+import bisect
+import json
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import DURACION_MAXIMA_TURNO_MINUTOS, DisponibilidadProfesional, Paciente, Profesional, Turno
+
+# Cota de la duración de un turno; acota el rango de búsqueda de solapamientos
+DURACION_MAXIMA_MINUTOS = DURACION_MAXIMA_TURNO_MINUTOS
+
+# Estados que se muestran en la agenda del panel del profesional
+ESTADOS_AGENDA = ['programado', 'confirmado']
+
+
+class TurnoNoDisponible(Exception):
+    """El horario pedido está fuera de la disponibilidad o se solapa con otro turno"""
+
+
+def _intervalos(profesional_id, inicio, fin, excluir=None):
+    """Turnos activos del profesional que pueden solaparse con [inicio, fin), ordenados"""
+    turnos = Turno.objects.filter(
+        profesional_id=profesional_id,
+        fecha_hora__gte=inicio - timedelta(minutes=DURACION_MAXIMA_MINUTOS),
+        fecha_hora__lt=fin,
+        estado__in=Turno.ESTADOS_ACTIVOS,
+    )
+    if excluir is not None:
+        turnos = turnos.exclude(pk=excluir)
+    return [
+        (fecha_hora, fecha_hora + timedelta(minutes=duracion))
+        for fecha_hora, duracion in turnos.order_by('fecha_hora').values_list('fecha_hora', 'duracion_minutos')
+    ]
+
+
+def _se_solapa(intervalos, inicio, fin):
+    """
+    Búsqueda binaria sobre intervalos ordenados por inicio: solo pueden pisar
+    [inicio, fin) los que empiezan antes de `fin` y a menos de
+    DURACION_MAXIMA_MINUTOS de `inicio`.
+    """
+    limite = inicio - timedelta(minutes=DURACION_MAXIMA_MINUTOS)
+    i = bisect.bisect_left(intervalos, (fin,)) - 1
+    while i >= 0 and intervalos[i][0] >= limite:
+        if intervalos[i][1] > inicio:
+            return True
+        i -= 1
+    return False
+
+
+def hay_conflicto(profesional_id, inicio, duracion_minutos, excluir=None):
+    fin = inicio + timedelta(minutes=duracion_minutos)
+    return _se_solapa(_intervalos(profesional_id, inicio, fin, excluir), inicio, fin)
+
+
+def _franjas(disponibilidades, desde, hasta):
+    """Genera (inicio, fin, duracion) de cada franja de disponibilidad entre dos fechas"""
+    tz = timezone.get_current_timezone()
+    por_dia = {}
+    for disponibilidad in disponibilidades:
+        por_dia.setdefault(disponibilidad.dia_semana, []).append(disponibilidad)
+    dia = desde
+    while dia < hasta:
+        for disponibilidad in por_dia.get(dia.weekday(), ()):
+            yield (
+                timezone.make_aware(datetime.combine(dia, disponibilidad.hora_inicio), tz),
+                timezone.make_aware(datetime.combine(dia, disponibilidad.hora_fin), tz),
+                disponibilidad.duracion_turno,
+            )
+        dia += timedelta(days=1)
+
+
+def _disponibilidades(profesional_id):
+    return list(DisponibilidadProfesional.objects.filter(profesional_id=profesional_id, activo=True))
+
+
+def generar_slots(profesional, desde, dias=7, ahora=None):
+    """
+    Slots libres del profesional desde la fecha `desde` durante `dias` días.
+    Son dos consultas (disponibilidad y turnos del rango) sea cual sea el rango.
+    Devuelve una lista de (inicio, duracion_minutos).
+    """
+    profesional_id = getattr(profesional, 'pk', profesional)
+    ahora = ahora or timezone.now()
+    hasta = desde + timedelta(days=dias)
+    franjas = list(_franjas(_disponibilidades(profesional_id), desde, hasta))
+    if not franjas:
+        return []
+    ocupados = _intervalos(profesional_id, min(f[0] for f in franjas), max(f[1] for f in franjas))
+
+    slots = []
+    for inicio_franja, fin_franja, duracion in sorted(franjas):
+        paso = timedelta(minutes=duracion)
+        inicio = inicio_franja
+        while inicio + paso <= fin_franja:
+            if inicio >= ahora and not _se_solapa(ocupados, inicio, inicio + paso):
+                slots.append((inicio, duracion))
+            inicio += paso
+    return slots
+
+
+def _en_disponibilidad(disponibilidades, inicio, duracion_minutos):
+    fin = inicio + timedelta(minutes=duracion_minutos)
+    dia = timezone.localtime(inicio).date()
+    return any(
+        franja_inicio <= inicio and fin <= franja_fin
+        for franja_inicio, franja_fin, _ in _franjas(disponibilidades, dia, dia + timedelta(days=1))
+    )
+
+
+def _bloquear_profesional(profesional_id):
+    Profesional.objects.select_for_update().filter(pk=profesional_id).values_list('pk', flat=True).get()
+
+
+def reservar_turno(profesional, paciente, fecha_hora, motivo, duracion_minutos=None):
+    """Reserva un turno verificando disponibilidad y solapamientos bajo bloqueo"""
+    profesional_id = getattr(profesional, 'pk', profesional)
+    if fecha_hora < timezone.now():
+        raise TurnoNoDisponible("El horario ya pasó")
+    with transaction.atomic():
+        _bloquear_profesional(profesional_id)
+        disponibilidades = _disponibilidades(profesional_id)
+        if duracion_minutos is None:
+            duracion_minutos = _duracion_por_defecto(disponibilidades, fecha_hora)
+        _validar_duracion(duracion_minutos)
+        if not _en_disponibilidad(disponibilidades, fecha_hora, duracion_minutos):
+            raise TurnoNoDisponible("El horario está fuera de la disponibilidad del profesional")
+        if hay_conflicto(profesional_id, fecha_hora, duracion_minutos):
+            raise TurnoNoDisponible("El horario ya está reservado")
+        return Turno.objects.create(
+            profesional_id=profesional_id, paciente=paciente, fecha_hora=fecha_hora,
+            duracion_minutos=duracion_minutos, motivo=motivo,
+        )
+
+
+def reservar_turnos(profesional, solicitudes):
+    """
+    Reserva masiva para un profesional. `solicitudes` es una lista de dicts con
+    paciente_id, fecha_hora, motivo y opcionalmente duracion_minutos.
+
+    Se bloquea al profesional una vez, se leen los turnos del rango completo en
+    una consulta y cada solicitud se valida contra esos turnos y las ya
+    aceptadas. Los pacientes se validan juntos en una consulta: un id
+    inexistente se rechaza por su índice en lugar de fallar el bulk_create.
+    Devuelve (turnos_creados, [(indice, motivo_del_rechazo)]).
+    """
+    profesional_id = getattr(profesional, 'pk', profesional)
+    if not solicitudes:
+        return [], []
+    ahora = timezone.now()
+    with transaction.atomic():
+        _bloquear_profesional(profesional_id)
+        disponibilidades = _disponibilidades(profesional_id)
+        inicio = min(s['fecha_hora'] for s in solicitudes)
+        fin = max(s['fecha_hora'] for s in solicitudes) + timedelta(minutes=DURACION_MAXIMA_MINUTOS)
+        ocupados = _intervalos(profesional_id, inicio, fin)
+        pacientes = set(Paciente.objects.filter(
+            pk__in={s['paciente_id'] for s in solicitudes},
+        ).values_list('pk', flat=True))
+
+        nuevos, rechazados = [], []
+        for indice, solicitud in enumerate(solicitudes):
+            fecha_hora = solicitud['fecha_hora']
+            if solicitud['paciente_id'] not in pacientes:
+                rechazados.append((indice, 'Paciente inexistente'))
+                continue
+            if fecha_hora < ahora:
+                rechazados.append((indice, 'Horario pasado'))
+                continue
+            duracion = solicitud.get('duracion_minutos')
+            if duracion is None:
+                duracion = _duracion_por_defecto(disponibilidades, fecha_hora)
+            if not _duracion_valida(duracion):
+                rechazados.append((indice, 'Duración fuera de rango'))
+                continue
+            fin_turno = fecha_hora + timedelta(minutes=duracion)
+            if not _en_disponibilidad(disponibilidades, fecha_hora, duracion):
+                rechazados.append((indice, 'Fuera de la disponibilidad del profesional'))
+            elif _se_solapa(ocupados, fecha_hora, fin_turno):
+                rechazados.append((indice, 'Horario ya reservado'))
+            else:
+                bisect.insort(ocupados, (fecha_hora, fin_turno))
+                nuevos.append(Turno(
+                    profesional_id=profesional_id, paciente_id=solicitud['paciente_id'],
+                    fecha_hora=fecha_hora, duracion_minutos=duracion, motivo=solicitud.get('motivo', ''),
+                ))
+        creados = Turno.objects.bulk_create(nuevos)
+        if creados:
+            # bulk_create no emite señales
+            transaction.on_commit(lambda: invalidar_agenda(profesional_id))
+        return creados, rechazados
+
+
+def _duracion_por_defecto(disponibilidades, fecha_hora):
+    dia = timezone.localtime(fecha_hora).weekday()
+    for disponibilidad in disponibilidades:
+        if disponibilidad.dia_semana == dia:
+            return disponibilidad.duracion_turno
+    return Turno._meta.get_field('duracion_minutos').default
+
+
+def _duracion_valida(duracion_minutos):
+    """Minutos enteros entre 1 y DURACION_MAXIMA_MINUTOS (bool no cuenta como entero)"""
+    return (isinstance(duracion_minutos, int) and not isinstance(duracion_minutos, bool)
+            and 0 < duracion_minutos <= DURACION_MAXIMA_MINUTOS)
+
+
+def _validar_duracion(duracion_minutos):
+    if not _duracion_valida(duracion_minutos):
+        raise TurnoNoDisponible(f"La duración debe estar entre 1 y {DURACION_MAXIMA_MINUTOS} minutos")
+
+
+# ========== AGENDA DEL PANEL DEL PROFESIONAL ==========
+
+def rango_dia(dia):
+    """Rango semiabierto [00:00, 00:00 del día siguiente) en la zona horaria actual"""
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+def agenda_version_key(profesional_id):
+    return f'agenda_version:{profesional_id}'
+
+
+def invalidar_agenda(profesional_id):
+    key = agenda_version_key(profesional_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+_CAMPOS_TURNO = {
+    'paciente_nombre': F('paciente__user__first_name'),
+    'paciente_apellido': F('paciente__user__last_name'),
+    'paciente_telefono': F('paciente__telefono'),
+}
+
+
+def _turnos(profesional_id, inicio, fin):
+    return Turno.objects.filter(
+        profesional_id=profesional_id, estado__in=ESTADOS_AGENDA,
+        fecha_hora__gte=inicio, fecha_hora__lt=fin,
+    ).order_by('fecha_hora').values('id', 'fecha_hora', 'motivo', 'estado', 'paciente_id', **_CAMPOS_TURNO)
+
+
+def construir_agenda(profesional_id, dia=None, dias_proximos=7, limite_proximos=10, limite_recientes=5):
+    """
+    Agenda del panel: turnos del día, próximos turnos y pacientes atendidos en
+    los últimos 30 días. Valores planos (diccionarios) listos para cachear.
+    """
+    dia = dia or timezone.localdate()
+    inicio_hoy, fin_hoy = rango_dia(dia)
+    recientes = (
+        Paciente.objects.filter(
+            turnos__profesional_id=profesional_id,
+            turnos__fecha_hora__gte=inicio_hoy - timedelta(days=30),
+            turnos__fecha_hora__lt=fin_hoy,
+            turnos__estado__in=[estado for estado, _ in Turno.ESTADOS_TURNO if estado != 'cancelado'],
+        )
+        .annotate(ultimo_turno=Max('turnos__fecha_hora'))
+        .order_by('-ultimo_turno')
+        .values('id', 'ultimo_turno', nombre=F('user__first_name'), apellido=F('user__last_name'))
+    )
+    return {
+        'turnos_hoy': list(_turnos(profesional_id, inicio_hoy, fin_hoy)),
+        'turnos_proximos': list(_turnos(profesional_id, fin_hoy, fin_hoy + timedelta(days=dias_proximos))[:limite_proximos]),
+        'pacientes_recientes': list(recientes[:limite_recientes]),
+    }
+
+
+def agenda_profesional(profesional_id):
+    """Agenda del panel cacheada por AGENDA_CACHE_TTL segundos o hasta que cambie un turno"""
+    version = cache.get(agenda_version_key(profesional_id), 0)
+    dia = timezone.localdate()
+    key = f'agenda:{profesional_id}:{dia.isoformat()}:{version}'
+    datos = cache.get(key)
+    if datos is None:
+        datos = construir_agenda(profesional_id, dia)
+        cache.set(key, datos, getattr(settings, 'AGENDA_CACHE_TTL', 60))
+    return datos
+
+
+# ========== FEED DE AGENDA (iCalendar / JSON) ==========
+
+FEED_DIAS_ATRAS = 7
+FEED_DIAS_ADELANTE = 90
+FEED_SALT = 'users.agenda.feed'
+
+
+def token_feed(profesional_id):
+    """Token firmado (con fecha) para suscribir un calendario externo sin sesión"""
+    return signing.dumps(profesional_id, salt=FEED_SALT, compress=True)
+
+
+def profesional_de_token(token):
+    """Profesional del token, o None si la firma no es válida o venció (AGENDA_FEED_TOKEN_MAX_AGE)"""
+    try:
+        return signing.loads(token, salt=FEED_SALT, max_age=settings.AGENDA_FEED_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def ventana_feed():
+    """[inicio, fin) del período exportado; se corre con el día, así que entra en el ETag"""
+    hoy = timezone.localdate()
+    inicio, _ = rango_dia(hoy - timedelta(days=FEED_DIAS_ATRAS))
+    fin, _ = rango_dia(hoy + timedelta(days=FEED_DIAS_ADELANTE))
+    return inicio, fin
+
+
+def _turnos_feed(profesional_id):
+    inicio, fin = ventana_feed()
+    return Turno.objects.filter(profesional_id=profesional_id, fecha_hora__gte=inicio, fecha_hora__lt=fin)
+
+
+def estado_feed(profesional_id):
+    """
+    (cantidad, última modificación) de los turnos del feed en una consulta.
+    La cantidad cubre las bajas, que no dejan rastro en fecha_modificacion.
+    """
+    datos = _turnos_feed(profesional_id).aggregate(total=Count('id'), ultima=Max('fecha_modificacion'))
+    return datos['total'], datos['ultima']
+
+
+def _filas_feed(profesional_id):
+    return _turnos_feed(profesional_id).order_by('fecha_hora').values_list(
+        'id', 'fecha_hora', 'duracion_minutos', 'estado', 'motivo', 'fecha_modificacion',
+        'paciente__user__first_name', 'paciente__user__last_name',
+    ).iterator(chunk_size=500)
+
+
+def _ical_texto(valor):
+    return (valor or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ical_linea(linea):
+    """Pliega las líneas a 75 octetos como exige RFC 5545"""
+    datos = linea.encode('utf-8')
+    if len(datos) <= 75:
+        return linea + '\r\n'
+    partes, actual = [], ''
+    for caracter in linea:
+        limite = 75 if not partes else 74
+        if len((actual + caracter).encode('utf-8')) > limite:
+            partes.append(actual)
+            actual = caracter
+        else:
+            actual += caracter
+    partes.append(actual)
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def _ical_fecha(valor):
+    return valor.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+_ICAL_ESTADOS = {'cancelado': 'CANCELLED', 'programado': 'TENTATIVE'}
+
+
+def ical_feed(profesional_id, host='medichain'):
+    """Genera el calendario iCalendar del profesional fila por fila"""
+    yield _ical_linea('BEGIN:VCALENDAR')
+    yield _ical_linea('VERSION:2.0')
+    yield _ical_linea('PRODID:-//MediChain//Agenda//ES')
+    yield _ical_linea('CALSCALE:GREGORIAN')
+    for turno_id, fecha_hora, duracion, estado, motivo, modificado, nombre, apellido in _filas_feed(profesional_id):
+        lineas = [
+            'BEGIN:VEVENT',
+            f'UID:turno-{turno_id}@{host}',
+            f'DTSTAMP:{_ical_fecha(modificado)}',
+            f'LAST-MODIFIED:{_ical_fecha(modificado)}',
+            f'DTSTART:{_ical_fecha(fecha_hora)}',
+            f'DTEND:{_ical_fecha(fecha_hora + timedelta(minutes=duracion))}',
+            f'SUMMARY:{_ical_texto(f"{nombre} {apellido}".strip())}',
+            f'DESCRIPTION:{_ical_texto(motivo)}',
+            f'STATUS:{_ICAL_ESTADOS.get(estado, "CONFIRMED")}',
+            'END:VEVENT',
+        ]
+        yield ''.join(_ical_linea(linea) for linea in lineas)
+    yield _ical_linea('END:VCALENDAR')
+
+
+def json_feed(profesional_id):
+    """Genera el feed como un array JSON, un turno por fragmento"""
+    yield '['
+    separador = ''
+    for turno_id, fecha_hora, duracion, estado, motivo, modificado, nombre, apellido in _filas_feed(profesional_id):
+        yield separador + json.dumps({
+            'id': turno_id,
+            'inicio': fecha_hora.isoformat(),
+            'duracion': duracion,
+            'estado': estado,
+            'motivo': motivo,
+            'paciente': f'{nombre} {apellido}'.strip(),
+            'modificado': modificado.isoformat(),
+        }, ensure_ascii=False)
+        separador = ','
+    yield ']'
@@ -1,7 +1,9 @@
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from django.utils import timezone
 import json
 import hashlib
-from .models import BlockchainHash, AccesoBlockchain, Paciente
+from .models import BlockchainHash, AccesoBlockchain, Paciente, Profesional
 from .blockchain_services import MedicalBlockchainService
 
 
@@ -18,6 +20,11 @@ class BlockchainManager:
 
         return hashlib.sha256(data_str.encode('utf-8')).hexdigest()
 
+    @staticmethod
+    def chain_digest(prev_head, hash_value):
+        """Calcula la nueva cabeza de la cadena a partir de la anterior y el hash del registro"""
+        return hashlib.sha256(f"{prev_head}{hash_value}".encode('utf-8')).hexdigest()
+
     @staticmethod
     def store_medical_record(paciente, categoria, record_id, record_data, profesional=None):
         """
@@ -37,16 +44,31 @@ class BlockchainManager:
         service = MedicalBlockchainService()
         blockchain_result = service.store_medical_record(paciente.id, record_data)
 
-        # Crear registro local del hash
-        hash_record = BlockchainHash.objects.create(
-            paciente=paciente,
-            categoria=categoria,
-            record_id=record_id,
-            hash_value=hash_value,
-            transaction_hash=blockchain_result['polygon']['transaction_hash'],
-            block_number=blockchain_result['polygon']['block_number'],
-            datos_originales=record_data
-        )
+        # Crear registro local del hash encadenado a la cabeza actual del paciente.
+        # La fila del paciente se bloquea para que dos registros simultáneos no
+        # compartan el mismo prev_hash.
+        with transaction.atomic():
+            chain = Paciente.objects.select_for_update().values('chain_head', 'chain_length').get(pk=paciente.pk)
+            hash_record = BlockchainHash.objects.create(
+                paciente=paciente,
+                categoria=categoria,
+                record_id=record_id,
+                hash_value=hash_value,
+                prev_hash=chain['chain_head'],
+                transaction_hash=blockchain_result['polygon']['transaction_hash'],
+                block_number=blockchain_result['polygon']['block_number'],
+                datos_originales=record_data
+            )
+            new_head = BlockchainManager.chain_digest(chain['chain_head'], hash_value)
+            cambios = {'chain_head': new_head, 'chain_length': F('chain_length') + 1}
+            if categoria == 'genesis':
+                cambios['genesis_hash'] = hash_value
+            Paciente.objects.filter(pk=paciente.pk).update(**cambios)
+
+        paciente.chain_head = new_head
+        paciente.chain_length = chain['chain_length'] + 1
+        if categoria == 'genesis':
+            paciente.genesis_hash = hash_value
 
         return hash_record, blockchain_result
 
@@ -74,10 +96,23 @@ class BlockchainManager:
 
         return hash_record
 
+    @staticmethod
+    def backfill_genesis_hash(paciente_ids=None):
+        """Copia el hash génesis en los pacientes que no lo tienen; devuelve cuántos se actualizaron"""
+        genesis = BlockchainHash.objects.filter(
+            paciente=OuterRef('pk'), categoria='genesis'
+        ).order_by('id').values('hash_value')[:1]
+        pacientes = Paciente.objects.filter(genesis_hash='')
+        if paciente_ids is not None:
+            pacientes = pacientes.filter(pk__in=paciente_ids)
+        return pacientes.filter(Exists(genesis)).update(genesis_hash=Subquery(genesis))
+
     @staticmethod
     def get_patient_hashes_by_category(paciente):
         """Obtiene todos los hashes de un paciente organizados por categoría"""
-        hashes = BlockchainHash.objects.filter(paciente=paciente)
+        hashes = BlockchainHash.objects.filter(paciente=paciente).only(
+            'id', 'categoria', 'hash_value', 'transaction_hash', 'timestamp', 'record_id'
+        )
 
         categorias = {}
         for hash_record in hashes:
@@ -95,17 +130,23 @@ class BlockchainManager:
         return categorias
 
     @staticmethod
-    def get_hash_details(hash_id, profesional, motivo_acceso="Consulta médica"):
+    def registrar_acceso(hash_id, profesional, motivo_acceso="Consulta médica"):
+        """Registra en la auditoría el acceso de un profesional a un hash"""
+        return AccesoBlockchain.objects.create(
+            hash_record_id=hash_id,
+            profesional=profesional,
+            motivo_acceso=motivo_acceso
+        )
+
+    @staticmethod
+    def get_hash_details(hash_id, profesional, motivo_acceso="Consulta médica", registrar_acceso=True):
         """Obtiene los detalles de un hash específico y registra el acceso"""
         try:
-            hash_record = BlockchainHash.objects.get(id=hash_id)
+            hash_record = BlockchainHash.objects.select_related('paciente__user').get(id=hash_id)
 
             # Registrar el acceso
-            AccesoBlockchain.objects.create(
-                hash_record=hash_record,
-                profesional=profesional,
-                motivo_acceso=motivo_acceso
-            )
+            if registrar_acceso:
+                BlockchainManager.registrar_acceso(hash_id, profesional, motivo_acceso)
 
             return {
                 'hash_record': hash_record,
@@ -119,26 +160,57 @@ class BlockchainManager:
             return None
 
     @staticmethod
-    def get_access_history(hash_record):
-        """Obtiene el historial de accesos a un hash específico"""
-        accesos = AccesoBlockchain.objects.filter(hash_record=hash_record).select_related('profesional', 'paciente')
+    def get_access_history(hash_record, limite=None, antes=None):
+        """
+        Obtiene el historial de accesos a un hash, más recientes primero, en una sola consulta.
+
+        Los nombres salen del join con `auth_user` (sin instanciar modelos). `antes` es
+        el cursor (fecha_acceso, id) del último acceso de la página anterior, de modo que
+        cada página cuesta lo mismo sin importar cuántos accesos haya.
+        """
+        accesos = AccesoBlockchain.objects.filter(hash_record=hash_record).order_by('-fecha_acceso', '-id')
+        if antes is not None:
+            fecha, acceso_id = antes
+            accesos = accesos.filter(Q(fecha_acceso__lt=fecha) | Q(fecha_acceso=fecha, id__lt=acceso_id))
+        accesos = accesos.values(
+            'id', 'fecha_acceso', 'motivo_acceso', 'profesional_id', 'profesional__especialidad',
+            'profesional__user__first_name', 'profesional__user__last_name',
+            'paciente_id', 'paciente__user_id', 'paciente__user__first_name', 'paciente__user__last_name',
+            'usuario_id', 'usuario__username', 'usuario__first_name', 'usuario__last_name',
+        )
+        if limite is not None:
+            accesos = accesos[:limite]
+
+        especialidades = dict(Profesional.ESPECIALIDADES)
         history = []
         for acceso in accesos:
-            if acceso.profesional:
+            if acceso['profesional_id']:
                 history.append({
-                    'usuario': acceso.profesional.get_full_name(),
+                    'id': acceso['id'],
+                    'usuario': f"{acceso['profesional__user__first_name']} {acceso['profesional__user__last_name']}",
                     'tipo_usuario': 'Profesional',
-                    'especialidad': acceso.profesional.get_especialidad_display(),
-                    'fecha_acceso': acceso.fecha_acceso,
-                    'motivo': acceso.motivo_acceso
+                    'especialidad': especialidades.get(acceso['profesional__especialidad'], acceso['profesional__especialidad']),
+                    'fecha_acceso': acceso['fecha_acceso'],
+                    'motivo': acceso['motivo_acceso']
+                })
+            elif acceso['usuario_id'] and acceso['usuario_id'] != acceso['paciente__user_id']:
+                nombre = f"{acceso['usuario__first_name']} {acceso['usuario__last_name']}".strip()
+                history.append({
+                    'id': acceso['id'],
+                    'usuario': nombre or acceso['usuario__username'],
+                    'tipo_usuario': 'Administrador',
+                    'especialidad': 'Administración',
+                    'fecha_acceso': acceso['fecha_acceso'],
+                    'motivo': acceso['motivo_acceso']
                 })
-            elif acceso.paciente:
+            elif acceso['paciente_id']:
                 history.append({
-                    'usuario': acceso.paciente.get_full_name(),
+                    'id': acceso['id'],
+                    'usuario': f"{acceso['paciente__user__first_name']} {acceso['paciente__user__last_name']}",
                     'tipo_usuario': 'Paciente',
                     'especialidad': 'Propietario del registro',
-                    'fecha_acceso': acceso.fecha_acceso,
-                    'motivo': acceso.motivo_acceso
+                    'fecha_acceso': acceso['fecha_acceso'],
+                    'motivo': acceso['motivo_acceso']
                 })
         return history
 
@@ -149,7 +221,65 @@ class BlockchainManager:
         return current_hash == hash_record.hash_value
 
     @staticmethod
-    def registrar_acceso_medico(profesional=None, paciente=None, tipo_registro=None, registro_id=None, motivo="Consulta médica"):
+    def verify_patient_chain_head(paciente):
+        """
+        Verificación O(1) de la cabeza de la cadena: comprueba que el último
+        eslabón almacenado produce la cabeza guardada en el paciente y que la
+        cantidad de eslabones coincide con la longitud guardada. No recorre los
+        enlaces: la verificación eslabón por eslabón es verify_patient_chain.
+        """
+        hashes = BlockchainHash.objects.filter(paciente=paciente)
+        last = hashes.order_by('-id').values('hash_value', 'prev_hash').first()
+        if last is None:
+            return paciente.chain_head == '' and paciente.chain_length == 0
+        if BlockchainManager.chain_digest(last['prev_hash'], last['hash_value']) != paciente.chain_head:
+            return False
+        return hashes.count() == paciente.chain_length
+
+    @staticmethod
+    def verify_patient_chain(paciente, check_integrity=True):
+        """
+        Verifica el historial completo de un paciente en una sola pasada.
+
+        Recorre los hashes en orden de inserción sin cargarlos todos en memoria,
+        comprobando que cada eslabón apunta a la cabeza anterior y, opcionalmente,
+        que los datos originales siguen produciendo el mismo hash. Al final la
+        cabeza recalculada se compara con la almacenada en el paciente, lo que
+        detecta registros eliminados, reordenados o agregados fuera de la cadena.
+
+        Returns:
+            dict con 'valid', 'length', 'head' y, si falla, 'error' y 'broken_at'
+        """
+        fields = ['id', 'hash_value', 'prev_hash']
+        if check_integrity:
+            fields.append('datos_originales')
+        rows = (BlockchainHash.objects.filter(paciente=paciente)
+                .order_by('id')
+                .values_list(*fields)
+                .iterator(chunk_size=500))
+
+        head = ''
+        length = 0
+        for row in rows:
+            hash_id, hash_value, prev_hash = row[0], row[1], row[2]
+            if prev_hash != head:
+                return {'valid': False, 'length': length, 'head': head,
+                        'error': 'Eslabón fuera de orden o registro eliminado', 'broken_at': hash_id}
+            if check_integrity and BlockchainManager.generate_hash(row[3]) != hash_value:
+                return {'valid': False, 'length': length, 'head': head,
+                        'error': 'Los datos originales no coinciden con el hash', 'broken_at': hash_id}
+            head = BlockchainManager.chain_digest(head, hash_value)
+            length += 1
+
+        if head != paciente.chain_head or length != paciente.chain_length:
+            return {'valid': False, 'length': length, 'head': head,
+                    'error': 'La cadena no coincide con la cabeza almacenada', 'broken_at': None}
+
+        return {'valid': True, 'length': length, 'head': head, 'error': None, 'broken_at': None}
+
+    @staticmethod
+    def registrar_acceso_medico(profesional=None, paciente=None, tipo_registro=None, registro_id=None, motivo="Consulta médica",
+                                usuario=None):
         """
         Registra el acceso de un profesional o paciente a un registro médico específico
 
@@ -159,6 +289,7 @@ class BlockchainManager:
             tipo_registro: Tipo de registro ('alergia', 'condicion', etc.) (opcional)
             registro_id: ID del registro específico (opcional)
             motivo: Motivo del acceso
+            usuario: Usuario que accede (opcional; identifica a un administrador sin profesional)
         """
         try:
             # Si se proporciona tipo_registro y registro_id, buscar el hash específico
@@ -179,6 +310,7 @@ class BlockchainManager:
                 hash_record=hash_record,
                 profesional=profesional,
                 paciente=paciente,
+                usuario=usuario,
                 motivo_acceso=motivo
             )
 
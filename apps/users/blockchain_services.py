@@ -1,4 +1,3 @@
-from web3 import Web3
 import os
 from django.conf import settings
 
@@ -8,6 +7,8 @@ class PolygonService:
     def __init__(self):
         # Polygon RPC URL - you can use Infura, Alchemy, or other providers
         self.rpc_url = os.getenv('POLYGON_RPC_URL', 'https://polygon-rpc.com/')
+        # web3 tarda casi un segundo en importarse: se carga al usar el servicio, no al arrancar Django
+        from web3 import Web3
         self.web3 = Web3(Web3.HTTPProvider(self.rpc_url))
         
         # Add POA middleware for Polygon (Proof of Authority chain)
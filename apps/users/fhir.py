@@ -0,0 +1,270 @@
+"""
+Exportación masiva de la historia clínica en NDJSON FHIR (estilo `$export`).
+
+Cada tipo de recurso se lee con `values_list(...).iterator()`, que en
+PostgreSQL usa un cursor del lado del servidor: las filas llegan en bloques de
+FHIR_EXPORT_CHUNK_SIZE y se convierten en líneas JSON a medida que se
+consumen, así que la memoria no depende de la cantidad de pacientes. Los
+filtros `desde`/`hasta` recortan un rango semiabierto [desde, hasta) de ids de
+paciente, lo que permite repartir la exportación entre varios procesos
+(`rangos_pacientes`, comando `export_fhir --partes`).
+"""
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+from .models import Alergia, Cirugia, CondicionMedica, Paciente, PruebaLaboratorio, Tratamiento
+
+CONTENT_TYPE = 'application/fhir+ndjson'
+
+# Tamaño de los bloques que se entregan al servidor o al archivo
+TAMANO_BLOQUE = 64 * 1024
+
+_CRITICIDAD = {'grave': 'high', 'muy_grave': 'high'}
+_SEVERIDAD = {'leve': 'mild', 'moderada': 'moderate', 'grave': 'severe', 'muy_grave': 'severe'}
+_ESTADO_CONDICION = {'activa': 'active', 'controlada': 'active', 'remision': 'remission', 'curada': 'resolved'}
+_ESTADO_CIRUGIA = {
+    'programada': 'preparation', 'realizada': 'completed', 'cancelada': 'not-done', 'postergada': 'on-hold',
+}
+
+
+def _chunk_size():
+    return getattr(settings, 'FHIR_EXPORT_CHUNK_SIZE', 2000)
+
+
+def _filas(queryset, campo_paciente, desde, hasta, *campos):
+    if desde is not None:
+        queryset = queryset.filter(**{f'{campo_paciente}__gte': desde})
+    if hasta is not None:
+        queryset = queryset.filter(**{f'{campo_paciente}__lt': hasta})
+    return queryset.order_by('pk').values_list(*campos).iterator(chunk_size=_chunk_size())
+
+
+def _fecha(valor):
+    return valor.isoformat() if valor else None
+
+
+def _texto(valor):
+    return {'text': valor}
+
+
+def _referencia(tipo, pk):
+    return {'reference': f'{tipo}/{pk}'} if pk else None
+
+
+def _sin_vacios(recurso):
+    return {clave: valor for clave, valor in recurso.items() if valor not in (None, '', [], {})}
+
+
+def _pacientes(desde, hasta):
+    filas = _filas(
+        Paciente.objects.all(), 'pk', desde, hasta,
+        'pk', 'cedula', 'user__first_name', 'user__last_name', 'genero', 'fecha_nacimiento',
+        'telefono', 'direccion', 'ciudad', 'codigo_postal', 'tipo_sangre',
+    )
+    for (pk, cedula, nombre, apellido, genero, nacimiento,
+         telefono, direccion, ciudad, codigo_postal, sangre) in filas:
+        yield _sin_vacios({
+            'resourceType': 'Patient',
+            'id': str(pk),
+            'identifier': [{'system': 'urn:medichain:cedula', 'value': cedula}],
+            'name': [_sin_vacios({'family': apellido, 'given': [nombre] if nombre else []})],
+            'gender': genero,
+            'birthDate': _fecha(nacimiento),
+            'telecom': [{'system': 'phone', 'value': telefono}] if telefono else [],
+            'address': [_sin_vacios({'text': direccion, 'city': ciudad, 'postalCode': codigo_postal})],
+            'extension': [{'url': 'urn:medichain:tipo-sangre', 'valueString': sangre}] if sangre else [],
+        })
+
+
+def _alergias(desde, hasta):
+    filas = _filas(
+        Alergia.objects.all(), 'paciente_id', desde, hasta,
+        'pk', 'paciente_id', 'sustancia', 'descripcion', 'severidad', 'fecha_diagnostico',
+    )
+    for pk, paciente_id, sustancia, descripcion, severidad, fecha in filas:
+        yield _sin_vacios({
+            'resourceType': 'AllergyIntolerance',
+            'id': str(pk),
+            'patient': _referencia('Patient', paciente_id),
+            'code': _texto(sustancia),
+            'criticality': _CRITICIDAD.get(severidad, 'low'),
+            'reaction': [{'severity': _SEVERIDAD.get(severidad, 'mild'), 'description': descripcion}]
+            if descripcion else [],
+            'recordedDate': _fecha(fecha),
+        })
+
+
+def _condiciones(desde, hasta):
+    filas = _filas(
+        CondicionMedica.objects.all(), 'paciente_id', desde, hasta,
+        'pk', 'paciente_id', 'codigo', 'descripcion', 'estado', 'fecha_diagnostico',
+    )
+    for pk, paciente_id, codigo, descripcion, estado, fecha in filas:
+        yield _sin_vacios({
+            'resourceType': 'Condition',
+            'id': str(pk),
+            'subject': _referencia('Patient', paciente_id),
+            'clinicalStatus': {'coding': [{
+                'system': 'http://terminology.hl7.org/CodeSystem/condition-clinical',
+                'code': _ESTADO_CONDICION.get(estado, 'active'),
+            }]},
+            'code': _texto(codigo),
+            'note': [_texto(descripcion)] if descripcion else [],
+            'onsetDateTime': _fecha(fecha),
+        })
+
+
+def _tratamientos(desde, hasta):
+    filas = _filas(
+        Tratamiento.objects.all(), 'paciente_id', desde, hasta,
+        'pk', 'paciente_id', 'profesional_id', 'medicamento__nombre', 'descripcion', 'dosis', 'frecuencia',
+        'fecha_inicio', 'fecha_fin', 'observaciones', 'activo',
+    )
+    for (pk, paciente_id, profesional_id, medicamento, descripcion, dosis, frecuencia,
+         inicio, fin, observaciones, activo) in filas:
+        yield _sin_vacios({
+            'resourceType': 'MedicationStatement',
+            'id': str(pk),
+            'status': 'active' if activo else 'completed',
+            'subject': _referencia('Patient', paciente_id),
+            'informationSource': _referencia('Practitioner', profesional_id),
+            'medicationCodeableConcept': _texto(medicamento or descripcion),
+            'effectivePeriod': _sin_vacios({'start': _fecha(inicio), 'end': _fecha(fin)}),
+            'dosage': [_texto(' '.join(filter(None, [dosis, frecuencia])))] if dosis or frecuencia else [],
+            'note': [_texto(observaciones)] if observaciones else [],
+        })
+
+
+def _pruebas(desde, hasta):
+    filas = _filas(
+        PruebaLaboratorio.objects.all(), 'paciente_id', desde, hasta,
+        'pk', 'paciente_id', 'profesional_id', 'nombre_prueba', 'fecha_realizacion', 'resultados',
+        'valores_referencia', 'observaciones',
+    )
+    for pk, paciente_id, profesional_id, nombre, fecha, resultados, referencia, observaciones in filas:
+        yield _sin_vacios({
+            'resourceType': 'Observation',
+            'id': str(pk),
+            'status': 'final',
+            'category': [{'coding': [{
+                'system': 'http://terminology.hl7.org/CodeSystem/observation-category',
+                'code': 'laboratory',
+            }]}],
+            'code': _texto(nombre),
+            'subject': _referencia('Patient', paciente_id),
+            'performer': [_referencia('Practitioner', profesional_id)] if profesional_id else [],
+            'effectiveDateTime': _fecha(fecha),
+            'valueString': resultados,
+            'referenceRange': [_texto(referencia)] if referencia else [],
+            'note': [_texto(observaciones)] if observaciones else [],
+        })
+
+
+def _cirugias(desde, hasta):
+    filas = _filas(
+        Cirugia.objects.all(), 'paciente_id', desde, hasta,
+        'pk', 'paciente_id', 'profesional_id', 'nombre_cirugia', 'fecha_cirugia', 'descripcion',
+        'complicaciones', 'estado',
+    )
+    for pk, paciente_id, profesional_id, nombre, fecha, descripcion, complicaciones, estado in filas:
+        yield _sin_vacios({
+            'resourceType': 'Procedure',
+            'id': str(pk),
+            'status': _ESTADO_CIRUGIA.get(estado, 'unknown'),
+            'code': _texto(nombre),
+            'subject': _referencia('Patient', paciente_id),
+            'performer': [{'actor': _referencia('Practitioner', profesional_id)}] if profesional_id else [],
+            'performedDateTime': _fecha(fecha),
+            'note': [_texto(descripcion)] if descripcion else [],
+            'complication': [_texto(complicaciones)] if complicaciones else [],
+        })
+
+
+# Tipo de recurso FHIR -> generador de recursos, en el orden de exportación
+RECURSOS = {
+    'Patient': _pacientes,
+    'AllergyIntolerance': _alergias,
+    'Condition': _condiciones,
+    'MedicationStatement': _tratamientos,
+    'Observation': _pruebas,
+    'Procedure': _cirugias,
+}
+
+
+def tipos_validos(tipos):
+    """Valida una lista de tipos (`_type`); None o vacía equivale a todos"""
+    if not tipos:
+        return list(RECURSOS)
+    desconocidos = [tipo for tipo in tipos if tipo not in RECURSOS]
+    if desconocidos:
+        raise ValueError(f'Tipos de recurso no soportados: {", ".join(desconocidos)}')
+    return [tipo for tipo in RECURSOS if tipo in tipos]
+
+
+def lineas(tipo, desde=None, hasta=None):
+    """Líneas NDJSON de un tipo de recurso"""
+    for recurso in RECURSOS[tipo](desde, hasta):
+        yield json.dumps(recurso, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def ndjson(tipos=None, desde=None, hasta=None):
+    """Líneas NDJSON de todos los tipos pedidos, uno detrás de otro"""
+    for tipo in tipos_validos(tipos):
+        yield from lineas(tipo, desde, hasta)
+
+
+def en_bloques(lineas, tamano=TAMANO_BLOQUE):
+    """Agrupa las líneas en bloques de bytes de ~`tamano` para no escribir línea por línea"""
+    bloque, acumulado = [], 0
+    for linea in lineas:
+        datos = linea.encode('utf-8')
+        bloque.append(datos)
+        acumulado += len(datos)
+        if acumulado >= tamano:
+            yield b''.join(bloque)
+            bloque, acumulado = [], 0
+    if bloque:
+        yield b''.join(bloque)
+
+
+def rangos_pacientes(partes):
+    """Divide los ids de paciente en `partes` rangos semiabiertos (desde, hasta) de igual amplitud"""
+    extremos = Paciente.objects.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+    if extremos['minimo'] is None:
+        return []
+    minimo, maximo = extremos['minimo'], extremos['maximo'] + 1
+    paso = max(1, -(-(maximo - minimo) // max(1, partes)))
+    return [(inicio, min(inicio + paso, maximo)) for inicio in range(minimo, maximo, paso)]
+
+
+def exportar_archivos(directorio, tipos=None, desde=None, hasta=None, comprimir=False, sufijo=''):
+    """
+    Escribe un archivo `<Tipo><sufijo>.ndjson[.gz]` por tipo de recurso y
+    devuelve {tipo: (ruta, recursos)}. Los tipos sin recursos no dejan archivo.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    abrir = gzip.open if comprimir else open
+    extension = '.ndjson.gz' if comprimir else '.ndjson'
+    resultado = {}
+    for tipo in tipos_validos(tipos):
+        ruta = os.path.join(directorio, f'{tipo}{sufijo}{extension}')
+        cantidad = 0
+
+        def contar(fuente):
+            nonlocal cantidad
+            for linea in fuente:
+                cantidad += 1
+                yield linea
+
+        with abrir(ruta, 'wb') as archivo:
+            for bloque in en_bloques(contar(lineas(tipo, desde, hasta))):
+                archivo.write(bloque)
+        if cantidad:
+            resultado[tipo] = (ruta, cantidad)
+        else:
+            os.remove(ruta)
+    return resultado
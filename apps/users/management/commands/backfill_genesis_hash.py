@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.users.blockchain_manager import BlockchainManager
+from apps.users.models import Paciente
+
+
+class Command(BaseCommand):
+    help = 'Copia el hash génesis en los pacientes que todavía no lo tienen (p. ej. cargados con bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paciente_ids', nargs='*', type=int, help='Pacientes a completar (todos por defecto)')
+
+    def handle(self, *args, **options):
+        actualizados = BlockchainManager.backfill_genesis_hash(options['paciente_ids'] or None)
+        self.stdout.write(f'Pacientes actualizados: {actualizados}')
+        faltantes = Paciente.objects.filter(genesis_hash='').count()
+        if faltantes:
+            self.stdout.write(self.style.WARNING(f'Pacientes sin hash génesis registrado: {faltantes}'))
+        self.stdout.write(self.style.SUCCESS('Hash génesis completado'))
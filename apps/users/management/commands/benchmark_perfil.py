@@ -0,0 +1,101 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from apps.users import views
+from apps.users.models import (
+    Alergia, Cirugia, CondicionMedica, Medicamento, Paciente, Profesional, PruebaLaboratorio, Tratamiento,
+)
+from core.roles import get_request_role
+from core.testing import mock_blockchain
+
+# Cachés aisladas: el benchmark no deja fragmentos ni versiones en la caché real
+CACHE_BENCHMARK = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-perfil'}
+SIN_FRAGMENTOS = {
+    'default': CACHE_BENCHMARK,
+    'template_fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+CON_FRAGMENTOS = {'default': CACHE_BENCHMARK}
+
+
+class Command(BaseCommand):
+    help = 'Compara el render del perfil del paciente con y sin caché de fragmentos (los datos se descartan)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registros', type=int, default=200, help='Registros por sección médica')
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            paciente = self._crear_paciente(options['registros'])
+            for nombre, config in (('sin fragmentos', SIN_FRAGMENTOS), ('con fragmentos', CON_FRAGMENTOS)):
+                with override_settings(CACHES=config):
+                    self._medir(nombre, paciente, options['repeticiones'])
+            transaction.set_rollback(True)
+
+    def _medir(self, nombre, paciente, repeticiones):
+        caches['default'].clear()
+        # La carga de datos llena el registro de consultas con DEBUG activo
+        connection.queries_log.clear()
+        # Primer render fuera de la medición: compila la plantilla y, si corresponde, llena los fragmentos
+        self._render(paciente)
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            with CaptureQueriesContext(connection) as consultas:
+                self._render(paciente)
+            tiempos.append(time.perf_counter() - inicio)
+        self.stdout.write(
+            f'{nombre}: mediana {statistics.median(tiempos) * 1000:.1f} ms, '
+            f'mínimo {min(tiempos) * 1000:.1f} ms, {len(consultas)} consultas'
+        )
+
+    def _render(self, paciente):
+        request = RequestFactory().get('/users/me/')
+        request.user = paciente.user
+        request.session = SessionBase()
+        request.role = get_request_role(request)
+        response = views.perfil_paciente(request)
+        assert response.status_code == 200, response.status_code
+        return response
+
+    def _crear_paciente(self, registros):
+        hoy = date.today()
+        user = User.objects.create_user('benchmark_perfil', first_name='Bench', last_name='Perfil')
+        medico = Profesional.objects.create(
+            user=User.objects.create_user('benchmark_medico'),
+            especialidad='medicina_general', matricula='BENCH0001', telefono='000',
+        )
+        medicamento = Medicamento.objects.create(
+            nombre='Paracetamol', principio_activo='Paracetamol', concentracion='500mg', forma_farmaceutica='Tableta'
+        )
+        with mock_blockchain():
+            paciente = Paciente.objects.create(
+                user=user, cedula='99999999', genero='unknown', fecha_nacimiento=hoy - timedelta(days=40 * 365)
+            )
+            for i in range(registros):
+                fecha = hoy - timedelta(days=i)
+                Alergia.objects.create(paciente=paciente, sustancia=f'Sustancia {i}', fecha_diagnostico=fecha)
+                CondicionMedica.objects.create(paciente=paciente, codigo=f'C{i:03d}', fecha_diagnostico=fecha)
+                Tratamiento.objects.create(
+                    paciente=paciente, profesional=medico, medicamento=medicamento,
+                    descripcion=f'Tratamiento {i}', fecha_inicio=fecha,
+                )
+                PruebaLaboratorio.objects.create(
+                    paciente=paciente, profesional=medico, nombre_prueba=f'Prueba {i}',
+                    fecha_realizacion=fecha, resultados='Normal',
+                )
+                Cirugia.objects.create(
+                    paciente=paciente, profesional=medico, nombre_cirugia=f'Cirugia {i}',
+                    fecha_cirugia=fecha, descripcion='Sin complicaciones',
+                )
+        self.stdout.write(f'Paciente con {registros} registros por sección')
+        return paciente
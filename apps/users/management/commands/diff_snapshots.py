@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.users import snapshots
+from apps.users.models import Paciente
+
+
+def _fecha(valor):
+    fecha = snapshots.parse_fecha(valor)
+    if fecha is None:
+        raise CommandError(f'Fecha inválida: {valor} (usar AAAA-MM-DD o AAAA-MM-DDTHH:MM)')
+    return fecha
+
+
+class Command(BaseCommand):
+    help = 'Muestra los registros agregados, modificados y eliminados de un paciente entre dos fechas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paciente_id', type=int)
+        parser.add_argument('desde', help='Fecha inicial (se compara contra el último snapshot hasta esa fecha)')
+        parser.add_argument('hasta', nargs='?', help='Fecha final (por defecto, ahora)')
+
+    def handle(self, *args, **options):
+        if not Paciente.objects.filter(pk=options['paciente_id']).exists():
+            raise CommandError(f'No existe el paciente {options["paciente_id"]}')
+        desde = _fecha(options['desde'])
+        hasta = _fecha(options['hasta']) if options['hasta'] else timezone.now()
+
+        try:
+            inicial, final, cambios = snapshots.cambios_entre(options['paciente_id'], desde, hasta)
+        except snapshots.SnapshotNoDisponible as error:
+            raise CommandError(error)
+        if final is None:
+            raise CommandError('No hay snapshots hasta la fecha final: ejecutar take_snapshots')
+        self.stdout.write(f'Desde: {inicial.fecha if inicial else "(sin snapshot)"}  Hasta: {final.fecha}')
+
+        for cambio in cambios:
+            self.stdout.write(f'{cambio["tipo"]:<11} {cambio["seccion"]:<13} #{cambio["id"]}')
+            for campo, (antes, despues) in cambio['campos'].items():
+                self.stdout.write(f'            {campo}: {antes!r} -> {despues!r}')
+        self.stdout.write(self.style.SUCCESS(f'Cambios: {len(cambios)}'))
@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from apps.users import fhir
+
+
+def _exportar_parte(directorio, tipos, desde, hasta, comprimir, sufijo):
+    try:
+        return fhir.exportar_archivos(directorio, tipos, desde, hasta, comprimir, sufijo)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Exporta la historia clínica en NDJSON FHIR, un archivo por tipo de recurso (y por rango de pacientes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directorio', help='Directorio de salida')
+        parser.add_argument('--tipos', default='', help=f'Tipos separados por coma ({", ".join(fhir.RECURSOS)})')
+        parser.add_argument('--desde', type=int, help='Primer id de paciente (incluido)')
+        parser.add_argument('--hasta', type=int, help='Último id de paciente (excluido)')
+        parser.add_argument('--partes', type=int, default=1,
+                            help='Divide los pacientes en N rangos, cada uno en sus propios archivos')
+        parser.add_argument('--workers', type=int, default=1, help='Procesos que exportan las partes en paralelo')
+        parser.add_argument('--gzip', action='store_true', help='Comprime cada archivo con gzip')
+
+    def handle(self, *args, **options):
+        try:
+            tipos = fhir.tipos_validos([tipo for tipo in options['tipos'].split(',') if tipo])
+        except ValueError as error:
+            raise CommandError(error)
+
+        if options['partes'] > 1:
+            rangos = fhir.rangos_pacientes(options['partes'])
+            if options['desde'] is not None or options['hasta'] is not None:
+                raise CommandError('--partes calcula los rangos solo: no combinar con --desde/--hasta')
+        else:
+            rangos = [(options['desde'], options['hasta'])]
+        trabajos = [
+            (options['directorio'], tipos, desde, hasta, options['gzip'], f'.{i}' if len(rangos) > 1 else '')
+            for i, (desde, hasta) in enumerate(rangos)
+        ]
+
+        if options['workers'] > 1 and len(trabajos) > 1:
+            # Los procesos hijos no pueden compartir las conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                resultados = list(pool.map(_exportar_parte, *zip(*trabajos)))
+        else:
+            resultados = [fhir.exportar_archivos(*trabajo) for trabajo in trabajos]
+
+        total = 0
+        for resultado in resultados:
+            for tipo, (ruta, cantidad) in resultado.items():
+                total += cantidad
+                self.stdout.write(f'{tipo:<20} {cantidad:>8}  {ruta}')
+        self.stdout.write(self.style.SUCCESS(f'Recursos exportados: {total}'))
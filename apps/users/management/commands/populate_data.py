@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from apps.users.models import Paciente, Profesional
 from datetime import date
@@ -8,6 +9,8 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.stdout.write('Creating sample data...')
+        # Hash the shared password once: with Argon2/PBKDF2 each hash costs hundreds of ms
+        password = make_password('password123')
 
         # Create sample professionals
         professionals_data = [
@@ -42,12 +45,12 @@ class Command(BaseCommand):
 
         for prof_data in professionals_data:
             if not User.objects.filter(username=prof_data['username']).exists():
-                user = User.objects.create_user(
+                user = User.objects.create(
                     username=prof_data['username'],
                     first_name=prof_data['first_name'],
                     last_name=prof_data['last_name'],
                     email=prof_data['email'],
-                    password='password123'  # In production, use proper password hashing
+                    password=password,
                 )
                 profesional = Profesional.objects.create(
                     user=user,
@@ -102,12 +105,12 @@ class Command(BaseCommand):
 
         for pat_data in patients_data:
             if not User.objects.filter(username=pat_data['username']).exists():
-                user = User.objects.create_user(
+                user = User.objects.create(
                     username=pat_data['username'],
                     first_name=pat_data['first_name'],
                     last_name=pat_data['last_name'],
                     email=pat_data['email'],
-                    password='password123'  # In production, use proper password hashing
+                    password=password,
                 )
                 paciente = Paciente.objects.create(
                     user=user,
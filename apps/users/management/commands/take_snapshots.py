@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.users import snapshots
+from apps.users.models import Paciente
+
+
+def _tomar_lote(paciente_ids):
+    """Snapshots de un lote de pacientes; devuelve cuántos tenían cambios"""
+    try:
+        nuevos = sum(snapshots.tomar(paciente_id)[1] for paciente_id in paciente_ids)
+        return len(paciente_ids), nuevos
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Toma un snapshot de la historia clínica de cada paciente (pensado para ejecutarse periódicamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paciente_ids', nargs='*', type=int, help='Pacientes a procesar (todos por defecto)')
+        parser.add_argument('--workers', type=int, default=1, help='Procesos que generan snapshots en paralelo')
+        parser.add_argument('--lote', type=int, default=100, help='Pacientes por tarea del pool')
+
+    def handle(self, *args, **options):
+        ids = options['paciente_ids'] or list(Paciente.objects.order_by('pk').values_list('pk', flat=True))
+        lotes = [ids[i:i + options['lote']] for i in range(0, len(ids), options['lote'])]
+
+        if options['workers'] > 1 and len(lotes) > 1:
+            # Los procesos hijos no pueden compartir las conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                resultados = list(pool.map(_tomar_lote, lotes))
+        else:
+            resultados = [_tomar_lote(lote) for lote in lotes]
+
+        procesados = sum(total for total, _ in resultados)
+        nuevos = sum(cambiados for _, cambiados in resultados)
+        self.stdout.write(f'Pacientes procesados: {procesados}')
+        self.stdout.write(self.style.SUCCESS(f'Snapshots nuevos: {nuevos} (sin cambios: {procesados - nuevos})'))
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.16 on 2025-09-02 10:14
+
+import hashlib
+
+from django.db import migrations, models
+
+LOTE = 500
+
+
+def encadenar_hashes_existentes(apps, schema_editor):
+    """Encadena los hashes ya existentes de cada paciente en orden de inserción (UPDATE por lotes)."""
+    Paciente = apps.get_model('users', 'Paciente')
+    BlockchainHash = apps.get_model('users', 'BlockchainHash')
+
+    hashes, pacientes = [], []
+    for paciente in Paciente.objects.only('id').iterator():
+        head = ''
+        length = 0
+        for hash_record in BlockchainHash.objects.filter(paciente=paciente).order_by('id').only('id', 'hash_value'):
+            hash_record.prev_hash = head
+            hashes.append(hash_record)
+            head = hashlib.sha256(f"{head}{hash_record.hash_value}".encode('utf-8')).hexdigest()
+            length += 1
+        paciente.chain_head = head
+        paciente.chain_length = length
+        pacientes.append(paciente)
+        if len(hashes) >= LOTE:
+            BlockchainHash.objects.bulk_update(hashes, ['prev_hash'], batch_size=LOTE)
+            hashes = []
+        if len(pacientes) >= LOTE:
+            Paciente.objects.bulk_update(pacientes, ['chain_head', 'chain_length'], batch_size=LOTE)
+            pacientes = []
+    BlockchainHash.objects.bulk_update(hashes, ['prev_hash'], batch_size=LOTE)
+    Paciente.objects.bulk_update(pacientes, ['chain_head', 'chain_length'], batch_size=LOTE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_add_paciente_to_accesosoblockchain'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockchainhash',
+            name='prev_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='chain_head',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='chain_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(encadenar_hashes_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_blockchain_hash_chain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisponibilidadProfesional',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('duracion_turno', models.PositiveSmallIntegerField(default=30, help_text='Duración de cada turno en minutos')),
+                ('activo', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Disponibilidad',
+                'verbose_name_plural': 'Disponibilidades',
+                'ordering': ['profesional', 'dia_semana', 'hora_inicio'],
+            },
+        ),
+        migrations.AddField(
+            model_name='turno',
+            name='duracion_minutos',
+            field=models.PositiveSmallIntegerField(default=30),
+        ),
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(fields=['profesional', 'fecha_hora'], name='turno_profesional_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='disponibilidadprofesional',
+            name='profesional',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='disponibilidades', to='users.profesional'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_agenda_turnos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(fields=['profesional', 'estado', 'fecha_hora'], name='turno_prof_estado_fecha_idx'),
+        ),
+    ]
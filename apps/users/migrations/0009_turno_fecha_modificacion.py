@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_turno_agenda_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='turno',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_turno_fecha_modificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
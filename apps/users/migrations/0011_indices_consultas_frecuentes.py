@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_paciente_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accesoblockchain',
+            index=models.Index(fields=['hash_record', '-fecha_acceso'], name='acceso_hash_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blockchainhash',
+            index=models.Index(fields=['paciente', '-timestamp'], name='bchash_paciente_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tratamiento',
+            index=models.Index(fields=['paciente', 'activo'], name='tratam_paciente_activo_idx'),
+        ),
+    ]
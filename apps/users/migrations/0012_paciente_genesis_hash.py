@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copiar_genesis(apps, schema_editor):
+    """Copia en cada paciente el hash génesis ya registrado (una sola sentencia UPDATE)."""
+    Paciente = apps.get_model('users', 'Paciente')
+    BlockchainHash = apps.get_model('users', 'BlockchainHash')
+
+    genesis = BlockchainHash.objects.filter(
+        paciente=OuterRef('pk'), categoria='genesis'
+    ).order_by('id').values('hash_value')[:1]
+    Paciente.objects.filter(blockchain_hashes__categoria='genesis').update(genesis_hash=Subquery(genesis))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='genesis_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(copiar_genesis, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def contar_accesos(apps, schema_editor):
+    """Completa el contador con los accesos ya auditados (una sola sentencia UPDATE)."""
+    BlockchainHash = apps.get_model('users', 'BlockchainHash')
+    AccesoBlockchain = apps.get_model('users', 'AccesoBlockchain')
+
+    accesos = AccesoBlockchain.objects.filter(
+        hash_record=OuterRef('pk')
+    ).order_by().values('hash_record').annotate(total=Count('id')).values('total')
+    BlockchainHash.objects.filter(
+        pk__in=AccesoBlockchain.objects.values('hash_record')
+    ).update(accesos_count=Coalesce(Subquery(accesos), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_paciente_genesis_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockchainhash',
+            name='accesos_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(contar_accesos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_blockchainhash_accesos_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('hash_value', models.CharField(max_length=64)),
+                ('registros', models.PositiveIntegerField()),
+                ('tamano', models.PositiveIntegerField()),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='users.paciente')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Paciente',
+                'verbose_name_plural': 'Snapshots de Pacientes',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['paciente', '-fecha'], name='snapshot_paciente_fecha_idx')],
+            },
+        ),
+    ]
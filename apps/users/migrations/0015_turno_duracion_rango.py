@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:21
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_snapshotpaciente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='turno',
+            name='duracion_minutos',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(240)]),
+        ),
+        migrations.AddConstraint(
+            model_name='turno',
+            constraint=models.CheckConstraint(check=models.Q(('duracion_minutos__gte', 1), ('duracion_minutos__lte', 240)), name='turno_duracion_rango'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:23
+
+from django.db import migrations, models
+from django.db.models import F
+
+SECCIONES = ('alergias', 'condiciones', 'tratamientos', 'pruebas', 'cirugias', 'hashes')
+
+
+def copiar_version(apps, schema_editor):
+    # Las secciones arrancan con la versión actual del paciente: ninguna clave vieja de fragmento coincide
+    Paciente = apps.get_model('users', 'Paciente')
+    Paciente.objects.update(**{f'version_{seccion}': F('version') for seccion in SECCIONES})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_turno_duracion_rango'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='version_alergias',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='version_cirugias',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='version_condiciones',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='version_hashes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='version_pruebas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='version_tratamientos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(copiar_version, migrations.RunPython.noop),
+    ]
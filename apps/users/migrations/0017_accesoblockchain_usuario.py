@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0016_paciente_versiones_secciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accesoblockchain',
+            name='usuario',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='accesos_blockchain', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
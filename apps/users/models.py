@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from datetime import timedelta
 
 
 class HospitalAdminProfile(models.Model):
@@ -87,12 +90,40 @@ class Paciente(Person):
     fecha_nacimiento = models.DateField()
     tipo_sangre = models.CharField(max_length=3, choices=TIPOS_SANGRE, blank=True)
 
+    # Cabeza de la cadena de hashes del historial (ver BlockchainManager.verify_patient_chain)
+    chain_head = models.CharField(max_length=64, blank=True)
+    chain_length = models.PositiveIntegerField(default=0)
+    # Copia del hash génesis (nunca cambia) para verificar el acceso al perfil sin consultar BlockchainHash
+    genesis_hash = models.CharField(max_length=64, blank=True, editable=False)
+
+    # Se incrementa con cada cambio del paciente o de sus registros (ETag de las vistas)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # Valor de `version` al último cambio de cada sección del perfil (claves de `{% cache %}`, apps.users.secciones)
+    version_alergias = models.PositiveIntegerField(default=0, editable=False)
+    version_condiciones = models.PositiveIntegerField(default=0, editable=False)
+    version_tratamientos = models.PositiveIntegerField(default=0, editable=False)
+    version_pruebas = models.PositiveIntegerField(default=0, editable=False)
+    version_cirugias = models.PositiveIntegerField(default=0, editable=False)
+    version_hashes = models.PositiveIntegerField(default=0, editable=False)
+
+    # Cadena de hashes y contadores que solo cambian con UPDATE (BlockchainManager,
+    # apps.users.signals): un save() de una copia cargada antes volvería a escribir valores viejos
+    CAMPOS_SOLO_UPDATE = (
+        'chain_head', 'chain_length', 'genesis_hash', 'version', 'version_alergias', 'version_condiciones', 'version_tratamientos',
+        'version_pruebas', 'version_cirugias', 'version_hashes',
+    )
+
     class Meta:
         verbose_name = "Paciente"
         verbose_name_plural = "Pacientes"
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [campo.name for campo in self._meta.concrete_fields if not campo.primary_key]
+            kwargs['update_fields'] = [campo for campo in update_fields if campo not in self.CAMPOS_SOLO_UPDATE]
         super().save(*args, **kwargs)
         
         # Generar hash génesis si es un nuevo paciente
@@ -122,26 +153,25 @@ class Paciente(Person):
             'timestamp': str(timezone.now())
         }
 
-    def store_on_blockchain(self):
-        """Store patient data on Polygon/Filecoin"""
+    def store_on_blockchain(self, ruta=None):
+        """
+        Registra en Polygon el hash del snapshot canónico de la historia clínica
+        (apps.users.snapshots). Con `ruta` se escribe además el snapshot
+        comprimido, que se sube a Filecoin si está configurado.
+        """
+        from . import snapshots
         from .blockchain_services import MedicalBlockchainService
 
         service = MedicalBlockchainService()
-        record_data = self.generate_blockchain_data()
-
-        # Get related medical records
-        alergias = [a.__dict__ for a in self.alergias.all()]
-        condiciones = [c.__dict__ for c in self.condiciones.all()]
-        tratamientos = [t.__dict__ for t in self.tratamientos.all()]
+        snapshot = snapshots.construir(self.id, ruta)
 
         full_record = {
-            'patient': record_data,
-            'alergias': alergias,
-            'condiciones': condiciones,
-            'tratamientos': tratamientos
+            'patient': self.generate_blockchain_data(),
+            'snapshot_hash': snapshot['hash'],
+            'registros': snapshot['registros'],
         }
 
-        return service.store_medical_record(self.id, full_record)
+        return service.store_medical_record(self.id, full_record, file_path=ruta)
 
 
 class Profesional(Person):
@@ -269,6 +299,12 @@ class Tratamiento(models.Model):
     fecha_fin = models.DateField(null=True, blank=True)
     observaciones = models.TextField(blank=True)
     activo = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # Tratamientos activos del paciente
+            models.Index(fields=['paciente', 'activo'], name='tratam_paciente_activo_idx'),
+        ]
     
     def __str__(self):
         return f"{self.paciente} - {self.descripcion[:50]}"
@@ -433,6 +469,10 @@ class Cirugia(models.Model):
             )
 
 
+# Cota de la duración de un turno; acota la búsqueda de solapamientos de apps.users.agenda
+DURACION_MAXIMA_TURNO_MINUTOS = 240
+
+
 class Turno(models.Model):
     ESTADOS_TURNO = [
         ('programado', 'Programado'),
@@ -443,19 +483,75 @@ class Turno(models.Model):
         ('no_asistio', 'No Asistió')
     ]
     
+    # Estados que ocupan el horario del profesional
+    ESTADOS_ACTIVOS = ['programado', 'confirmado', 'en_curso']
+
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='turnos')
     profesional = models.ForeignKey(Profesional, on_delete=models.CASCADE, related_name='turnos')
     fecha_hora = models.DateTimeField()
+    duracion_minutos = models.PositiveSmallIntegerField(
+        default=30, validators=[MinValueValidator(1), MaxValueValidator(DURACION_MAXIMA_TURNO_MINUTOS)],
+    )
     motivo = models.TextField()
     estado = models.CharField(max_length=20, choices=ESTADOS_TURNO, default='programado')
     observaciones = models.TextField(blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.paciente} - {self.profesional} ({self.fecha_hora})"
     
+    @property
+    def fecha_hora_fin(self):
+        return self.fecha_hora + timedelta(minutes=self.duracion_minutos)
+    
     class Meta:
         ordering = ['fecha_hora']
+        indexes = [
+            # Consultas por rango de la agenda y detección de solapamientos (apps.users.agenda)
+            models.Index(fields=['profesional', 'fecha_hora'], name='turno_profesional_fecha_idx'),
+            # Agenda del panel: turnos de un profesional por estado en un rango de fechas
+            models.Index(fields=['profesional', 'estado', 'fecha_hora'], name='turno_prof_estado_fecha_idx'),
+        ]
+        constraints = [
+            # También para bulk_create, que no pasa por los validadores
+            models.CheckConstraint(
+                check=models.Q(duracion_minutos__gte=1, duracion_minutos__lte=DURACION_MAXIMA_TURNO_MINUTOS),
+                name='turno_duracion_rango',
+            ),
+        ]
+
+
+class DisponibilidadProfesional(models.Model):
+    """Franja semanal en la que un profesional atiende turnos"""
+    DIAS_SEMANA = [
+        (0, 'Lunes'),
+        (1, 'Martes'),
+        (2, 'Miércoles'),
+        (3, 'Jueves'),
+        (4, 'Viernes'),
+        (5, 'Sábado'),
+        (6, 'Domingo'),
+    ]
+
+    profesional = models.ForeignKey(Profesional, on_delete=models.CASCADE, related_name='disponibilidades')
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    duracion_turno = models.PositiveSmallIntegerField(default=30, help_text='Duración de cada turno en minutos')
+    activo = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = "Disponibilidad"
+        verbose_name_plural = "Disponibilidades"
+        ordering = ['profesional', 'dia_semana', 'hora_inicio']
+
+    def clean(self):
+        if self.hora_inicio and self.hora_fin and self.hora_fin <= self.hora_inicio:
+            raise ValidationError('La hora de fin debe ser posterior a la de inicio.')
+
+    def __str__(self):
+        return f"{self.profesional} - {self.get_dia_semana_display()} {self.hora_inicio:%H:%M}-{self.hora_fin:%H:%M}"
 
 
 # ========== MODELOS PARA BLOCKCHAIN ==========
@@ -477,16 +573,24 @@ class BlockchainHash(models.Model):
     categoria = models.CharField(max_length=20, choices=CATEGORIAS)
     record_id = models.PositiveIntegerField()  # ID del registro médico correspondiente
     hash_value = models.CharField(max_length=64, unique=True)  # SHA256 hash
+    prev_hash = models.CharField(max_length=64, blank=True)  # Cabeza de la cadena del paciente antes de este registro
     transaction_hash = models.CharField(max_length=66, blank=True)  # Hash de transacción Polygon
     block_number = models.PositiveIntegerField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     datos_originales = models.JSONField()  # Datos originales que generaron el hash
+    # Cantidad de accesos auditados, mantenida por señales (evita COUNT sobre AccesoBlockchain)
+    accesos_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name = "Blockchain Hash"
         verbose_name_plural = "Blockchain Hashes"
         unique_together = ['paciente', 'categoria', 'record_id']
         ordering = ['-timestamp']
+        # La búsqueda del génesis (paciente, categoria) usa el prefijo del índice único
+        indexes = [
+            # Hashes del paciente en el orden por defecto
+            models.Index(fields=['paciente', '-timestamp'], name='bchash_paciente_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.paciente} - {self.get_categoria_display()} ({self.hash_value[:8]}...)"
@@ -498,6 +602,8 @@ class AccesoBlockchain(models.Model):
     hash_record = models.ForeignKey(BlockchainHash, on_delete=models.CASCADE, related_name='accesos')
     profesional = models.ForeignKey(Profesional, on_delete=models.CASCADE, null=True, blank=True)
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, null=True, blank=True)
+    # Usuario que accedió: distingue a un administrador (sin profesional) del paciente propietario
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='accesos_blockchain')
     fecha_acceso = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
@@ -507,8 +613,44 @@ class AccesoBlockchain(models.Model):
         verbose_name = "Acceso Blockchain"
         verbose_name_plural = "Accesos Blockchain"
         ordering = ['-fecha_acceso']
+        indexes = [
+            # Historial de accesos de un hash, más recientes primero
+            models.Index(fields=['hash_record', '-fecha_acceso'], name='acceso_hash_fecha_idx'),
+        ]
     
+    @property
+    def es_administrador(self):
+        """Acceso de un usuario que no es el profesional ni el paciente del registro"""
+        return (not self.profesional_id and self.usuario_id is not None
+                and (self.paciente is None or self.paciente.user_id != self.usuario_id))
+
     def __str__(self):
-        usuario = self.profesional.get_full_name() if self.profesional else self.paciente.get_full_name()
-        tipo_usuario = "Profesional" if self.profesional else "Paciente"
+        if self.profesional:
+            usuario, tipo_usuario = self.profesional.get_full_name(), "Profesional"
+        elif self.es_administrador:
+            usuario, tipo_usuario = self.usuario.get_full_name() or self.usuario.username, "Administrador"
+        else:
+            usuario, tipo_usuario = self.paciente.get_full_name(), "Paciente"
         return f"{tipo_usuario} {usuario} accedió a {self.hash_record} el {self.fecha_acceso}"
+
+
+class SnapshotPaciente(models.Model):
+    """Snapshot periódico de la historia clínica; el contenido se guarda en disco por hash (apps.users.snapshots)"""
+
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='snapshots')
+    fecha = models.DateTimeField(default=timezone.now)
+    hash_value = models.CharField(max_length=64)  # SHA256 del contenido canónico, nombre del archivo
+    registros = models.PositiveIntegerField()
+    tamano = models.PositiveIntegerField()  # Bytes sin comprimir
+
+    class Meta:
+        verbose_name = "Snapshot de Paciente"
+        verbose_name_plural = "Snapshots de Pacientes"
+        ordering = ['-fecha']
+        indexes = [
+            # Último snapshot del paciente anterior a una fecha
+            models.Index(fields=['paciente', '-fecha'], name='snapshot_paciente_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente} - {self.fecha:%Y-%m-%d %H:%M} ({self.hash_value[:8]}...)"
@@ -0,0 +1,41 @@
+"""
+Versiones por sección del perfil del paciente para el caché de fragmentos.
+
+Cada sección de `users/perfil_paciente.html` se cachea con `{% cache %}`
+usando como clave su versión, guardada en la columna `version_<sección>` del
+paciente. Al modificarse un registro, el mismo UPDATE que incrementa
+`Paciente.version` copia el valor nuevo en la columna de su sección, así que
+la versión de una sección solo crece y se lee junto con el paciente, sin
+depender de que el caché sea compartido entre procesos: un fragmento viejo
+que quede en el caché de otro proceso tiene otra clave y no se vuelve a
+usar. Un alta de alergia invalida solo el fragmento de alergias (y el de
+hashes, por el hash que genera), no los demás.
+"""
+from django.conf import settings
+
+from .models import Alergia, BlockchainHash, Cirugia, CondicionMedica, PruebaLaboratorio, Tratamiento
+
+SECCIONES = {
+    'alergias': Alergia,
+    'condiciones': CondicionMedica,
+    'tratamientos': Tratamiento,
+    'pruebas': PruebaLaboratorio,
+    'cirugias': Cirugia,
+    'hashes': BlockchainHash,
+}
+SECCION_POR_MODELO = {modelo: seccion for seccion, modelo in SECCIONES.items()}
+
+
+def fragment_cache_ttl():
+    return getattr(settings, 'FRAGMENT_CACHE_TTL', 600)
+
+
+def campo_version(modelo):
+    """Columna del paciente con la versión de la sección del modelo, o None si no tiene sección"""
+    seccion = SECCION_POR_MODELO.get(modelo)
+    return f'version_{seccion}' if seccion else None
+
+
+def versiones_secciones(paciente):
+    """Versión de cada sección del perfil, leída de las columnas del paciente"""
+    return {seccion: getattr(paciente, f'version_{seccion}') for seccion in SECCIONES}
@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import agenda, secciones
+from .models import (
+    AccesoBlockchain, Alergia, Antecedente, BlockchainHash, Cirugia, CondicionMedica, Paciente,
+    PruebaLaboratorio, Tratamiento, Turno,
+)
+
+# Modelos cuyo contenido se muestra en las vistas del paciente
+REGISTROS_PACIENTE = [Alergia, CondicionMedica, Tratamiento, Antecedente, PruebaLaboratorio, Cirugia, BlockchainHash]
+
+
+@receiver(post_save, sender=Turno)
+@receiver(post_delete, sender=Turno)
+def invalidar_agenda_profesional(sender, instance, **kwargs):
+    profesional_id = instance.profesional_id
+    transaction.on_commit(lambda: agenda.invalidar_agenda(profesional_id))
+
+
+def incrementar_version(campo_seccion=None, **filtros):
+    cambios = {'version': F('version') + 1}
+    if campo_seccion:
+        # Se evalúa con la fila previa: la sección queda con la versión nueva del paciente
+        cambios[campo_seccion] = F('version') + 1
+    Paciente.objects.filter(**filtros).update(**cambios)
+
+
+@receiver(post_save, sender=Paciente)
+def versionar_paciente(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        incrementar_version(pk=instance.pk)
+
+
+@receiver(post_save, sender=User)
+def versionar_paciente_por_usuario(sender, instance, created, update_fields=None, **kwargs):
+    """El nombre y el email del usuario se muestran en el perfil; se ignora el login"""
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    incrementar_version(user_id=instance.pk)
+
+
+def versionar_por_registro(sender, instance, raw=False, **kwargs):
+    if not raw:
+        incrementar_version(secciones.campo_version(sender), pk=instance.paciente_id)
+
+
+for _modelo in REGISTROS_PACIENTE:
+    post_save.connect(versionar_por_registro, sender=_modelo, dispatch_uid=f'version_paciente_{_modelo.__name__}')
+    post_delete.connect(versionar_por_registro, sender=_modelo, dispatch_uid=f'version_paciente_baja_{_modelo.__name__}')
+
+
+@receiver(post_save, sender=AccesoBlockchain)
+def contar_acceso(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        BlockchainHash.objects.filter(pk=instance.hash_record_id).update(accesos_count=F('accesos_count') + 1)
+
+
+@receiver(post_delete, sender=AccesoBlockchain)
+def descontar_acceso(sender, instance, **kwargs):
+    BlockchainHash.objects.filter(pk=instance.hash_record_id, accesos_count__gt=0).update(
+        accesos_count=F('accesos_count') - 1
+    )
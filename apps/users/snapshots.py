@@ -0,0 +1,241 @@
+"""
+Snapshot canónico de la historia clínica de un paciente.
+
+El snapshot es una secuencia de líneas JSON canónicas (claves ordenadas, sin
+espacios, fechas en ISO 8601): primero los datos del paciente y después cada
+registro de sus secciones, ordenados por sección e id. Los registros se leen
+con `values()` e `iterator()`, se codifican de a uno y se van pasando al
+SHA-256 y, si se pide, a un archivo gzip, así que la memoria no crece con la
+cantidad de registros. El mismo contenido produce siempre los mismos bytes y
+por lo tanto el mismo hash.
+
+Los snapshots periódicos (`tomar`, comando `take_snapshots`) se guardan en
+SNAPSHOT_DIR con el hash como nombre: dos snapshots iguales, del mismo
+paciente o de fechas distintas, comparten el archivo. Como ambos lados están
+ordenados por (sección, id), `diferencias` compara dos snapshots recorriéndolos
+una sola vez en paralelo.
+"""
+import datetime
+import decimal
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import (
+    Alergia, Antecedente, Cirugia, CondicionMedica, Paciente, PruebaLaboratorio, SnapshotPaciente, Tratamiento,
+)
+
+# Sección -> modelo, en el orden en que aparecen en el snapshot
+SECCIONES_SNAPSHOT = {
+    'alergias': Alergia,
+    'condiciones': CondicionMedica,
+    'tratamientos': Tratamiento,
+    'antecedentes': Antecedente,
+    'pruebas': PruebaLaboratorio,
+    'cirugias': Cirugia,
+}
+
+# Posición de cada sección en el snapshot; el paciente va primero
+ORDEN_SECCIONES = {'paciente': 0, **{seccion: i for i, seccion in enumerate(SECCIONES_SNAPSHOT, 1)}}
+
+CAMPOS_PACIENTE = (
+    'id', 'cedula', 'user__first_name', 'user__last_name', 'genero', 'fecha_nacimiento',
+    'tipo_sangre', 'telefono', 'direccion', 'ciudad', 'codigo_postal',
+)
+
+
+def _chunk_size():
+    return getattr(settings, 'SNAPSHOT_CHUNK_SIZE', 500)
+
+
+def _canonico(valor):
+    if isinstance(valor, (datetime.datetime, datetime.date, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return str(valor)
+    raise TypeError(f'{type(valor).__name__} no es serializable en el snapshot')
+
+
+def codificar(datos):
+    """Línea canónica de un registro"""
+    return json.dumps(datos, sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+                      default=_canonico).encode('utf-8') + b'\n'
+
+
+def campos(modelo):
+    """Columnas del registro en el snapshot (todas menos el paciente)"""
+    return [campo.attname for campo in modelo._meta.concrete_fields if campo.name != 'paciente']
+
+
+def registros(paciente_id):
+    """(sección, datos) de cada registro del paciente, leídos por bloques"""
+    for seccion, modelo in SECCIONES_SNAPSHOT.items():
+        filas = modelo.objects.filter(paciente_id=paciente_id).order_by('pk').values(*campos(modelo))
+        for fila in filas.iterator(chunk_size=_chunk_size()):
+            yield seccion, fila
+
+
+def lineas(paciente_id):
+    """Bytes del snapshot, una línea por vez"""
+    datos = Paciente.objects.filter(pk=paciente_id).values(*CAMPOS_PACIENTE).get()
+    yield codificar({'seccion': 'paciente', 'datos': datos})
+    for seccion, fila in registros(paciente_id):
+        yield codificar({'seccion': seccion, 'datos': fila})
+
+
+def construir(paciente_id, ruta=None):
+    """
+    Recorre el snapshot una vez, calculando el hash y escribiendo `ruta`
+    (gzip) si se indica. Devuelve {'hash', 'registros', 'bytes', 'ruta'}.
+    """
+    digest = hashlib.sha256()
+    cantidad = tamano = 0
+    # mtime=0: el mismo snapshot produce el mismo archivo; se escribe aparte y se renombra al terminar
+    archivo = gzip.GzipFile(f'{ruta}.tmp', 'wb', mtime=0) if ruta else None
+    try:
+        for linea in lineas(paciente_id):
+            digest.update(linea)
+            if archivo:
+                archivo.write(linea)
+            cantidad += 1
+            tamano += len(linea)
+    except BaseException:
+        if archivo:
+            archivo.close()
+            os.remove(f'{ruta}.tmp')
+        raise
+    if archivo:
+        archivo.close()
+        os.replace(f'{ruta}.tmp', ruta)
+    # La primera línea es la del paciente
+    return {'hash': digest.hexdigest(), 'registros': cantidad - 1, 'bytes': tamano, 'ruta': ruta}
+
+
+def directorio():
+    return getattr(settings, 'SNAPSHOT_DIR', 'snapshots')
+
+
+def ruta_contenido(hash_value):
+    return os.path.join(directorio(), hash_value[:2], f'{hash_value}.ndjson.gz')
+
+
+def tomar(paciente_id):
+    """
+    Guarda un snapshot del paciente y devuelve (snapshot, creado), como
+    get_or_create. Si el contenido no cambió desde el último no se crea otro:
+    se devuelve el existente. El archivo solo se escribe si ningún snapshot
+    anterior tenía el mismo contenido.
+    """
+    os.makedirs(directorio(), exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio(), suffix='.ndjson.gz')
+    os.close(descriptor)
+    try:
+        snapshot = construir(paciente_id, temporal)
+        destino = ruta_contenido(snapshot['hash'])
+        if os.path.exists(destino):
+            os.remove(temporal)
+        else:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    ultimo = SnapshotPaciente.objects.filter(paciente_id=paciente_id).order_by('-fecha').first()
+    if ultimo and ultimo.hash_value == snapshot['hash']:
+        return ultimo, False
+    return SnapshotPaciente.objects.create(
+        paciente_id=paciente_id, hash_value=snapshot['hash'],
+        registros=snapshot['registros'], tamano=snapshot['bytes'],
+    ), True
+
+
+def snapshot_en(paciente_id, fecha):
+    """Último snapshot del paciente tomado hasta `fecha`, o None"""
+    return SnapshotPaciente.objects.filter(paciente_id=paciente_id, fecha__lte=fecha).order_by('-fecha').first()
+
+
+class SnapshotNoDisponible(Exception):
+    """El snapshot está registrado pero su archivo no está en SNAPSHOT_DIR"""
+
+    def __init__(self, hash_value):
+        self.hash_value = hash_value
+        super().__init__(f'No se encontró el archivo del snapshot {hash_value} en {directorio()}')
+
+
+def leer(hash_value):
+    """
+    ((orden de sección, id), sección, datos) de cada línea del snapshot; vacío
+    si no hay snapshot. Lanza SnapshotNoDisponible si falta su archivo.
+    """
+    if not hash_value:
+        return
+    try:
+        archivo = gzip.open(ruta_contenido(hash_value), 'rb')
+    except FileNotFoundError:
+        raise SnapshotNoDisponible(hash_value) from None
+    with archivo:
+        for linea in archivo:
+            entrada = json.loads(linea)
+            seccion, datos = entrada['seccion'], entrada['datos']
+            yield (ORDEN_SECCIONES[seccion], datos['id']), seccion, datos
+
+
+def diferencias(hash_antes, hash_despues):
+    """
+    Registros agregados, modificados y eliminados entre dos snapshots, en
+    orden de sección e id. Recorre cada archivo una vez (merge de dos listas
+    ordenadas) y solo tiene en memoria la línea actual de cada lado.
+    """
+    if hash_antes == hash_despues:
+        return
+    fin = ((float('inf'), 0), None, None)
+    antes, despues = leer(hash_antes), leer(hash_despues)
+    actual_a, actual_d = next(antes, fin), next(despues, fin)
+    while actual_a is not fin or actual_d is not fin:
+        clave_a, seccion_a, datos_a = actual_a
+        clave_d, seccion_d, datos_d = actual_d
+        if clave_a < clave_d:
+            yield {'tipo': 'eliminado', 'seccion': seccion_a, 'id': datos_a['id'], 'campos': {}}
+            actual_a = next(antes, fin)
+        elif clave_d < clave_a:
+            yield {'tipo': 'agregado', 'seccion': seccion_d, 'id': datos_d['id'], 'campos': {}}
+            actual_d = next(despues, fin)
+        else:
+            if datos_a != datos_d:
+                campos_cambiados = {
+                    campo: (datos_a.get(campo), datos_d.get(campo))
+                    for campo in sorted(datos_a.keys() | datos_d.keys())
+                    if datos_a.get(campo) != datos_d.get(campo)
+                }
+                yield {'tipo': 'modificado', 'seccion': seccion_d, 'id': datos_d['id'], 'campos': campos_cambiados}
+            actual_a, actual_d = next(antes, fin), next(despues, fin)
+
+
+def parse_fecha(valor):
+    """Fecha y hora (o solo fecha, a las 00:00) en la zona del proyecto; None si no es válida"""
+    fecha = parse_datetime(valor or '')
+    if fecha is None:
+        dia = parse_date(valor or '')
+        if dia is None:
+            return None
+        fecha = datetime.datetime.combine(dia, datetime.time.min)
+    return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+
+
+def cambios_entre(paciente_id, desde, hasta):
+    """
+    (snapshot en `desde`, snapshot en `hasta`, cambios); sin snapshot previo
+    todo figura como agregado. Lanza SnapshotNoDisponible si falta un archivo.
+    """
+    inicial = snapshot_en(paciente_id, desde)
+    final = snapshot_en(paciente_id, hasta)
+    cambios = diferencias(inicial and inicial.hash_value, final and final.hash_value)
+    return inicial, final, list(cambios)
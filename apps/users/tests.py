@@ -1,3 +1,716 @@
-from django.test import TestCase
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.testing import HospitalTestCase, mock_blockchain
+
+from . import agenda, fhir, secciones, snapshots, views
+from .blockchain_manager import BlockchainManager
+from .models import (
+    AccesoBlockchain, Alergia, BlockchainHash, CondicionMedica, DisponibilidadProfesional, Paciente,
+    SnapshotPaciente, Turno,
+)
+
+
+class UsersViewsQueryBudgetTests(HospitalTestCase):
+    """Presupuestos de consultas de las vistas de pacientes y profesionales"""
+
+    def test_user_list(self):
+        self.login(self.profesional.user)
+        self.assertQueryBudget(reverse('users:user_list'))
+
+    def test_user_list_json(self):
+        self.login(self.profesional.user)
+        self.assertQueryBudget(reverse('users:user_list') + '?format=json&sort=-cedula')
+
+    @mock.patch('apps.users.views.USER_LIST_PAGE_SIZE', 5)
+    def test_user_list_recorre_todas_las_paginas(self):
+        self.login(self.profesional.user)
+        vistos = []
+        params = {'format': 'json', 'sort': 'usuario'}
+        while True:
+            data = self.client.get(reverse('users:user_list'), params).json()
+            vistos.extend(row['usuario'] for row in data['results'])
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(len(vistos), len(self.data['pacientes']))
+        self.assertEqual(vistos, sorted(vistos))
+
+    def test_user_list_cursor_invalido(self):
+        self.login(self.profesional.user)
+        url = reverse('users:user_list')
+        for sort, valor in (('registro', 'abc'), ('registro', True), ('registro', 2 ** 70), ('cedula', 5), ('usuario', [1])):
+            with self.subTest(sort=sort, valor=valor):
+                cursor = views._encode_cursor(valor)
+                response = self.client.get(url, {'format': 'json', 'sort': sort, 'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(self.client.get(url, {'sort': sort, 'cursor': cursor}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'format': 'json', 'cursor': 'no-es-base64!'}).status_code, 400)
+
+    def test_perfil_paciente_propio(self):
+        self.login(self.paciente.user)
+        self.assertQueryBudget(reverse('users:mi_perfil'))
+
+    def test_perfil_paciente_profesional(self):
+        self.login(self.profesional.user)
+        session = self.client.session
+        session[f'verified_paciente_{self.paciente.id}'] = True
+        session.save()
+        self.assertQueryBudget(reverse('users:perfil_paciente', args=[self.paciente.id]))
+
+    def test_panel_profesional(self):
+        self.login(self.profesional.user)
+        self.assertQueryBudget(reverse('users:panel_profesional'))
+
+    def test_buscar_pacientes(self):
+        self.login(self.profesional.user)
+        self.assertQueryBudget(reverse('users:buscar_pacientes') + '?nombre=Nombre1')
+
+    def test_patient_blockchain_hashes(self):
+        self.login(self.profesional.user)
+        self.assertQueryBudget(reverse('users:patient_blockchain_hashes', args=[self.paciente.id]))
+
+    def test_hash_detail(self):
+        self.login(self.profesional.user)
+        genesis = BlockchainHash.objects.get(paciente=self.paciente, categoria='genesis')
+        self.assertQueryBudget(reverse('users:hash_detail', args=[genesis.id]))
+
+    def test_ver_registros(self):
+        self.login(self.profesional.user)
+        registros = [
+            ('users:ver_alergia', self.paciente.alergias.first()),
+            ('users:ver_condicion', self.paciente.condiciones.first()),
+            ('users:ver_tratamiento', self.paciente.tratamientos.first()),
+            ('users:ver_prueba_laboratorio', self.paciente.pruebas.first()),
+            ('users:ver_cirugia', self.paciente.cirugias.first()),
+        ]
+        for url_name, registro in registros:
+            with self.subTest(url_name):
+                self.assertQueryBudget(reverse(url_name, args=[self.paciente.id, registro.id]))
+
+
+class PatientHashChainTests(HospitalTestCase):
+    """Verificación de la cadena de hashes del historial del paciente"""
+
+    def test_cadena_valida(self):
+        resultado = BlockchainManager.verify_patient_chain(self.paciente)
+        self.assertTrue(resultado['valid'])
+        self.assertEqual(resultado['length'], self.paciente.blockchain_hashes.count())
+        self.assertTrue(BlockchainManager.verify_patient_chain_head(self.paciente))
+
+    def test_detecta_registro_eliminado(self):
+        self.paciente.blockchain_hashes.filter(categoria='alergia').order_by('id').first().delete()
+        self.assertFalse(BlockchainManager.verify_patient_chain(self.paciente)['valid'])
+
+    def test_detecta_truncamiento(self):
+        self.paciente.blockchain_hashes.order_by('-id').first().delete()
+        self.assertFalse(BlockchainManager.verify_patient_chain_head(self.paciente))
+
+    def test_head_detecta_eslabon_intermedio_faltante(self):
+        # La longitud guardada ya no coincide con la cantidad de eslabones
+        self.paciente.blockchain_hashes.order_by('id')[1].delete()
+        self.assertFalse(BlockchainManager.verify_patient_chain_head(self.paciente))
+
+    def test_head_en_consultas_constantes(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertTrue(BlockchainManager.verify_patient_chain_head(self.paciente))
+        self.assertEqual(len(consultas), 2)
+
+    def test_save_de_copia_vieja_no_pisa_la_cadena(self):
+        vieja = Paciente.objects.get(pk=self.paciente.pk)
+        with mock_blockchain():
+            Alergia.objects.create(paciente=self.paciente, sustancia='Abejas', fecha_diagnostico=date.today())
+        vieja.ciudad = 'Quito'
+        vieja.save()
+        guardado = Paciente.objects.get(pk=self.paciente.pk)
+        self.assertEqual(guardado.ciudad, 'Quito')
+        self.assertGreater(guardado.chain_length, vieja.chain_length)
+        self.assertTrue(BlockchainManager.verify_patient_chain(guardado)['valid'])
+        self.assertTrue(BlockchainManager.verify_patient_chain_head(guardado))
+
+    def test_migracion_encadena_por_lotes(self):
+        migracion = importlib.import_module('apps.users.migrations.0006_blockchain_hash_chain')
+        BlockchainHash.objects.update(prev_hash='')
+        Paciente.objects.update(chain_head='', chain_length=0)
+        with CaptureQueriesContext(connection) as consultas:
+            migracion.encadenar_hashes_existentes(django_apps, None)
+        updates = [q for q in consultas.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertLess(len(updates), BlockchainHash.objects.count() // 10)
+        self.paciente.refresh_from_db()
+        self.assertTrue(BlockchainManager.verify_patient_chain(self.paciente)['valid'])
+
+
+class AgendaTurnosTests(HospitalTestCase):
+    """Motor de slots: disponibilidad, solapamientos y reservas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        DisponibilidadProfesional.objects.create(
+            profesional=cls.profesional, dia_semana=0, hora_inicio=time(8), hora_fin=time(12), duracion_turno=30,
+        )
+        hoy = timezone.localdate()
+        # Un lunes lejos de los turnos sembrados
+        cls.lunes = hoy + timedelta(days=21 + (7 - hoy.weekday()) % 7)
+
+    def a_las(self, hora, minuto=0):
+        return timezone.make_aware(datetime.combine(self.lunes, time(hora, minuto)))
+
+    def test_generar_slots_excluye_turnos_reservados(self):
+        slots = agenda.generar_slots(self.profesional, self.lunes, dias=7)
+        self.assertEqual(len(slots), 8)
+        agenda.reservar_turno(self.profesional, self.paciente, self.a_las(9), 'Control', duracion_minutos=60)
+        inicios = [inicio for inicio, _ in agenda.generar_slots(self.profesional, self.lunes, dias=7)]
+        self.assertEqual(len(inicios), 6)
+        self.assertNotIn(self.a_las(9, 30), inicios)
+
+    def test_reservar_detecta_solapamientos(self):
+        agenda.reservar_turno(self.profesional, self.paciente, self.a_las(9), 'Control', duracion_minutos=60)
+        for hora, minuto in ((9, 0), (9, 30), (8, 30)):
+            with self.assertRaises(agenda.TurnoNoDisponible):
+                agenda.reservar_turno(self.profesional, self.paciente, self.a_las(hora, minuto), 'Control',
+                                      duracion_minutos=60 if (hora, minuto) == (8, 30) else None)
+        agenda.reservar_turno(self.profesional, self.paciente, self.a_las(10), 'Control')
+
+    def test_reservar_fuera_de_disponibilidad(self):
+        with self.assertRaises(agenda.TurnoNoDisponible):
+            agenda.reservar_turno(self.profesional, self.paciente, self.a_las(11, 45), 'Control')
+        with self.assertRaises(agenda.TurnoNoDisponible):
+            agenda.reservar_turno(self.profesional, self.paciente, self.a_las(14), 'Control')
+
+    def test_reserva_masiva(self):
+        pacientes = self.data['pacientes']
+        solicitudes = [
+            {'paciente_id': pacientes[i].pk, 'fecha_hora': self.a_las(8, 30 * i), 'motivo': 'Control'}
+            for i in range(2)
+        ] + [
+            {'paciente_id': pacientes[2].pk, 'fecha_hora': self.a_las(8), 'motivo': 'Duplicado'},
+            {'paciente_id': pacientes[3].pk, 'fecha_hora': self.a_las(13), 'motivo': 'Fuera de horario'},
+        ]
+        creados, rechazados = agenda.reservar_turnos(self.profesional, solicitudes)
+        self.assertEqual(len(creados), 2)
+        self.assertEqual([indice for indice, _ in rechazados], [2, 3])
+
+    def test_reserva_masiva_valida_duracion(self):
+        solicitudes = [
+            {'paciente_id': self.paciente.pk, 'fecha_hora': self.a_las(10), 'motivo': 'Control',
+             'duracion_minutos': duracion}
+            for duracion in (-30, 0, agenda.DURACION_MAXIMA_MINUTOS + 1, '30', True)
+        ]
+        creados, rechazados = agenda.reservar_turnos(self.profesional, solicitudes)
+        self.assertEqual(creados, [])
+        self.assertEqual(rechazados, [(i, 'Duración fuera de rango') for i in range(len(solicitudes))])
+
+    def test_reserva_masiva_valida_pacientes_y_horarios_pasados(self):
+        pasado = timezone.make_aware(datetime.combine(self.lunes - timedelta(weeks=5), time(9)))
+        solicitudes = [
+            {'paciente_id': self.paciente.pk, 'fecha_hora': self.a_las(9), 'motivo': 'Control'},
+            {'paciente_id': Paciente.objects.order_by('-pk').first().pk + 1000, 'fecha_hora': self.a_las(10)},
+            {'paciente_id': self.paciente.pk, 'fecha_hora': pasado, 'motivo': 'Control'},
+        ]
+        with CaptureQueriesContext(connection) as consultas:
+            creados, rechazados = agenda.reservar_turnos(self.profesional, solicitudes)
+        self.assertEqual(len(creados), 1)
+        self.assertEqual(rechazados, [(1, 'Paciente inexistente'), (2, 'Horario pasado')])
+        self.assertEqual(sum('users_paciente' in q['sql'] for q in consultas.captured_queries), 1)
+        with self.assertRaises(agenda.TurnoNoDisponible):
+            agenda.reservar_turno(self.profesional, self.paciente, pasado, 'Control')
+
+    def test_duracion_limitada_en_el_modelo(self):
+        turno = Turno(paciente=self.paciente, profesional=self.profesional, fecha_hora=self.a_las(10),
+                      motivo='Control', duracion_minutos=agenda.DURACION_MAXIMA_MINUTOS + 1)
+        with self.assertRaises(ValidationError):
+            turno.full_clean()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Turno.objects.bulk_create([turno])
+
+    def test_slots_profesional(self):
+        self.login(self.paciente.user)
+        response = self.assertQueryBudget(
+            reverse('users:slots_profesional', args=[self.profesional.pk]) + f'?desde={self.lunes}&dias=7'
+        )
+        self.assertEqual(len(response.json()['slots']), 8)
+
+    def test_reservar_turno_endpoint(self):
+        self.login(self.paciente.user)
+        url = reverse('users:reservar_turno', args=[self.profesional.pk])
+        datos = {'fecha_hora': self.a_las(10).isoformat(), 'motivo': 'Consulta'}
+        self.assertEqual(self.client.post(url, datos).status_code, 201)
+        self.assertEqual(self.client.post(url, datos).status_code, 409)
+        self.assertTrue(Turno.objects.filter(paciente=self.paciente, fecha_hora=self.a_las(10)).exists())
+
+    def test_reservar_turnos_endpoint_requiere_profesional(self):
+        url = reverse('users:reservar_turnos', args=[self.profesional.pk])
+        cuerpo = json.dumps({'turnos': [
+            {'paciente_id': self.paciente.pk, 'fecha_hora': self.a_las(11).isoformat(), 'motivo': 'Control'},
+        ]})
+        self.login(self.paciente.user)
+        self.assertEqual(self.client.post(url, cuerpo, content_type='application/json').status_code, 403)
+        self.login(self.profesional.user)
+        response = self.client.post(url, cuerpo, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['creados']), 1)
+
+
+class AgendaPanelProfesionalTests(HospitalTestCase):
+    """Agenda del panel del profesional: rangos por día, caché e invalidación"""
+
+    def test_turnos_de_hoy_por_rango(self):
+        inicio, fin = agenda.rango_dia(timezone.localdate())
+        esperados = list(Turno.objects.filter(
+            profesional=self.profesional, fecha_hora__gte=inicio, fecha_hora__lt=fin,
+            estado__in=agenda.ESTADOS_AGENDA,
+        ).order_by('fecha_hora').values_list('id', flat=True))
+        datos = agenda.construir_agenda(self.profesional.pk)
+        self.assertTrue(esperados)
+        self.assertEqual([turno['id'] for turno in datos['turnos_hoy']], esperados)
+        self.assertTrue(all(turno['fecha_hora'] >= fin for turno in datos['turnos_proximos']))
+
+    def test_pacientes_recientes_son_del_profesional(self):
+        datos = agenda.construir_agenda(self.profesional.pk)
+        propios = set(Turno.objects.filter(profesional=self.profesional).values_list('paciente_id', flat=True))
+        self.assertTrue(datos['pacientes_recientes'])
+        self.assertTrue({p['id'] for p in datos['pacientes_recientes']} <= propios)
+
+    def test_agenda_cacheada_se_invalida_al_cambiar_un_turno(self):
+        agenda.agenda_profesional(self.profesional.pk)
+        with self.assertNumQueries(0):
+            agenda.agenda_profesional(self.profesional.pk)
+
+        inicio, _ = agenda.rango_dia(timezone.localdate())
+        with self.captureOnCommitCallbacks(execute=True):
+            turno = Turno.objects.create(paciente=self.paciente, profesional=self.profesional,
+                                         fecha_hora=inicio + timedelta(hours=23), motivo='Urgencia')
+        ids = [t['id'] for t in agenda.agenda_profesional(self.profesional.pk)['turnos_hoy']]
+        self.assertIn(turno.id, ids)
+
+
+class AgendaFeedTests(HospitalTestCase):
+    """Feed iCalendar/JSON de la agenda con validación condicional"""
+
+    def url(self, **params):
+        url = reverse('users:agenda_feed', args=[self.profesional.pk])
+        return url + ('?' + '&'.join(f'{k}={v}' for k, v in params.items()) if params else '')
+
+    def test_ical_y_304(self):
+        self.login(self.profesional.user)
+        response = self.assertQueryBudget(self.url())
+        cuerpo = b''.join(response.streaming_content).decode()
+        self.assertTrue(cuerpo.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(cuerpo.count('BEGIN:VEVENT'), agenda._turnos_feed(self.profesional.pk).count())
+
+        etag = response['ETag']
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        turno = Turno.objects.filter(profesional=self.profesional).first()
+        turno.estado = 'cancelado'
+        turno.save()
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_json_con_token(self):
+        token = agenda.token_feed(self.profesional.pk)
+        response = self.client.get(self.url(formato='json', token=token))
+        datos = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(datos), agenda._turnos_feed(self.profesional.pk).count())
+        self.assertEqual(datos, sorted(datos, key=lambda t: t['inicio']))
+
+    def test_acceso_denegado(self):
+        otro = self.data['profesionales'][1]
+        self.assertEqual(self.client.get(self.url(token=agenda.token_feed(otro.pk))).status_code, 404)
+        self.login(self.paciente.user)
+        self.assertEqual(self.client.get(self.url()).status_code, 404)
+
+    def test_token_vencido(self):
+        token = agenda.token_feed(self.profesional.pk)
+        with override_settings(AGENDA_FEED_TOKEN_MAX_AGE=-1):
+            self.assertEqual(self.client.get(self.url(token=token)).status_code, 404)
+
+    def test_etag_cambia_con_el_dia(self):
+        self.login(self.profesional.user)
+        etag = self.client.get(self.url())['ETag']
+        manana = timezone.localdate() + timedelta(days=1)
+        with mock.patch.object(agenda.timezone, 'localdate', return_value=manana):
+            response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_lineas_plegadas(self):
+        linea = agenda._ical_linea('DESCRIPTION:' + 'ñ' * 100)
+        self.assertTrue(all(len(parte.encode()) <= 75 for parte in linea.rstrip('\r\n').split('\r\n')))
+
+
+class ConditionalGetTests(HospitalTestCase):
+    """ETag de las vistas del paciente: 304 sin reconstruir el contexto"""
+
+    def assertNoModificado(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as completo:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as condicional:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertLess(len(condicional), len(completo))
+        return etag
+
+    def test_etag_cambia_con_el_token_csrf(self):
+        self.login(self.paciente.user)
+        url = reverse('users:mi_perfil')
+        etag = self.client.get(url)['ETag']
+        # Un secreto CSRF nuevo (cookie borrada o rotada) invalida la copia con el token viejo
+        del self.client.cookies[settings.CSRF_COOKIE_NAME]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_perfil_paciente_propio(self):
+        self.login(self.paciente.user)
+        url = reverse('users:mi_perfil')
+        etag = self.assertNoModificado(url)
+
+        with mock_blockchain():
+            Alergia.objects.create(paciente=self.paciente, sustancia='Polen', fecha_diagnostico=date.today())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_distinto_por_usuario(self):
+        url = reverse('users:patient_blockchain_hashes', args=[self.paciente.pk])
+        self.login(self.profesional.user)
+        etag = self.assertNoModificado(url)
+        self.login(self.data['profesionales'][1].user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_hash_detail_registra_acceso_aunque_responda_304(self):
+        self.login(self.profesional.user)
+        hash_record = BlockchainHash.objects.filter(paciente=self.paciente).exclude(categoria='genesis').first()
+        url = reverse('users:hash_detail', args=[hash_record.pk])
+        self.assertNoModificado(url)
+        self.assertEqual(AccesoBlockchain.objects.filter(hash_record=hash_record).count(), 3)
+
+        response = self.client.get(reverse('users:hash_accesos', args=[hash_record.pk]))
+        self.assertContains(response, self.profesional.get_full_name(), count=3)
+
+
+class FragmentCacheTests(HospitalTestCase):
+    """Fragmentos cacheados del perfil del paciente, versionados por sección"""
+
+    def test_fragmentos_evitan_consultas(self):
+        self.login(self.paciente.user)
+        url = reverse('users:mi_perfil')
+        with CaptureQueriesContext(connection) as frio:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as caliente:
+            response = self.client.get(url)
+        self.assertLess(len(caliente), len(frio))
+        self.assertContains(response, f'Registro #{self.paciente.alergias.first().id}')
+
+    def test_alta_invalida_solo_su_seccion(self):
+        self.login(self.paciente.user)
+        url = reverse('users:mi_perfil')
+        self.client.get(url)
+        self.paciente.refresh_from_db()
+        antes = secciones.versiones_secciones(self.paciente)
+
+        with self.captureOnCommitCallbacks(execute=True), mock_blockchain():
+            alergia = Alergia.objects.create(paciente=self.paciente, sustancia='Polen', fecha_diagnostico=date.today())
+        self.paciente.refresh_from_db()
+        despues = secciones.versiones_secciones(self.paciente)
+
+        self.assertGreater(despues['alergias'], antes['alergias'])
+        self.assertGreater(despues['hashes'], antes['hashes'])
+        self.assertEqual(despues['condiciones'], antes['condiciones'])
+        self.assertContains(self.client.get(url), f'Registro #{alergia.id}')
+
+    def test_save_de_copia_vieja_no_retrocede_versiones(self):
+        vieja = Paciente.objects.get(pk=self.paciente.pk)
+        with self.captureOnCommitCallbacks(execute=True), mock_blockchain():
+            Alergia.objects.create(paciente=self.paciente, sustancia='Níquel', fecha_diagnostico=date.today())
+        actual = Paciente.objects.get(pk=self.paciente.pk)
+        vieja.telefono = '555-0101'
+        vieja.save()
+        guardada = Paciente.objects.get(pk=self.paciente.pk)
+        self.assertEqual(guardada.telefono, '555-0101')
+        # El save cuenta como cambio del paciente: la versión sigue subiendo
+        self.assertEqual(guardada.version, actual.version + 1)
+        self.assertEqual(guardada.version_alergias, actual.version_alergias)
+        self.assertGreater(guardada.version_alergias, vieja.version_alergias)
+
+    def test_versiones_no_dependen_del_cache(self):
+        with self.captureOnCommitCallbacks(execute=True), mock_blockchain():
+            Alergia.objects.create(paciente=self.paciente, sustancia='Látex', fecha_diagnostico=date.today())
+        self.paciente.refresh_from_db()
+        antes = secciones.versiones_secciones(self.paciente)
+        # Otro proceso (o un caché vaciado) lee las mismas versiones de la base
+        cache.clear()
+        self.assertEqual(secciones.versiones_secciones(Paciente.objects.get(pk=self.paciente.pk)), antes)
+        # El hash del alta es el último cambio del paciente
+        self.assertEqual(antes['hashes'], self.paciente.version)
+
+
+class GenesisHashTests(HospitalTestCase):
+    """Verificación del acceso al perfil con el hash génesis desnormalizado"""
+
+    def test_verificacion_sin_consultar_hashes(self):
+        genesis = BlockchainHash.objects.get(paciente=self.paciente, categoria='genesis').hash_value
+        self.assertEqual(self.paciente.genesis_hash, genesis)
+        self.login(self.profesional.user)
+        url = reverse('users:perfil_paciente', args=[self.paciente.id])
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertContains(self.client.get(url), genesis[:-8])
+            response = self.client.post(url, {'password': genesis[-8:]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.client.session[f'verified_paciente_{self.paciente.id}'])
+        self.assertFalse([q for q in consultas.captured_queries if 'users_blockchainhash' in q['sql']])
+
+    def test_backfill(self):
+        Paciente.objects.filter(pk=self.paciente.pk).update(genesis_hash='')
+        self.assertEqual(BlockchainManager.backfill_genesis_hash(), 1)
+        self.paciente.refresh_from_db()
+        self.assertEqual(
+            self.paciente.genesis_hash,
+            BlockchainHash.objects.get(paciente=self.paciente, categoria='genesis').hash_value,
+        )
+
+
+class HistorialAccesosTests(HospitalTestCase):
+    """Historial de accesos paginado por cursor con contador desnormalizado"""
+
+    def setUp(self):
+        super().setUp()
+        self.hash_record = BlockchainHash.objects.filter(paciente=self.paciente).exclude(categoria='genesis').first()
+        for _ in range(5):
+            BlockchainManager.registrar_acceso(self.hash_record.pk, self.profesional)
+
+    def test_contador_de_accesos(self):
+        self.hash_record.refresh_from_db()
+        self.assertEqual(self.hash_record.accesos_count, 5)
+        AccesoBlockchain.objects.filter(hash_record=self.hash_record).first().delete()
+        self.hash_record.refresh_from_db()
+        self.assertEqual(self.hash_record.accesos_count, 4)
+
+    def test_historial_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            history = BlockchainManager.get_access_history(self.hash_record, limite=3)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history[0]['usuario'], self.profesional.get_full_name())
+        self.assertEqual(history[0]['especialidad'], self.profesional.get_especialidad_display())
+
+    def test_paginas_sin_repetir_accesos(self):
+        self.login(self.profesional.user)
+        url = reverse('users:hash_accesos', args=[self.hash_record.pk])
+        with self.settings(ACCESOS_POR_PAGINA=2):
+            vistos = []
+            response = self.client.get(url)
+            self.assertContains(response, '5 accesos registrados')
+            while True:
+                vistos += [acceso['id'] for acceso in response.context['access_history']]
+                siguiente = response.context['siguiente']
+                if siguiente is None:
+                    break
+                response = self.client.get(url, {'antes': siguiente})
+                self.assertNotContains(response, 'accesos-filas')
+        esperados = AccesoBlockchain.objects.filter(hash_record=self.hash_record).order_by('-fecha_acceso', '-id')
+        self.assertEqual(vistos, list(esperados.values_list('id', flat=True)))
+
+    def test_cursor_invalido(self):
+        self.login(self.profesional.user)
+        url = reverse('users:hash_accesos', args=[self.hash_record.pk])
+        self.assertEqual(self.client.get(url, {'antes': 'ayer_x'}).status_code, 404)
+
+
+class FhirExportTests(HospitalTestCase):
+    """Exportación NDJSON FHIR en streaming"""
+
+    def test_una_consulta_por_tipo(self):
+        with self.assertNumQueries(len(fhir.RECURSOS)):
+            recursos = [json.loads(linea) for linea in fhir.ndjson()]
+        pacientes = [r for r in recursos if r['resourceType'] == 'Patient']
+        self.assertEqual(len(pacientes), Paciente.objects.count())
+        alergias = [r for r in recursos if r['resourceType'] == 'AllergyIntolerance']
+        self.assertEqual(len(alergias), Alergia.objects.count())
+        self.assertTrue(all(r['patient']['reference'].startswith('Patient/') for r in alergias))
+
+    def test_rangos_cubren_todos_los_pacientes(self):
+        rangos = fhir.rangos_pacientes(3)
+        ids = [
+            int(json.loads(linea)['id'])
+            for desde, hasta in rangos for linea in fhir.lineas('Patient', desde, hasta)
+        ]
+        self.assertEqual(ids, list(Paciente.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_endpoint_gzip_solo_admin(self):
+        url = reverse('users:fhir_export')
+        self.login(self.profesional.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.login(User.objects.create_superuser('admin_fhir', password='password123'))
+        response = self.client.get(url, {'_type': 'Patient'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lineas = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lineas), Paciente.objects.count())
+        self.assertEqual(self.client.get(url, {'_type': 'Encounter'}).status_code, 400)
+
+    def test_comando_por_partes(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            call_command('export_fhir', directorio, '--tipos', 'Patient,Condition', '--partes', '2', '--gzip',
+                         stdout=io.StringIO())
+            archivos = sorted(os.listdir(directorio))
+            self.assertIn('Patient.0.ndjson.gz', archivos)
+            total = 0
+            for nombre in archivos:
+                if nombre.startswith('Patient.'):
+                    with gzip.open(os.path.join(directorio, nombre), 'rt') as archivo:
+                        total += sum(1 for _ in archivo)
+        self.assertEqual(total, Paciente.objects.count())
+
+
+class SnapshotTests(HospitalTestCase):
+    """Snapshot canónico de la historia clínica en streaming"""
+
+    def test_hash_estable_y_sensible_a_cambios(self):
+        with self.assertNumQueries(1 + len(snapshots.SECCIONES_SNAPSHOT)):
+            primero = snapshots.construir(self.paciente.pk)
+        self.assertEqual(snapshots.construir(self.paciente.pk)['hash'], primero['hash'])
+
+        alergia = self.paciente.alergias.first()
+        with mock_blockchain():
+            alergia.descripcion = 'Actualizada'
+            alergia.save()
+        self.assertNotEqual(snapshots.construir(self.paciente.pk)['hash'], primero['hash'])
+
+    def test_archivo_comprimido(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'snapshot.ndjson.gz')
+            snapshot = snapshots.construir(self.paciente.pk, ruta)
+            with gzip.open(ruta, 'rb') as archivo:
+                contenido = archivo.read()
+        self.assertEqual(contenido, b''.join(snapshots.lineas(self.paciente.pk)))
+        self.assertEqual(len(contenido), snapshot['bytes'])
+        self.assertEqual(len(contenido.splitlines()), snapshot['registros'] + 1)
+
+    def test_store_on_blockchain_serializable(self):
+        with mock_blockchain() as store:
+            self.paciente.store_on_blockchain()
+        paciente_id, record = store.call_args.args
+        self.assertEqual(paciente_id, self.paciente.pk)
+        self.assertEqual(record['snapshot_hash'], snapshots.construir(self.paciente.pk)['hash'])
+        json.dumps(record)
+
+
+class SnapshotDiffTests(HospitalTestCase):
+    """Snapshots deduplicados en disco y diferencias entre fechas"""
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = self.settings(SNAPSHOT_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _archivos(self):
+        return [nombre for _, _, nombres in os.walk(snapshots.directorio()) for nombre in nombres]
+
+    def test_sin_cambios_no_duplica(self):
+        primero, creado = snapshots.tomar(self.paciente.pk)
+        self.assertTrue(creado)
+        self.assertEqual(snapshots.tomar(self.paciente.pk), (primero, False))
+        self.assertEqual(self._archivos(), [f'{primero.hash_value}.ndjson.gz'])
+
+    def test_diferencias_entre_fechas(self):
+        inicial, _ = snapshots.tomar(self.paciente.pk)
+        SnapshotPaciente.objects.filter(pk=inicial.pk).update(fecha=timezone.now() - timedelta(days=2))
+        alergia = self.paciente.alergias.order_by('pk').first()
+        with mock_blockchain():
+            alergia.descripcion = 'Actualizada'
+            alergia.save()
+            nueva = CondicionMedica.objects.create(
+                paciente=self.paciente, codigo='J45', fecha_diagnostico=date.today(),
+            )
+        self.paciente.tratamientos.order_by('pk').first().delete()
+        snapshots.tomar(self.paciente.pk)
+
+        _, _, cambios = snapshots.cambios_entre(self.paciente.pk, timezone.now() - timedelta(days=1), timezone.now())
+        resumen = {(c['tipo'], c['seccion'], c['id']) for c in cambios}
+        self.assertIn(('modificado', 'alergias', alergia.pk), resumen)
+        self.assertIn(('agregado', 'condiciones', nueva.pk), resumen)
+        self.assertEqual([c['tipo'] for c in cambios if c['seccion'] == 'tratamientos'], ['eliminado'])
+        modificada = next(c for c in cambios if c['id'] == alergia.pk and c['seccion'] == 'alergias')
+        self.assertEqual(modificada['campos']['descripcion'][1], 'Actualizada')
+
+        self.login(self.profesional.user)
+        url = reverse('users:historial_cambios', args=[self.paciente.pk])
+        desde = {'desde': (timezone.now() - timedelta(days=1)).isoformat()}
+        # Sin verificar el hash génesis se redirige al formulario del perfil
+        self.assertRedirects(self.client.get(url, desde),
+                             reverse('users:perfil_paciente', args=[self.paciente.pk]), fetch_redirect_response=False)
+        sesion = self.client.session
+        sesion[f'verified_paciente_{self.paciente.pk}'] = True
+        sesion.save()
+        accesos = AccesoBlockchain.objects.filter(paciente=self.paciente, profesional=self.profesional).count()
+        self.assertContains(self.client.get(url, desde), 'Actualizada')
+        self.assertEqual(
+            AccesoBlockchain.objects.filter(paciente=self.paciente, profesional=self.profesional).count(), accesos + 1,
+        )
+
+    def test_acceso_de_administrador_auditado(self):
+        admin = User.objects.create_superuser('admin_historial', password='password123', first_name='Ana')
+        self.login(admin)
+        sesion = self.client.session
+        sesion[f'verified_paciente_{self.paciente.pk}'] = True
+        sesion.save()
+        self.assertEqual(self.client.get(reverse('users:historial_cambios', args=[self.paciente.pk])).status_code, 200)
+
+        acceso = AccesoBlockchain.objects.get(usuario=admin)
+        self.assertIsNone(acceso.profesional)
+        self.assertTrue(acceso.es_administrador)
+        historial = BlockchainManager.get_access_history(acceso.hash_record)
+        entrada = next(h for h in historial if h['id'] == acceso.id)
+        self.assertEqual((entrada['tipo_usuario'], entrada['usuario']), ('Administrador', 'Ana'))
+
+    def test_archivo_faltante(self):
+        snapshot, _ = snapshots.tomar(self.paciente.pk)
+        os.remove(snapshots.ruta_contenido(snapshot.hash_value))
+        with self.assertRaises(snapshots.SnapshotNoDisponible):
+            snapshots.cambios_entre(self.paciente.pk, timezone.now() - timedelta(days=1), timezone.now())
+        with self.assertRaisesMessage(CommandError, snapshot.hash_value):
+            call_command('diff_snapshots', self.paciente.pk, '2000-01-01', stdout=io.StringIO())
+
+        self.login(self.profesional.user)
+        sesion = self.client.session
+        sesion[f'verified_paciente_{self.paciente.pk}'] = True
+        sesion.save()
+        response = self.client.get(reverse('users:historial_cambios', args=[self.paciente.pk]))
+        self.assertContains(response, 'falta el archivo del snapshot')
+
+    def test_comandos(self):
+        salida = io.StringIO()
+        call_command('take_snapshots', self.paciente.pk, stdout=salida)
+        self.assertIn('Snapshots nuevos: 1', salida.getvalue())
+        salida = io.StringIO()
+        call_command('diff_snapshots', self.paciente.pk, '2000-01-01', stdout=salida)
+        self.assertIn('agregado    alergias', salida.getvalue())
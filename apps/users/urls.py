@@ -32,8 +32,19 @@ urlpatterns = [
     # Blockchain integration
     path('blockchain-status/', views.blockchain_status, name='blockchain_status'),
     path('hash/<int:hash_id>/', views.hash_detail, name='hash_detail'),
+    path('hash/<int:hash_id>/accesos/', views.hash_accesos, name='hash_accesos'),
     path('hash/value/<str:hash_value>/', views.hash_detail_by_value, name='hash_detail_by_value'),
     path('paciente/<int:paciente_id>/hashes/', views.patient_blockchain_hashes, name='patient_blockchain_hashes'),
+    path('paciente/<int:paciente_id>/cambios/', views.historial_cambios, name='historial_cambios'),
+    
+    # Agenda de turnos
+    path('profesional/<int:profesional_id>/slots/', views.slots_profesional, name='slots_profesional'),
+    path('profesional/<int:profesional_id>/reservar/', views.reservar_turno, name='reservar_turno'),
+    path('profesional/<int:profesional_id>/reservar-lote/', views.reservar_turnos, name='reservar_turnos'),
+    path('profesional/<int:profesional_id>/agenda.ics', views.agenda_feed, name='agenda_feed'),
+
+    # Exportación masiva FHIR (NDJSON)
+    path('fhir/$export', views.fhir_export, name='fhir_export'),
     
     # Registration views
     path('registro/paciente/', views.registro_paciente, name='registro_paciente'),
@@ -1,15 +1,33 @@
 # imports
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.contrib.auth.models import User, Group
 from django.shortcuts import render, get_object_or_404, redirect
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth import login
-from django.db.models import Q
+from django.db.models import Count, Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.text import compress_sequence
+from django.views.decorators.http import condition, require_http_methods
+import hashlib
+import json
+from datetime import timedelta
 
 from .forms import BuscarPacienteForm, PacienteForm, PacienteRegistroForm, ProfesionalForm, ProfesionalRegistroForm, AlergiaForm, CondicionMedicaForm, TratamientoForm, PruebaLaboratorioForm, CirugiaForm
 from .models import Paciente, Profesional, BlockchainHash, AccesoBlockchain, Alergia, CondicionMedica, Tratamiento, PruebaLaboratorio, Cirugia
 from .blockchain_manager import BlockchainManager
+from . import agenda, fhir, secciones, snapshots
+from core.counters import get_counters
+from core.roles import get_user_role, role_version
 
 
 def admin_index(request):
@@ -18,15 +36,13 @@ def admin_index(request):
         from django.http import HttpResponseForbidden
         return HttpResponseForbidden("Acceso denegado")
     
-    # Estadísticas
-    total_pacientes = Paciente.objects.count()
-    total_profesionales = Profesional.objects.count()
-    total_hashes = BlockchainHash.objects.count() if hasattr(BlockchainHash, '_meta') else 0
+    # Estadísticas (contadores materializados, ver core.counters)
+    totales = get_counters('pacientes', 'profesionales', 'hashes')
     
     context = {
-        'total_pacientes': total_pacientes,
-        'total_profesionales': total_profesionales,
-        'total_hashes': total_hashes,
+        'total_pacientes': totales['pacientes'],
+        'total_profesionales': totales['profesionales'],
+        'total_hashes': totales['hashes'],
     }
     
     return render(request, 'admin/index.html', context)
@@ -37,19 +53,152 @@ def is_superuser(user):
 # Restricción: solo admin puede acceder
 def admin_required(user):
     # Allow staff/superuser or users linked to a Profesional profile
+    return user.is_staff or user.is_superuser or get_user_role(user).is_profesional
+
+# Columnas ordenables de la lista de pacientes. Cada una es única e indexada
+# (pk, Paciente.cedula y auth_user.username), por lo que el valor de la
+# columna alcanza como cursor de la paginación por keyset.
+USER_LIST_ORDERINGS = {
+    'registro': 'id',
+    'cedula': 'cedula',
+    'usuario': 'user__username',
+}
+# Tipo del valor del cursor de cada columna; un cursor de otro tipo se rechaza
+USER_LIST_CURSOR_TYPES = {
+    'id': int,
+    'cedula': str,
+    'user__username': str,
+}
+USER_LIST_PAGE_SIZE = 50
+USER_LIST_FIELDS = [
+    'id', 'cedula', 'telefono',
+    'user__username', 'user__email', 'user__is_superuser', 'user__is_staff',
+    'user__is_active', 'user__last_login', 'user__date_joined',
+]
+
+
+def _encode_cursor(value):
+    return urlsafe_base64_encode(json.dumps(value).encode('utf-8'))
+
+
+def _decode_cursor(cursor, tipo):
+    """Valor del cursor si es del tipo de la columna; None si no es válido"""
     try:
-        is_profesional = hasattr(user, 'profesional') and user.profesional is not None
-    except Exception:
-        is_profesional = False
-    return user.is_staff or user.is_superuser or is_profesional
+        value = json.loads(urlsafe_base64_decode(cursor).decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    # bool es subclase de int: true/false no son ids
+    if not isinstance(value, tipo) or isinstance(value, bool):
+        return None
+    if tipo is int and not -2 ** 63 <= value < 2 ** 63:
+        return None
+    return value
+
 
 @user_passes_test(admin_required)
 def user_list(request):
-    # Mostrar solo los pacientes (relacionados con User)
-    pacientes = Paciente.objects.select_related('user').all()
-    return render(request, "users/lista_pacientes.html", {"pacientes": pacientes})
+    """
+    Lista de pacientes paginada por keyset: cada página filtra a partir del
+    último valor visto de la columna de orden, por lo que el costo no depende
+    de cuántas páginas se hayan recorrido. Con `?format=json` devuelve la página
+    para la tabla con scroll infinito. Un cursor que no corresponde al tipo de la
+    columna responde 400 en JSON y muestra la primera página en HTML.
+    """
+    sort = request.GET.get('sort', 'registro')
+    descending = sort.startswith('-')
+    sort_key = sort.lstrip('-')
+    if sort_key not in USER_LIST_ORDERINGS:
+        sort_key, descending = 'registro', False
+    field = USER_LIST_ORDERINGS[sort_key]
+
+    pacientes = Paciente.objects.select_related('user').only(*USER_LIST_FIELDS)
+    raw_cursor = request.GET.get('cursor')
+    cursor = _decode_cursor(raw_cursor, USER_LIST_CURSOR_TYPES[field]) if raw_cursor else None
+    if raw_cursor and cursor is None and request.GET.get('format') == 'json':
+        # La tabla pide páginas siguientes: un cursor ajeno a la columna es un error del cliente
+        return JsonResponse({'error': 'cursor inválido'}, status=400)
+    if cursor is not None:
+        lookup = f'{field}__lt' if descending else f'{field}__gt'
+        pacientes = pacientes.filter(**{lookup: cursor})
+    pacientes = list(pacientes.order_by(f'-{field}' if descending else field)[:USER_LIST_PAGE_SIZE + 1])
+
+    next_cursor = None
+    if len(pacientes) > USER_LIST_PAGE_SIZE:
+        pacientes = pacientes[:USER_LIST_PAGE_SIZE]
+        last = pacientes[-1]
+        next_cursor = _encode_cursor(last.user.username if sort_key == 'usuario' else getattr(last, field))
+
+    sort_param = f'-{sort_key}' if descending else sort_key
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {
+                    'id': p.id,
+                    'usuario': p.user.username,
+                    'email': p.user.email,
+                    'cedula': p.cedula,
+                    'rol': 'Administrador' if p.user.is_superuser else 'Staff' if p.user.is_staff else 'Paciente',
+                    'telefono': p.telefono,
+                    'activo': p.user.is_active,
+                    'ultima_actividad': p.user.last_login.isoformat() if p.user.last_login else None,
+                    'fecha_registro': p.user.date_joined.isoformat(),
+                    'url': reverse('users:perfil_paciente', args=[p.id]),
+                }
+                for p in pacientes
+            ],
+            'next_cursor': next_cursor,
+            'sort': sort_param,
+            'total': get_counters('pacientes')['pacientes'],
+        })
+
+    return render(request, "users/lista_pacientes.html", {
+        "pacientes": pacientes,
+        "next_cursor": next_cursor,
+        "sort": sort_param,
+        "total_pacientes": get_counters('pacientes')['pacientes'],
+    })
+
+def _huella_sesion(request):
+    """
+    Resumen del secreto CSRF y de la sesión. Los formularios de la página (el
+    de logout, al menos) llevan un token derivado del secreto: si el navegador
+    reusara una copia con otro secreto, el POST fallaría con 403.
+    """
+    get_token(request)
+    datos = f"{request.META.get('CSRF_COOKIE', '')}:{request.session.session_key or ''}"
+    return hashlib.sha256(datos.encode()).hexdigest()[:16]
+
+
+def _etag_vista(request, recurso, version):
+    """
+    ETag fuerte de una vista: versión del recurso más el usuario y la versión
+    de su rol, que cambian la barra de navegación y los permisos de la página,
+    y la huella de la sesión y del token CSRF embebido en los formularios.
+    """
+    return f'"{recurso}-v{version}-u{request.user.pk}-r{role_version(request.user)}-s{_huella_sesion(request)}"'
+
+
+def _version_paciente(paciente_id):
+    return Paciente.objects.filter(pk=paciente_id).values_list('version', flat=True).first()
+
+
+def _etag_perfil_paciente(request, paciente_id=None):
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if paciente_id is None:
+        paciente_id = request.role.paciente_id
+    elif (paciente_id != request.role.paciente_id
+          and not request.session.get(f'verified_paciente_{paciente_id}', False)):
+        # Pendiente de verificación: se muestra el formulario, sin ETag
+        return None
+    version = _version_paciente(paciente_id) if paciente_id else None
+    if version is None:
+        return None
+    return _etag_vista(request, f'paciente-{paciente_id}', version)
+
 
 @login_required
+@condition(etag_func=_etag_perfil_paciente)
 def perfil_paciente(request, paciente_id=None):
     """Vista del perfil completo de un paciente.
 
@@ -61,60 +210,40 @@ def perfil_paciente(request, paciente_id=None):
     if paciente_id:
         paciente = get_object_or_404(Paciente, id=paciente_id)
         # autorización: admin/staff (usando admin_required) o propietario
-        is_owner = getattr(request.user, 'paciente', None) and request.user.paciente.id == paciente.id
+        is_owner = request.role.paciente_id == paciente.id
         if not is_owner:
             # Check if verified via session
             session_key = f'verified_paciente_{paciente.id}'
             if not request.session.get(session_key, False):
+                # El hash génesis está desnormalizado en el paciente: la verificación no consulta BlockchainHash
+                genesis_hash = paciente.genesis_hash
+                if not genesis_hash:
+                    messages.error(request, 'No se encontró el hash génesis para este paciente.')
+                    return redirect('users:user_list')
                 if request.method == 'POST' and 'password' in request.POST:
-                    password = request.POST['password']
                     # Verificar usando los últimos 8 dígitos del hash genesis del paciente
-                    try:
-                        genesis_hash = BlockchainHash.objects.filter(
-                            paciente=paciente,
-                            categoria='genesis'
-                        ).first()
-                        
-                        if not genesis_hash:
-                            messages.error(request, 'No se encontró el hash génesis para este paciente.')
-                            return redirect('users:user_list')
-                        
-                        if password == genesis_hash.hash_value[-8:]:
-                            request.session[session_key] = True
-                        else:
-                            messages.error(request, 'Los últimos 8 dígitos del hash génesis son incorrectos.')
-                            return render(request, 'users/perfil_paciente_password.html', {
-                                'paciente': paciente,
-                                'hash_parcial': genesis_hash.hash_value[:-8]
-                            })
-                    except Exception as e:
-                        messages.error(request, f'Error al verificar hash: {str(e)}')
+                    if request.POST['password'] == genesis_hash[-8:]:
+                        request.session[session_key] = True
+                    else:
+                        messages.error(request, 'Los últimos 8 dígitos del hash génesis son incorrectos.')
                         return render(request, 'users/perfil_paciente_password.html', {
                             'paciente': paciente,
-                            'hash_parcial': genesis_hash.hash_value[:-8] if genesis_hash else ''
+                            'hash_parcial': genesis_hash[:-8]
                         })
                 else:
                     # Mostrar el hash parcial
-                    genesis_hash = BlockchainHash.objects.filter(
-                        paciente=paciente,
-                        categoria='genesis'
-                    ).first()
-                    if not genesis_hash:
-                        messages.error(request, 'No se encontró el hash génesis para este paciente.')
-                        return redirect('users:user_list')
                     return render(request, 'users/perfil_paciente_password.html', {
                         'paciente': paciente,
-                        'hash_parcial': genesis_hash.hash_value[:-8]
+                        'hash_parcial': genesis_hash[:-8]
                     })
         es_propio_perfil = bool(is_owner)
     else:
         # El paciente está viendo su propio perfil
-        try:
-            paciente = request.user.paciente
-            es_propio_perfil = True
-        except Paciente.DoesNotExist:
+        paciente = request.role.paciente
+        if paciente is None:
             messages.error(request, 'No tienes un perfil de paciente asociado.')
             return redirect('core:index')
+        es_propio_perfil = True
 
     context = {
         'paciente': paciente,
@@ -126,8 +255,11 @@ def perfil_paciente(request, paciente_id=None):
         'pruebas': paciente.pruebas.all() if hasattr(paciente, 'pruebas') else [],
         'cirugias': paciente.cirugias.all() if hasattr(paciente, 'cirugias') else [],
         'antecedentes': paciente.antecedentes.all() if hasattr(paciente, 'antecedentes') else [],
-        # Hashes de blockchain organizados por categoría
-        'blockchain_hashes': BlockchainManager.get_patient_hashes_by_category(paciente) if es_propio_perfil else {},
+        # Hashes de blockchain organizados por categoría; solo se consultan si su fragmento no está en caché
+        'blockchain_hashes': SimpleLazyObject(lambda: BlockchainManager.get_patient_hashes_by_category(paciente)) if es_propio_perfil else {},
+        # Versiones por sección para las claves de `{% cache %}`
+        'versiones': secciones.versiones_secciones(paciente),
+        'fragment_cache_ttl': secciones.fragment_cache_ttl(),
     }
     return render(request, 'users/perfil_paciente.html', context)
 
@@ -141,49 +273,25 @@ def perfil_paciente(request, paciente_id=None):
 @login_required
 def panel_profesional(request):
     """Vista principal del panel del profesional"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes un perfil de profesional asociado.')
         return redirect('core:index')
     
-    # Obtener fecha actual
-    from django.utils import timezone
-    today = timezone.now().date()
-    
-    # Pacientes recientes
-    pacientes_recientes = Paciente.objects.all()[:5]
-    
-    # Turnos de hoy
-    turnos_hoy = profesional.turnos.filter(
-        fecha_hora__date=today,
-        estado__in=['programado', 'confirmado']
-    ).select_related('paciente__user').order_by('fecha_hora')
-    
-    # Próximos turnos (próximos 7 días)
-    from datetime import timedelta
-    next_week = today + timedelta(days=7)
-    turnos_proximos = profesional.turnos.filter(
-        fecha_hora__date__gt=today,
-        fecha_hora__date__lte=next_week,
-        estado__in=['programado', 'confirmado']
-    ).select_related('paciente__user').order_by('fecha_hora')[:10]
-    
+    # Agenda precalculada y cacheada (turnos de hoy, próximos y pacientes recientes)
     context = {
         'profesional': profesional,
-        'pacientes_recientes': pacientes_recientes,
-        'turnos_hoy': turnos_hoy,
-        'turnos_proximos': turnos_proximos,
+        'agenda_feed_token': agenda.token_feed(profesional.id),
     }
+    context.update(agenda.agenda_profesional(profesional.id))
     
     return render(request, 'blockchain/profesional/panel_profesional.html', context)
 
 @login_required
 def buscar_pacientes(request):
     """Vista para buscar pacientes (solo para profesionales)"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
     
@@ -201,7 +309,9 @@ def buscar_pacientes(request):
             query |= Q(user__first_name__icontains=nombre) | Q(user__last_name__icontains=nombre)
         
         if query:
-            pacientes = Paciente.objects.filter(query)
+            pacientes = (Paciente.objects.filter(query)
+                         .select_related('user')
+                         .annotate(total_alergias=Count('alergias')))
     
     context = {
         'form': form,
@@ -294,36 +404,75 @@ def blockchain_status(request):
 @login_required
 def hash_detail(request, hash_id):
     """Vista para mostrar los detalles de un hash específico"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
-    # Obtener detalles del hash y registrar el acceso
-    hash_details = BlockchainManager.get_hash_details(hash_id, profesional)
-
-    if not hash_details:
+    version = BlockchainHash.objects.filter(pk=hash_id).values_list('paciente__version', flat=True).first()
+    if version is None:
         messages.error(request, 'Hash no encontrado.')
         return redirect('users:panel_profesional')
 
-    # Obtener historial de accesos
-    access_history = BlockchainManager.get_access_history(hash_details['hash_record'])
+    # El acceso se audita siempre, también cuando se responde 304
+    BlockchainManager.registrar_acceso(hash_id, profesional)
 
-    context = {
-        'hash_details': hash_details,
-        'access_history': access_history,
-        'profesional': profesional,
-    }
+    # El historial de accesos cambia con cada visita: se carga aparte (users:hash_accesos)
+    # para que la página del hash pueda validarse con ETag
+    etag = _etag_vista(request, f'hash-{hash_id}', version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        hash_details = BlockchainManager.get_hash_details(hash_id, profesional, registrar_acceso=False)
+        response = render(request, 'users/hash_detail.html', {
+            'hash_details': hash_details,
+            'profesional': profesional,
+        })
+    response['ETag'] = etag
+    return response
 
-    return render(request, 'users/hash_detail.html', context)
+
+@login_required
+def hash_accesos(request, hash_id):
+    """Fragmento HTML con una página del historial de accesos a un hash (`?antes=<fecha>_<id>`)"""
+    if request.role.profesional_id is None:
+        raise PermissionDenied
+    total = BlockchainHash.objects.filter(pk=hash_id).values_list('accesos_count', flat=True).first()
+    if total is None:
+        raise Http404
+
+    antes = None
+    cursor = request.GET.get('antes')
+    if cursor:
+        fecha, _, acceso_id = cursor.rpartition('_')
+        fecha = parse_datetime(fecha)
+        if fecha is None or not acceso_id.isdigit():
+            raise Http404
+        antes = (fecha, int(acceso_id))
+
+    limite = settings.ACCESOS_POR_PAGINA
+    # Se pide un acceso de más para saber si hay otra página sin contar
+    access_history = BlockchainManager.get_access_history(hash_id, limite=limite + 1, antes=antes)
+    siguiente = None
+    if len(access_history) > limite:
+        access_history = access_history[:limite]
+        ultimo = access_history[-1]
+        siguiente = f"{ultimo['fecha_acceso'].isoformat()}_{ultimo['id']}"
+
+    response = render(request, 'users/hash_accesos.html', {
+        'access_history': access_history,
+        'total_accesos': total,
+        'hash_id': hash_id,
+        'siguiente': siguiente,
+        'continuacion': antes is not None,
+    })
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 def hash_detail_by_value(request, hash_value):
     """Vista para mostrar los detalles de un hash usando el hash_value (genesis)"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
@@ -347,12 +496,9 @@ def hash_detail_by_value(request, hash_value):
             'block_number': hash_record.block_number
         }
 
-        # Obtener historial de accesos
-        access_history = BlockchainManager.get_access_history(hash_record)
-
+        # El historial de accesos lo carga la plantilla desde users:hash_accesos
         context = {
             'hash_details': hash_details,
-            'access_history': access_history,
             'profesional': profesional,
         }
 
@@ -366,16 +512,25 @@ def hash_detail_by_value(request, hash_value):
         return redirect('users:panel_profesional')
 
 
+def _etag_hashes_paciente(request, paciente_id):
+    if request.method not in ('GET', 'HEAD') or request.role.profesional_id is None:
+        return None
+    version = _version_paciente(paciente_id)
+    if version is None:
+        return None
+    return _etag_vista(request, f'hashes-{paciente_id}', version)
+
+
 @login_required
+@condition(etag_func=_etag_hashes_paciente)
 def patient_blockchain_hashes(request, paciente_id):
     """Vista para que los profesionales vean los hashes de blockchain de un paciente"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
-    paciente = get_object_or_404(Paciente, id=paciente_id)
+    paciente = get_object_or_404(Paciente.objects.select_related('user'), id=paciente_id)
 
     # Verificar que el profesional tenga acceso al paciente (por ahora todos los profesionales pueden ver)
     # En el futuro se puede agregar lógica de permisos más granular
@@ -391,35 +546,71 @@ def patient_blockchain_hashes(request, paciente_id):
     return render(request, 'users/patient_blockchain_hashes.html', context)
 
 
+@login_required
+def historial_cambios(request, paciente_id):
+    """
+    Registros agregados, modificados y eliminados entre dos fechas
+    (?desde=&hasta=), según los snapshots. Como el perfil, exige haber
+    verificado el hash génesis del paciente y registra el acceso.
+    """
+    if not (request.role.is_profesional or request.role.is_admin):
+        raise PermissionDenied
+    paciente = get_object_or_404(Paciente.objects.select_related('user'), id=paciente_id)
+    if not request.session.get(f'verified_paciente_{paciente.id}', False):
+        messages.info(request, 'Verifica el hash génesis del paciente para ver su historial de cambios.')
+        return redirect('users:perfil_paciente', paciente_id=paciente.id)
+
+    hasta = snapshots.parse_fecha(request.GET.get('hasta')) or timezone.now()
+    desde = snapshots.parse_fecha(request.GET.get('desde')) or hasta - timedelta(days=30)
+    try:
+        inicial, final, cambios = snapshots.cambios_entre(paciente.pk, desde, hasta)
+        error_snapshot = None
+    except snapshots.SnapshotNoDisponible as error:
+        inicial = final = None
+        cambios = []
+        error_snapshot = error
+
+    BlockchainManager.registrar_acceso_medico(
+        profesional=request.role.profesional,
+        paciente=paciente,
+        usuario=request.user,
+        motivo='Consulta del historial de cambios por ' + ('profesional' if request.role.is_profesional else 'administrador'),
+    )
+
+    return render(request, 'users/historial_cambios.html', {
+        'paciente': paciente,
+        'desde': desde,
+        'hasta': hasta,
+        'inicial': inicial,
+        'final': final,
+        'cambios': cambios,
+        'error_snapshot': error_snapshot,
+    })
+
+
 # Vistas para ver detalles de registros médicos con registro de acceso
 @login_required
 def ver_alergia(request, paciente_id, alergia_id):
     """Vista para ver detalles de una alergia y registrar acceso"""
     # Verificar si el usuario es profesional o paciente propietario
-    try:
-        profesional = request.user.profesional
-        es_profesional = True
-        paciente_acceso = None
-    except Profesional.DoesNotExist:
-        try:
-            paciente_acceso = request.user.paciente
-            es_profesional = False
-        except Paciente.DoesNotExist:
-            messages.error(request, 'No tienes permisos para acceder a esta sección.')
-            return redirect('core:index')
+    es_profesional = request.role.is_profesional
+    if not es_profesional and not request.role.is_paciente:
+        messages.error(request, 'No tienes permisos para acceder a esta sección.')
+        return redirect('core:index')
 
-    paciente = get_object_or_404(Paciente, id=paciente_id)
+    paciente = get_object_or_404(Paciente.objects.select_related('user'), id=paciente_id)
     alergia = get_object_or_404(Alergia, id=alergia_id, paciente=paciente)
 
     # Verificar que el paciente solo pueda ver sus propios registros
-    if not es_profesional and paciente_acceso.id != paciente.id:
+    if not es_profesional and request.role.paciente_id != paciente.id:
         messages.error(request, 'No tienes permisos para acceder a este registro.')
         return redirect('users:perfil_paciente')
 
     # Registrar acceso a la información médica
     BlockchainManager.registrar_acceso_medico(
-        profesional=profesional if es_profesional else None,
-        paciente=paciente_acceso if not es_profesional else paciente,
+        profesional=request.role.profesional if es_profesional else None,
+        paciente=paciente,
+        usuario=request.user,
         tipo_registro='alergia',
         registro_id=alergia.id,
         motivo='Consulta de alergia médica por ' + ('profesional' if es_profesional else 'paciente')
@@ -430,7 +621,7 @@ def ver_alergia(request, paciente_id, alergia_id):
         'registro': alergia,
         'tipo': 'alergia',
         'es_profesional': es_profesional,
-        'usuario_actual': profesional if es_profesional else paciente_acceso,
+        'usuario_actual': request.role.profesional if es_profesional else paciente,
     }
 
     return render(request, 'users/detalle_registro_medico.html', context)
@@ -440,30 +631,24 @@ def ver_alergia(request, paciente_id, alergia_id):
 def ver_condicion(request, paciente_id, condicion_id):
     """Vista para ver detalles de una condición médica y registrar acceso"""
     # Verificar si el usuario es profesional o paciente propietario
-    try:
-        profesional = request.user.profesional
-        es_profesional = True
-        paciente_acceso = None
-    except Profesional.DoesNotExist:
-        try:
-            paciente_acceso = request.user.paciente
-            es_profesional = False
-        except Paciente.DoesNotExist:
-            messages.error(request, 'No tienes permisos para acceder a esta sección.')
-            return redirect('core:index')
+    es_profesional = request.role.is_profesional
+    if not es_profesional and not request.role.is_paciente:
+        messages.error(request, 'No tienes permisos para acceder a esta sección.')
+        return redirect('core:index')
 
-    paciente = get_object_or_404(Paciente, id=paciente_id)
+    paciente = get_object_or_404(Paciente.objects.select_related('user'), id=paciente_id)
     condicion = get_object_or_404(CondicionMedica, id=condicion_id, paciente=paciente)
 
     # Verificar que el paciente solo pueda ver sus propios registros
-    if not es_profesional and paciente_acceso.id != paciente.id:
+    if not es_profesional and request.role.paciente_id != paciente.id:
         messages.error(request, 'No tienes permisos para acceder a este registro.')
         return redirect('users:perfil_paciente')
 
     # Registrar acceso a la información médica
     BlockchainManager.registrar_acceso_medico(
-        profesional=profesional if es_profesional else None,
-        paciente=paciente_acceso if not es_profesional else paciente,
+        profesional=request.role.profesional if es_profesional else None,
+        paciente=paciente,
+        usuario=request.user,
         tipo_registro='condicion',
         registro_id=condicion.id,
         motivo='Consulta de condición médica por ' + ('profesional' if es_profesional else 'paciente')
@@ -474,7 +659,7 @@ def ver_condicion(request, paciente_id, condicion_id):
         'registro': condicion,
         'tipo': 'condicion',
         'es_profesional': es_profesional,
-        'usuario_actual': profesional if es_profesional else paciente_acceso,
+        'usuario_actual': request.role.profesional if es_profesional else paciente,
     }
 
     return render(request, 'users/detalle_registro_medico.html', context)
@@ -484,30 +669,24 @@ def ver_condicion(request, paciente_id, condicion_id):
 def ver_tratamiento(request, paciente_id, tratamiento_id):
     """Vista para ver detalles de un tratamiento y registrar acceso"""
     # Verificar si el usuario es profesional o paciente propietario
-    try:
-        profesional = request.user.profesional
-        es_profesional = True
-        paciente_acceso = None
-    except Profesional.DoesNotExist:
-        try:
-            paciente_acceso = request.user.paciente
-            es_profesional = False
-        except Paciente.DoesNotExist:
-            messages.error(request, 'No tienes permisos para acceder a esta sección.')
-            return redirect('core:index')
+    es_profesional = request.role.is_profesional
+    if not es_profesional and not request.role.is_paciente:
+        messages.error(request, 'No tienes permisos para acceder a esta sección.')
+        return redirect('core:index')
 
-    paciente = get_object_or_404(Paciente, id=paciente_id)
-    tratamiento = get_object_or_404(Tratamiento, id=tratamiento_id, paciente=paciente)
+    paciente = get_object_or_404(Paciente.objects.select_related('user'), id=paciente_id)
+    tratamiento = get_object_or_404(Tratamiento.objects.select_related('medicamento'), id=tratamiento_id, paciente=paciente)
 
     # Verificar que el paciente solo pueda ver sus propios registros
-    if not es_profesional and paciente_acceso.id != paciente.id:
+    if not es_profesional and request.role.paciente_id != paciente.id:
         messages.error(request, 'No tienes permisos para acceder a este registro.')
         return redirect('users:perfil_paciente')
 
     # Registrar acceso a la información médica
     BlockchainManager.registrar_acceso_medico(
-        profesional=profesional if es_profesional else None,
-        paciente=paciente_acceso if not es_profesional else paciente,
+        profesional=request.role.profesional if es_profesional else None,
+        paciente=paciente,
+        usuario=request.user,
         tipo_registro='tratamiento',
         registro_id=tratamiento.id,
         motivo='Consulta de tratamiento médico por ' + ('profesional' if es_profesional else 'paciente')
@@ -518,7 +697,7 @@ def ver_tratamiento(request, paciente_id, tratamiento_id):
         'registro': tratamiento,
         'tipo': 'tratamiento',
         'es_profesional': es_profesional,
-        'usuario_actual': profesional if es_profesional else paciente_acceso,
+        'usuario_actual': request.role.profesional if es_profesional else paciente,
     }
 
     return render(request, 'users/detalle_registro_medico.html', context)
@@ -528,30 +707,24 @@ def ver_tratamiento(request, paciente_id, tratamiento_id):
 def ver_prueba_laboratorio(request, paciente_id, prueba_id):
     """Vista para ver detalles de una prueba de laboratorio y registrar acceso"""
     # Verificar si el usuario es profesional o paciente propietario
-    try:
-        profesional = request.user.profesional
-        es_profesional = True
-        paciente_acceso = None
-    except Profesional.DoesNotExist:
-        try:
-            paciente_acceso = request.user.paciente
-            es_profesional = False
-        except Paciente.DoesNotExist:
-            messages.error(request, 'No tienes permisos para acceder a esta sección.')
-            return redirect('core:index')
+    es_profesional = request.role.is_profesional
+    if not es_profesional and not request.role.is_paciente:
+        messages.error(request, 'No tienes permisos para acceder a esta sección.')
+        return redirect('core:index')
 
-    paciente = get_object_or_404(Paciente, id=paciente_id)
-    prueba = get_object_or_404(PruebaLaboratorio, id=prueba_id, paciente=paciente)
+    paciente = get_object_or_404(Paciente.objects.select_related('user'), id=paciente_id)
+    prueba = get_object_or_404(PruebaLaboratorio.objects.select_related('profesional__user'), id=prueba_id, paciente=paciente)
 
     # Verificar que el paciente solo pueda ver sus propios registros
-    if not es_profesional and paciente_acceso.id != paciente.id:
+    if not es_profesional and request.role.paciente_id != paciente.id:
         messages.error(request, 'No tienes permisos para acceder a este registro.')
         return redirect('users:perfil_paciente')
 
     # Registrar acceso a la información médica
     BlockchainManager.registrar_acceso_medico(
-        profesional=profesional if es_profesional else None,
-        paciente=paciente_acceso if not es_profesional else paciente,
+        profesional=request.role.profesional if es_profesional else None,
+        paciente=paciente,
+        usuario=request.user,
         tipo_registro='prueba_laboratorio',
         registro_id=prueba.id,
         motivo='Consulta de prueba de laboratorio por ' + ('profesional' if es_profesional else 'paciente')
@@ -562,7 +735,7 @@ def ver_prueba_laboratorio(request, paciente_id, prueba_id):
         'registro': prueba,
         'tipo': 'prueba_laboratorio',
         'es_profesional': es_profesional,
-        'usuario_actual': profesional if es_profesional else paciente_acceso,
+        'usuario_actual': request.role.profesional if es_profesional else paciente,
     }
 
     return render(request, 'users/detalle_registro_medico.html', context)
@@ -572,30 +745,24 @@ def ver_prueba_laboratorio(request, paciente_id, prueba_id):
 def ver_cirugia(request, paciente_id, cirugia_id):
     """Vista para ver detalles de una cirugía y registrar acceso"""
     # Verificar si el usuario es profesional o paciente propietario
-    try:
-        profesional = request.user.profesional
-        es_profesional = True
-        paciente_acceso = None
-    except Profesional.DoesNotExist:
-        try:
-            paciente_acceso = request.user.paciente
-            es_profesional = False
-        except Paciente.DoesNotExist:
-            messages.error(request, 'No tienes permisos para acceder a esta sección.')
-            return redirect('core:index')
+    es_profesional = request.role.is_profesional
+    if not es_profesional and not request.role.is_paciente:
+        messages.error(request, 'No tienes permisos para acceder a esta sección.')
+        return redirect('core:index')
 
-    paciente = get_object_or_404(Paciente, id=paciente_id)
-    cirugia = get_object_or_404(Cirugia, id=cirugia_id, paciente=paciente)
+    paciente = get_object_or_404(Paciente.objects.select_related('user'), id=paciente_id)
+    cirugia = get_object_or_404(Cirugia.objects.select_related('profesional__user'), id=cirugia_id, paciente=paciente)
 
     # Verificar que el paciente solo pueda ver sus propios registros
-    if not es_profesional and paciente_acceso.id != paciente.id:
+    if not es_profesional and request.role.paciente_id != paciente.id:
         messages.error(request, 'No tienes permisos para acceder a este registro.')
         return redirect('users:perfil_paciente')
 
     # Registrar acceso a la información médica
     BlockchainManager.registrar_acceso_medico(
-        profesional=profesional if es_profesional else None,
-        paciente=paciente_acceso if not es_profesional else paciente,
+        profesional=request.role.profesional if es_profesional else None,
+        paciente=paciente,
+        usuario=request.user,
         tipo_registro='cirugia',
         registro_id=cirugia.id,
         motivo='Consulta de cirugía por ' + ('profesional' if es_profesional else 'paciente')
@@ -606,7 +773,7 @@ def ver_cirugia(request, paciente_id, cirugia_id):
         'registro': cirugia,
         'tipo': 'cirugia',
         'es_profesional': es_profesional,
-        'usuario_actual': profesional if es_profesional else paciente_acceso,
+        'usuario_actual': request.role.profesional if es_profesional else paciente,
     }
 
     return render(request, 'users/detalle_registro_medico.html', context)
@@ -616,9 +783,8 @@ def ver_cirugia(request, paciente_id, cirugia_id):
 @login_required
 def agregar_alergia(request, paciente_id):
     """Vista para agregar una nueva alergia a un paciente"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
@@ -647,9 +813,8 @@ def agregar_alergia(request, paciente_id):
 @login_required
 def agregar_condicion(request, paciente_id):
     """Vista para agregar una nueva condición médica a un paciente"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
@@ -678,9 +843,8 @@ def agregar_condicion(request, paciente_id):
 @login_required
 def agregar_tratamiento(request, paciente_id):
     """Vista para agregar un nuevo tratamiento a un paciente"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
@@ -710,9 +874,8 @@ def agregar_tratamiento(request, paciente_id):
 @login_required
 def agregar_prueba_laboratorio(request, paciente_id):
     """Vista para agregar una nueva prueba de laboratorio a un paciente"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
@@ -742,9 +905,8 @@ def agregar_prueba_laboratorio(request, paciente_id):
 @login_required
 def agregar_cirugia(request, paciente_id):
     """Vista para agregar una nueva cirugía a un paciente"""
-    try:
-        profesional = request.user.profesional
-    except Profesional.DoesNotExist:
+    profesional = request.role.profesional
+    if profesional is None:
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('core:index')
 
@@ -769,3 +931,189 @@ def agregar_cirugia(request, paciente_id):
     }
 
     return render(request, 'blockchain/forms/cirugia_form.html', context)
+
+
+# ========== AGENDA DE TURNOS ==========
+
+AGENDA_MAX_DIAS = 31
+
+
+def _parse_fecha_hora(valor):
+    fecha_hora = parse_datetime(valor or '')
+    if fecha_hora is not None and timezone.is_naive(fecha_hora):
+        fecha_hora = timezone.make_aware(fecha_hora)
+    return fecha_hora
+
+
+def _puede_gestionar_agenda(role, profesional_id):
+    return role.is_admin or role.profesional_id == profesional_id
+
+
+@login_required
+def slots_profesional(request, profesional_id):
+    """Slots libres de un profesional (?desde=AAAA-MM-DD&dias=N)"""
+    get_object_or_404(Profesional.objects.only('id'), pk=profesional_id)
+    desde = parse_date(request.GET.get('desde', '')) or timezone.localdate()
+    try:
+        dias = min(max(int(request.GET.get('dias', 7)), 1), AGENDA_MAX_DIAS)
+    except ValueError:
+        dias = 7
+    slots = agenda.generar_slots(profesional_id, desde, dias)
+    return JsonResponse({
+        'profesional_id': profesional_id,
+        'slots': [{'inicio': inicio.isoformat(), 'duracion': duracion} for inicio, duracion in slots],
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def reservar_turno(request, profesional_id):
+    """Reserva un turno; el paciente reserva para sí, el profesional o un admin indica paciente_id"""
+    get_object_or_404(Profesional.objects.only('id'), pk=profesional_id)
+    role = request.role
+    if _puede_gestionar_agenda(role, profesional_id) and request.POST.get('paciente_id'):
+        paciente = get_object_or_404(Paciente, pk=request.POST['paciente_id'])
+    elif role.is_paciente:
+        paciente = role.paciente
+    else:
+        return JsonResponse({'error': 'No tienes permisos para reservar turnos.'}, status=403)
+
+    fecha_hora = _parse_fecha_hora(request.POST.get('fecha_hora'))
+    if fecha_hora is None:
+        return JsonResponse({'error': 'fecha_hora inválida'}, status=400)
+    try:
+        turno = agenda.reservar_turno(profesional_id, paciente, fecha_hora, request.POST.get('motivo', ''))
+    except agenda.TurnoNoDisponible as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse({
+        'id': turno.id,
+        'fecha_hora': turno.fecha_hora.isoformat(),
+        'duracion': turno.duracion_minutos,
+    }, status=201)
+
+
+@login_required
+@require_http_methods(["POST"])
+def reservar_turnos(request, profesional_id):
+    """
+    Reserva masiva (JSON): {"turnos": [{"paciente_id", "fecha_hora", "motivo", "duracion_minutos"}]}.
+    Solo para el propio profesional o un administrador.
+    """
+    if not _puede_gestionar_agenda(request.role, profesional_id):
+        return JsonResponse({'error': 'No tienes permisos para gestionar esta agenda.'}, status=403)
+    get_object_or_404(Profesional.objects.only('id'), pk=profesional_id)
+    try:
+        turnos = json.loads(request.body)['turnos']
+        solicitudes = [
+            {
+                'paciente_id': int(turno['paciente_id']),
+                'fecha_hora': _parse_fecha_hora(turno['fecha_hora']),
+                'motivo': turno.get('motivo', ''),
+                'duracion_minutos': turno.get('duracion_minutos'),
+            }
+            for turno in turnos
+        ]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Solicitud inválida'}, status=400)
+    if any(s['fecha_hora'] is None for s in solicitudes):
+        return JsonResponse({'error': 'fecha_hora inválida'}, status=400)
+
+    creados, rechazados = agenda.reservar_turnos(profesional_id, solicitudes)
+    return JsonResponse({
+        'creados': [turno.id for turno in creados],
+        'rechazados': [{'indice': indice, 'error': error} for indice, error in rechazados],
+    }, status=201 if creados else 409)
+
+
+def _estado_feed(request, profesional_id):
+    # Una sola consulta de agregación compartida entre el ETag y Last-Modified
+    if not hasattr(request, '_estado_feed'):
+        request._estado_feed = agenda.estado_feed(profesional_id)
+    return request._estado_feed
+
+
+def _formato_feed(request):
+    return 'json' if request.GET.get('formato') == 'json' else 'ics'
+
+
+def _etag_feed(request, profesional_id):
+    total, ultima = _estado_feed(request, profesional_id)
+    marca = ultima.timestamp() if ultima else 0
+    # Al cambiar el día entran y salen turnos de la ventana aunque ninguno se modifique
+    inicio = agenda.ventana_feed()[0].date().isoformat()
+    return f'{profesional_id}-{_formato_feed(request)}-{inicio}-{total}-{marca}'
+
+
+def _last_modified_feed(request, profesional_id):
+    return _estado_feed(request, profesional_id)[1]
+
+
+@condition(etag_func=_etag_feed, last_modified_func=_last_modified_feed)
+def _respuesta_feed(request, profesional_id):
+    if _formato_feed(request) == 'json':
+        response = StreamingHttpResponse(agenda.json_feed(profesional_id), content_type='application/json')
+    else:
+        response = StreamingHttpResponse(agenda.ical_feed(profesional_id, request.get_host()),
+                                         content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="agenda.ics"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def agenda_feed(request, profesional_id):
+    """
+    Agenda del profesional en iCalendar (o JSON con ?formato=json) para
+    calendarios externos. Acepta la sesión del propio profesional o de un admin,
+    o el token firmado del panel (?token=). Responde 304 mientras no cambie
+    ningún turno del período exportado.
+    """
+    token = request.GET.get('token')
+    if token:
+        autorizado = agenda.profesional_de_token(token) == profesional_id
+    else:
+        autorizado = request.user.is_authenticated and _puede_gestionar_agenda(request.role, profesional_id)
+    if not autorizado:
+        raise Http404
+    return _respuesta_feed(request, profesional_id)
+
+
+def _id_paciente(valor):
+    if valor in (None, ''):
+        return None
+    if not valor.isdigit():
+        raise Http404
+    return int(valor)
+
+
+@login_required
+def fhir_export(request):
+    """
+    Exportación masiva en NDJSON FHIR para integraciones (solo administradores).
+    Acepta `_type=Patient,Condition,...` y un rango de ids de paciente
+    `desde`/`hasta` para repartir la descarga; se comprime con gzip si el
+    cliente lo acepta. Detrás de la función serverless (api/index.py) la
+    respuesta no se transmite: se arma completa y está acotada en tamaño, así
+    que las exportaciones grandes se hacen con el comando export_fhir o con
+    rangos `desde`/`hasta` chicos.
+    """
+    if not request.role.is_admin:
+        raise PermissionDenied
+    tipos = [tipo for tipo in request.GET.get('_type', '').split(',') if tipo]
+    try:
+        tipos = fhir.tipos_validos(tipos)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    bloques = fhir.en_bloques(fhir.ndjson(
+        tipos, _id_paciente(request.GET.get('desde')), _id_paciente(request.GET.get('hasta')),
+    ))
+    comprimir = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = StreamingHttpResponse(compress_sequence(bloques) if comprimir else bloques,
+                                     content_type=fhir.CONTENT_TYPE)
+    if comprimir:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['Content-Disposition'] = 'attachment; filename="export.ndjson"'
+    response['Cache-Control'] = 'private, no-store'
+    response['X-Accel-Buffering'] = 'no'
+    return response
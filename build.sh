@@ -1,13 +1,25 @@
 #!/bin/bash
 # Build script for Vercel deployment
+set -e
 
 echo "🚀 Starting build process for Django app..."
 
 # Install Python dependencies
 pip install -r requirements.txt
 
-# Collect static files
-python manage.py collectstatic --noinput --clear
+# Tailwind CSS purged and minified into static/css/output.css
+npm install
+npm run build-css
+
+# Collect static files: content-hashed names plus .gz/.br variants (core.storage)
+# into staticfiles/static, the distDir that vercel.json publishes
+DEBUG=False python manage.py collectstatic --noinput --clear
+STATIC_ROOT=$(DEBUG=False python manage.py shell -c "from django.conf import settings; print(settings.STATIC_ROOT)")
+test -f "$STATIC_ROOT/staticfiles.json" || { echo "❌ collectstatic did not write $STATIC_ROOT/staticfiles.json"; exit 1; }
+
+# Bytes transferred on the main pages with the collected assets (informative only:
+# it renders pages and needs the database, which the build may not reach)
+DEBUG=False python manage.py static_report || echo "⚠️ static_report skipped"
 
 # Run migrations (optional, depending on your setup)
 # python manage.py migrate --noinput
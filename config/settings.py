@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 
+from core.hashers import hashers_para, politica_por_defecto
+
 # Load environment variables from .env file
 try:
     from dotenv import load_dotenv
@@ -43,7 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryMetricsMiddleware',  # Consultas, tiempos y tamaño por request
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',  # Estáticos con hash, gzip/brotli y caché inmutable
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.AdminAccessMiddleware',  # Middleware para proteger el admin
+    'core.middleware.RequestRoleMiddleware',  # Rol del usuario resuelto una vez por request
+    'core.middleware.ReplicaRoutingMiddleware',  # Lecturas de vistas de consulta en réplicas
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -73,6 +79,16 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Plantillas compiladas una sola vez por proceso; en desarrollo se recargan al editarlas
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 # Django Admin Configuration
 ADMIN_SITE_HEADER = "ARQA Medical System Administration"
 ADMIN_SITE_TITLE = "ARQA Admin Portal"
@@ -87,16 +103,34 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Configuración para Neon.tech PostgreSQL
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-if DATABASE_URL:
-    # Parse DATABASE_URL for Neon.tech
+# Pool de conexiones por proceso (psycopg_pool); con pool las conexiones vuelven
+# al pool al final de cada request en lugar de quedar abiertas por worker
+DATABASE_POOL = os.getenv('DATABASE_POOL', 'False').lower() == 'true'
+DATABASE_POOL_OPTIONS = {
+    'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', '1')),
+    'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', '4')),
+    'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', '10')),
+}
+
+
+def _postgres(url):
     import dj_database_url
-    DATABASES = {
-        'default': dj_database_url.config(
-            default=DATABASE_URL,
-            conn_max_age=600,
-            conn_health_checks=True,
-        )
-    }
+    config = dj_database_url.parse(
+        url,
+        conn_max_age=0 if DATABASE_POOL else 600,
+        conn_health_checks=not DATABASE_POOL,
+    )
+    if DATABASE_POOL:
+        config['ENGINE'] = 'core.backends.postgresql_pool'
+        config.setdefault('OPTIONS', {})['pool'] = DATABASE_POOL_OPTIONS
+    return config
+
+
+if DATABASE_URL:
+    DATABASES = {'default': _postgres(DATABASE_URL)}
+    # Réplicas de lectura separadas por comas: replica_1, replica_2, ...
+    for numero, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), 1):
+        DATABASES[f'replica_{numero}'] = {**_postgres(url.strip()), 'TEST': {'MIRROR': 'default'}}
 else:
     # Fallback to SQLite for development
     DATABASES = {
@@ -106,6 +140,33 @@ else:
         }
     }
 
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Vistas de solo lectura que leen de las réplicas (core.db_router). Las que responden
+# 304 según Paciente.version (perfil, hashes del paciente) leen siempre del primario.
+READ_REPLICA_VIEWS = [
+    'users:user_list',
+    'users:buscar_pacientes',
+    'chat:get_chat_history',
+]
+# Retraso máximo aceptado de una réplica y cada cuánto se mide, en segundos
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', '10'))
+
+
+# Carga request.user junto con la versión de su rol (core.roles)
+AUTHENTICATION_BACKENDS = ['core.roles.RoleModelBackend']
+
+# Hashers de contraseñas (core.hashers): 'rapida' en tests y benchmarks, 'produccion'
+# (Argon2 ajustado, o PBKDF2 sin argon2-cffi) en el resto
+PASSWORD_HASHER_POLICY = os.getenv('PASSWORD_HASHER_POLICY') or politica_por_defecto()
+PASSWORD_HASHERS = hashers_para(PASSWORD_HASHER_POLICY)
+# Costos de Argon2 (memoria en KiB): 19 MiB, 2 pasadas y un hilo, pensado para funciones de un núcleo
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '19456'))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '1'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -141,7 +202,8 @@ USE_TZ = True
 
 
 # Static files (CSS, JavaScript, Images)
-STATIC_ROOT = BASE_DIR / 'cdn'
+# vercel.json publica staticfiles/ (distDir) en la raíz del sitio: los archivos quedan bajo /static/
+STATIC_ROOT = BASE_DIR / 'staticfiles' / 'static'
 
 STATIC_URL = '/static/'
 
@@ -149,10 +211,107 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# collectstatic agrega el hash del contenido a cada nombre y genera variantes .gz y .br;
+# WhiteNoise sirve esas variantes según Accept-Encoding y marca los archivos con hash
+# como inmutables (max-age de 10 años). En desarrollo no hace falta correr collectstatic;
+# sin su salida (p. ej. en la función serverless) core.storage usa los nombres sin hash.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'core.storage.ManifestConRespaldoStorage',
+    },
+}
+WHITENOISE_AUTOREFRESH = DEBUG
+# Un estático ausente del manifiesto no lanza error: se busca su hash en STATIC_ROOT
+WHITENOISE_MANIFEST_STRICT = False
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Login/Logout URLs
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
-LOGOUT_REDIRECT_URL = '/login/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/login/'
+
+
+# Métricas de requests (core.middleware.QueryMetricsMiddleware)
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Una misma sentencia repetida este número de veces en una request se reporta como posible N+1
+QUERY_DUPLICATE_THRESHOLD = int(os.getenv('QUERY_DUPLICATE_THRESHOLD', '3'))
+
+# Máximo de consultas SQL por nombre de URL. Con QUERY_BUDGETS_STRICT superar
+# el presupuesto lanza QueryBudgetExceeded (se activa en los tests).
+QUERY_BUDGETS = {
+    'core:index': 4,
+    'users:user_list': 8,
+    'users:mi_perfil': 14,
+    'users:perfil_paciente': 14,
+    'users:panel_profesional': 8,
+    'users:buscar_pacientes': 6,
+    'users:patient_blockchain_hashes': 8,
+    'users:hash_detail': 10,
+    'users:ver_alergia': 10,
+    'users:ver_condicion': 10,
+    'users:ver_tratamiento': 10,
+    'users:ver_prueba_laboratorio': 10,
+    'users:ver_cirugia': 10,
+    'users:slots_profesional': 6,
+    'users:agenda_feed': 7,
+    'chat:get_chat_history': 4,
+    'institucion:lista_camas': 9,
+    'institucion:institutional_management': 7,
+    'institucion:ocupacion_salas': 5,
+    'institucion:registrar_cama': 10,
+}
+QUERY_BUDGETS_STRICT = os.getenv('QUERY_BUDGETS_STRICT', 'False').lower() == 'true'
+
+# Filas (shards) en las que se reparte cada contador materializado (core.counters)
+COUNTERS_SHARDS = int(os.getenv('COUNTERS_SHARDS', '8'))
+
+# Ocupación de camas (apps.institucion.ocupacion): cada cuántos segundos la lista
+# de camas pide los deltas a institucion:ocupacion_salas
+OCUPACION_POLL_INTERVALO = float(os.getenv('OCUPACION_POLL_INTERVALO', '5'))
+OCUPACION_RETENCION_HORAS = int(os.getenv('OCUPACION_RETENCION_HORAS', '24'))
+
+# Agenda del panel del profesional (apps.users.agenda), en segundos
+AGENDA_CACHE_TTL = int(os.getenv('AGENDA_CACHE_TTL', '60'))
+
+# Validez del token del feed de agenda (?token=), en segundos; el panel genera uno nuevo en cada visita
+AGENDA_FEED_TOKEN_MAX_AGE = int(os.getenv('AGENDA_FEED_TOKEN_MAX_AGE', str(30 * 24 * 3600)))
+
+# Fragmentos `{% cache %}` del perfil del paciente (apps.users.secciones), en segundos
+FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', '600'))
+
+# Accesos por página en el historial de un hash (users:hash_accesos)
+ACCESOS_POR_PAGINA = int(os.getenv('ACCESOS_POR_PAGINA', '25'))
+
+# Filas por bloque del cursor en la exportación FHIR (apps.users.fhir)
+FHIR_EXPORT_CHUNK_SIZE = int(os.getenv('FHIR_EXPORT_CHUNK_SIZE', '2000'))
+
+# Filas por bloque al armar el snapshot de un paciente (apps.users.snapshots)
+SNAPSHOT_CHUNK_SIZE = int(os.getenv('SNAPSHOT_CHUNK_SIZE', '500'))
+
+# Archivos de snapshots de pacientes, nombrados por hash (apps.users.snapshots)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+
+# Tiempo máximo de importación de api/index.py (arranque en frío), en ms (core.importtime)
+COLD_START_BUDGET_MS = int(os.getenv('COLD_START_BUDGET_MS', '1000'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('METRICS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
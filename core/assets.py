@@ -0,0 +1,41 @@
+"""
+Bytes transferidos por página: HTML más los estáticos que referencia.
+
+Los estáticos se miden sobre STATIC_ROOT después de collectstatic, eligiendo
+la variante que WhiteNoise serviría a un navegador que acepta brotli y gzip.
+El HTML se mide comprimido con gzip, como lo entrega el CDN.
+"""
+import gzip
+import re
+from pathlib import Path
+
+from django.conf import settings
+
+REFERENCIA_RE = re.compile(r'''(?:href|src)=["']([^"'#?]+)''')
+
+
+def assets_de_pagina(html):
+    """URLs de estáticos locales referenciadas por la página, sin repetir y en orden"""
+    vistos = []
+    for url in REFERENCIA_RE.findall(html):
+        if url.startswith(settings.STATIC_URL) and url not in vistos:
+            vistos.append(url)
+    return vistos
+
+
+def tamanos_asset(url):
+    """Tamaño en disco de un estático y de sus variantes comprimidas (None si no existen)"""
+    ruta = Path(settings.STATIC_ROOT) / url[len(settings.STATIC_URL):]
+    if not ruta.exists():
+        return None
+    variantes = {'original': ruta.stat().st_size}
+    for sufijo in ('gz', 'br'):
+        comprimido = ruta.with_name(f'{ruta.name}.{sufijo}')
+        if comprimido.exists():
+            variantes[sufijo] = comprimido.stat().st_size
+    variantes['transferido'] = min(variantes.values())
+    return variantes
+
+
+def tamano_html(contenido):
+    return len(gzip.compress(contenido))
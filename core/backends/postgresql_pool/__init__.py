@@ -0,0 +1,8 @@
+"""
+Backend PostgreSQL con pool de conexiones de psycopg_pool.
+
+Equivale a `OPTIONS['pool']` de Django 5.1 para Django 4.2: se activa con
+DATABASE_POOL=true (ver config/settings.py) y exige psycopg 3 y psycopg-pool.
+Las estadísticas de los pools viven en `pools` para no importar psycopg
+desde las métricas cuando el backend no está en uso.
+"""
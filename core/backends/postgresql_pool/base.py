@@ -0,0 +1,48 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel, is_psycopg3
+
+from . import pools
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Toma las conexiones de un pool y las devuelve al cerrarlas (usar con CONN_MAX_AGE = 0)"""
+
+    @property
+    def pool(self):
+        return pools.obtener((self.alias, self.settings_dict['NAME']), self._crear_pool)
+
+    def _crear_pool(self):
+        if not is_psycopg3:
+            raise ImproperlyConfigured('El pool de conexiones requiere psycopg 3')
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise ImproperlyConfigured('Instalar psycopg-pool para usar DATABASE_POOL')
+        opciones = dict(self.settings_dict['OPTIONS'].get('pool') or {})
+        return ConnectionPool(
+            kwargs=self.get_connection_params(),
+            connection_class=self.Database.Connection,
+            name=self.alias,
+            open=True,
+            **opciones,
+        )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = IsolationLevel.READ_COMMITTED if isolation_level is None else IsolationLevel(isolation_level)
+        connection = self.pool.getconn()
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # El pool hace rollback de lo pendiente y la deja disponible para otra request
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
@@ -0,0 +1,20 @@
+import threading
+
+# Un pool por alias y base de datos (el test runner renombra la base)
+POOLS = {}
+LOCK = threading.Lock()
+
+
+def obtener(clave, crear):
+    pool = POOLS.get(clave)
+    if pool is None:
+        with LOCK:
+            pool = POOLS.get(clave)
+            if pool is None:
+                pool = POOLS[clave] = crear()
+    return pool
+
+
+def estadisticas():
+    """Estadísticas de `ConnectionPool.get_stats()` por alias"""
+    return {alias: pool.get_stats() for (alias, _), pool in list(POOLS.items())}
@@ -0,0 +1,74 @@
+"""
+Contadores materializados para los paneles de administración.
+
+Cada contador guarda la cantidad de filas de un modelo en la tabla
+`core.Contador`, repartida en COUNTERS_SHARDS filas (shards). Las señales
+post_save/post_delete ajustan una fila elegida al azar con un UPDATE atómico,
+así que las altas concurrentes no esperan todas el bloqueo de la misma fila.
+La lectura suma los shards de todos los contadores con una sola consulta,
+directamente en la base: el valor es el mismo en todos los procesos. Las
+cargas masivas (bulk_create, update, SQL directo) no emiten señales: el
+comando `reconciliar_contadores` recalcula los valores y debe ejecutarse
+periódicamente.
+"""
+import random
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Contador
+
+# nombre del contador -> modelo contado
+COUNTED_MODELS = {
+    'pacientes': 'users.Paciente',
+    'profesionales': 'users.Profesional',
+    'hashes': 'users.BlockchainHash',
+    'camas': 'institucion.Cama',
+    'enfermeros': 'institucion.Enfermero',
+    'operarios': 'institucion.Operario',
+    'salas': 'institucion.Sala',
+}
+
+
+def _shards():
+    return max(1, getattr(settings, 'COUNTERS_SHARDS', 8))
+
+
+def reconcile(nombres=None):
+    """Recalcula los contadores indicados (o todos) con COUNT(*) y deja el valor en el shard 0"""
+    valores = {}
+    for nombre in nombres or COUNTED_MODELS:
+        model = apps.get_model(COUNTED_MODELS[nombre])
+        with transaction.atomic():
+            valores[nombre] = model._default_manager.count()
+            Contador.objects.filter(nombre=nombre).exclude(shard=0).delete()
+            Contador.objects.update_or_create(nombre=nombre, shard=0, defaults={'valor': valores[nombre]})
+    return valores
+
+
+def increment(nombre, delta=1):
+    """Ajusta un shard del contador de forma atómica; si el contador aún no existe se inicializa con el conteo real"""
+    shard = random.randrange(_shards())
+    if Contador.objects.filter(nombre=nombre, shard=shard).update(valor=F('valor') + delta):
+        return
+    try:
+        with transaction.atomic():
+            if Contador.objects.filter(nombre=nombre).exists():
+                Contador.objects.create(nombre=nombre, shard=shard, valor=delta)
+            else:
+                # El conteo ya incluye la fila de esta señal
+                reconcile([nombre])
+    except IntegrityError:
+        # Otro proceso creó el shard en paralelo
+        Contador.objects.filter(nombre=nombre, shard=shard).update(valor=F('valor') + delta)
+
+
+def get_counters(*nombres):
+    """Devuelve {nombre: valor} sumando los shards de todos los contadores con una única consulta"""
+    valores = dict(Contador.objects.values('nombre').annotate(total=Sum('valor')).values_list('nombre', 'total'))
+    faltantes = [nombre for nombre in COUNTED_MODELS if nombre not in valores]
+    if faltantes:
+        valores.update(reconcile(faltantes))
+    return {nombre: valores.get(nombre, 0) for nombre in (nombres or valores)}
@@ -0,0 +1,112 @@
+"""
+Lecturas en réplicas de PostgreSQL con respaldo en el primario.
+
+ReplicaRoutingMiddleware marca las requests GET de las vistas listadas en
+`settings.READ_REPLICA_VIEWS`; solo esas leen de una réplica. Se vuelve al
+primario cuando:
+
+- la réplica está atrasada más de REPLICA_MAX_LAG segundos o no responde
+  (el retraso se mide cada REPLICA_LAG_CHECK_INTERVAL segundos por proceso),
+- hay una transacción abierta en el primario,
+- la request ya escribió algo (lee sus propias escrituras),
+- el modelo es de una app de PRIMARIO_SIEMPRE (una sesión recién creada puede
+  no haber llegado a la réplica).
+
+La réplica se elige en la primera lectura y queda fija hasta el final de la
+request: dos consultas de la misma vista no mezclan réplicas con distinto
+retraso. Si ninguna está al día, toda la request lee del primario.
+
+Las vistas que validan con ETag sobre `Paciente.version` no van en la lista:
+una versión leída de una réplica atrasada daría un 304 con el ETag anterior a
+la última escritura.
+"""
+import contextvars
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARIO_SIEMPRE = {'sessions'}
+
+# Sin WAL pendiente de aplicar la réplica está al día aunque no haya escrituras recientes
+LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# False: primario; True: réplica sin elegir todavía; alias: réplica fijada para la request
+_lectura = contextvars.ContextVar('lectura_en_replica', default=False)
+# alias -> (momento de la medición, retraso en segundos o None si no respondió)
+lags = {}
+
+
+def iniciar_lectura():
+    return _lectura.set(True)
+
+
+def terminar_lectura(token):
+    _lectura.reset(token)
+
+
+def lag_replica(alias):
+    ahora = time.monotonic()
+    medido = lags.get(alias)
+    if medido and ahora - medido[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return medido[1]
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = float(cursor.fetchone()[0] or 0)
+    except DatabaseError:
+        logger.warning('Réplica %s no disponible, se lee del primario', alias, exc_info=True)
+        lag = None
+    lags[alias] = (ahora, lag)
+    return lag
+
+
+def replica_para_lectura():
+    """Alias de la réplica de la request, o None si la lectura debe ir al primario"""
+    estado = _lectura.get()
+    if not estado or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    if estado is not True:
+        return estado
+    disponibles = []
+    for alias in settings.DATABASE_REPLICAS:
+        lag = lag_replica(alias)
+        if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+            disponibles.append(alias)
+    alias = random.choice(disponibles) if disponibles else None
+    _lectura.set(alias or False)
+    return alias
+
+
+class ReplicaRouter:
+    """Devuelve siempre un alias explícito: un objeto leído de una réplica se guarda en el primario"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARIO_SIEMPRE:
+            return DEFAULT_DB_ALIAS
+        return replica_para_lectura() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _lectura.set(False)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas se actualizan por replicación, no con migrate
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,70 @@
+"""
+EXPLAIN de las consultas calientes para detectar lecturas secuenciales.
+
+Cada consulta se arma con valores reales de la base (el primer paciente,
+profesional, hash, etc.) y se pasa por `QuerySet.explain()`. En PostgreSQL se
+desactiva `enable_seqscan` durante el EXPLAIN: con tablas chicas el planner
+prefiere leer toda la tabla aunque exista el índice, y lo que interesa es
+si hay un índice utilizable. Lo usa el comando `explain_hot_paths`.
+"""
+import re
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+# SQLite: "SCAN tabla" sin índice; PostgreSQL: "Seq Scan on tabla"
+SCAN_RE = {
+    'sqlite': re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)\s*$', re.MULTILINE),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+def consultas_calientes():
+    """Lista de (nombre, queryset); se omiten las consultas sin datos para armarlas"""
+    from apps.chat.models import ChatMessage
+    from apps.institucion.models import Cama
+    from apps.users.agenda import ESTADOS_AGENDA
+    from apps.users.models import AccesoBlockchain, BlockchainHash, Paciente, Profesional, Tratamiento, Turno
+
+    consultas = []
+    paciente = Paciente.objects.order_by('pk').first()
+    if paciente:
+        consultas += [
+            ('hash génesis del paciente', BlockchainHash.objects.filter(paciente=paciente, categoria='genesis')),
+            ('hashes del paciente', BlockchainHash.objects.filter(paciente=paciente)),
+            ('hash de un registro', BlockchainHash.objects.filter(paciente=paciente, categoria='alergia', record_id=1)),
+            ('tratamientos activos', Tratamiento.objects.filter(paciente=paciente, activo=True)),
+            ('historial del chat', ChatMessage.objects.filter(user_id=paciente.user_id).order_by('timestamp')),
+        ]
+    profesional = Profesional.objects.order_by('pk').first()
+    if profesional:
+        ahora = timezone.now()
+        consultas.append(('agenda del profesional', Turno.objects.filter(
+            profesional=profesional, estado__in=ESTADOS_AGENDA,
+            fecha_hora__gte=ahora, fecha_hora__lt=ahora + timedelta(days=30),
+        ).order_by('fecha_hora')))
+    hash_record = BlockchainHash.objects.order_by('pk').first()
+    if hash_record:
+        consultas.append(('accesos a un hash', AccesoBlockchain.objects.filter(hash_record=hash_record)))
+    cama = Cama.objects.order_by('pk').first()
+    if cama:
+        consultas.append(('camas disponibles de una sala', Cama.objects.filter(
+            sala_id=cama.sala_id, estado='disponible').order_by('numero')))
+    return consultas
+
+
+def explicar(queryset):
+    """Plan de la consulta y tablas leídas secuencialmente"""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+    patron = SCAN_RE.get(connection.vendor)
+    return plan, sorted(set(patron.findall(plan))) if patron else []
+
+
+def revisar():
+    """Lista de (nombre, plan, tablas con lectura secuencial) de cada consulta caliente"""
+    return [(nombre, *explicar(queryset)) for nombre, queryset in consultas_calientes()]
@@ -0,0 +1,71 @@
+"""
+Política de hashers de contraseñas.
+
+- 'produccion': Argon2 con parámetros ajustados por settings (ARGON2_*) para
+  funciones serverless de un solo núcleo; sin argon2-cffi instalado se usa
+  PBKDF2. Los hashers anteriores quedan en la lista para verificar
+  contraseñas ya guardadas.
+- 'rapida': MD5 primero, para tests, benchmarks y cargas de datos de
+  prueba, donde cada hash lento suma cientos de ms. Los hashers de
+  producción siguen en la lista para poder verificar hashes existentes.
+
+Django vuelve a hashear la contraseña al iniciar sesión cuando el hasher
+del hash guardado no es el preferido o sus parámetros cambiaron
+(`must_update`), así que cambiar la política o los ARGON2_* migra a los
+usuarios a medida que entran, sin resetear contraseñas.
+"""
+import importlib.util
+import sys
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+RAPIDO = 'django.contrib.auth.hashers.MD5PasswordHasher'
+ARGON2 = 'core.hashers.Argon2AjustadoPasswordHasher'
+HEREDADOS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+POLITICAS = ('produccion', 'rapida')
+
+
+class Argon2AjustadoPasswordHasher(Argon2PasswordHasher):
+    """Argon2id con costos tomados de settings; los hashes con otros costos se actualizan al iniciar sesión"""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+def argon2_disponible():
+    return importlib.util.find_spec('argon2') is not None
+
+
+def politica_por_defecto(argv=None):
+    """'rapida' al correr tests (manage.py test o pytest) y comandos benchmark_*, 'produccion' en el resto"""
+    argv = sys.argv if argv is None else argv
+    comando = argv[1] if len(argv) > 1 else ''
+    if comando == 'test' or comando.startswith('benchmark_') or 'pytest' in sys.modules:
+        return 'rapida'
+    return 'produccion'
+
+
+def hashers_para(politica, con_argon2=None):
+    """Valor de PASSWORD_HASHERS para una política"""
+    if politica not in POLITICAS:
+        raise ValueError(f'Política de hashers desconocida: {politica} (opciones: {", ".join(POLITICAS)})')
+    if con_argon2 is None:
+        con_argon2 = argon2_disponible()
+    produccion = ([ARGON2] if con_argon2 else []) + HEREDADOS
+    if politica == 'rapida':
+        return [RAPIDO] + produccion
+    return produccion
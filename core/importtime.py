@@ -0,0 +1,48 @@
+"""
+Perfil de importación para el arranque en frío de la función serverless.
+
+Importa un módulo en un intérprete nuevo con `python -X importtime` y
+devuelve el tiempo propio y acumulado de cada módulo importado. Se usa desde
+el comando `profile_imports` y desde el test del presupuesto de arranque.
+"""
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+
+# Módulo que carga Vercel en cada arranque en frío
+MODULO_ARRANQUE = 'api.index'
+
+
+def medir_importacion(modulo=MODULO_ARRANQUE):
+    """Lista de (módulo, propio_ms, acumulado_ms) en el orden que informa el intérprete"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=False,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f'No se pudo importar {modulo}:\n{proceso.stderr[-2000:]}')
+
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, acumulado, nombre = linea[len('import time:'):].split('|')
+        filas.append((nombre.strip(), int(propio) / 1000, int(acumulado) / 1000))
+    return filas
+
+
+def tiempo_total(filas, modulo=MODULO_ARRANQUE):
+    """Tiempo acumulado del módulo raíz en milisegundos"""
+    return next(acumulado for nombre, _, acumulado in filas if nombre == modulo)
+
+
+def por_paquete(filas):
+    """Tiempo propio sumado por paquete de primer nivel, de mayor a menor"""
+    totales = Counter()
+    for nombre, propio, _ in filas:
+        totales[nombre.split('.')[0]] += propio
+    return totales.most_common()
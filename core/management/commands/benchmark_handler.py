@@ -0,0 +1,69 @@
+import base64
+import os
+import statistics
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+BLOQUE = 64 * 1024
+
+
+def descarga(tamano):
+    """Aplicación WSGI que entrega un PDF sintético en bloques, como FileResponse"""
+    contenido = b'%PDF-1.7\n' + os.urandom(tamano)
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/pdf'), ('Content-Length', str(len(contenido)))])
+        return (contenido[i:i + BLOQUE] for i in range(0, len(contenido), BLOQUE))
+
+    return app, contenido
+
+
+def handler_anterior(request, app):
+    """Adaptador previo: lista de partes, join y decode con errors='ignore'"""
+    status, headers, body_parts = [200], [], []
+
+    def start_response(status_line, response_headers, exc_info=None):
+        status[0] = int(status_line.split()[0])
+        headers.extend(response_headers)
+
+    body_parts.extend(app({'wsgi.input': request.body or b''}, start_response))
+    return {'statusCode': status[0], 'headers': dict(headers),
+            'body': b''.join(body_parts).decode('utf-8', errors='ignore')}
+
+
+class Command(BaseCommand):
+    help = 'Compara el adaptador WSGI de api/index.py con el anterior sobre una descarga binaria grande'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mb', type=int, default=2,
+                            help='Tamaño de la descarga en MB (hasta SERVERLESS_MAX_RESPONSE_BYTES)')
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        from api.index import handler
+
+        app, contenido = descarga(options['mb'] * 1024 * 1024)
+        request = SimpleNamespace(method='GET', path='/descarga.pdf', query_string='', headers={}, body=None)
+        for nombre, funcion in (('anterior', handler_anterior), ('actual', handler)):
+            tiempos = []
+            for _ in range(options['repeticiones']):
+                tracemalloc.start()
+                inicio = time.perf_counter()
+                respuesta = funcion(request, app)
+                tiempos.append(time.perf_counter() - inicio)
+                pico = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.stdout.write(
+                f'{nombre}: mediana {statistics.median(tiempos) * 1000:.1f} ms, '
+                f'pico de memoria {pico / 1024 / 1024:.1f} MB, '
+                f'cuerpo {"íntegro" if _integro(respuesta, contenido) else "corrupto"}'
+            )
+
+
+def _integro(respuesta, contenido):
+    if respuesta.get('isBase64Encoded'):
+        return base64.b64decode(respuesta['body']) == contenido
+    return respuesta['body'].encode('utf-8') == contenido
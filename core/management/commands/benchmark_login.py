@@ -0,0 +1,50 @@
+import statistics
+import time
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from core.hashers import POLITICAS, hashers_para
+
+PASSWORD = 'benchmark-login-123'
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo del hasher y los logins por segundo de cada política de contraseñas (los datos se descartan)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--politica', choices=POLITICAS, action='append',
+                            help='Política a medir (se puede repetir; todas por defecto)')
+
+    def handle(self, *args, **options):
+        for politica in options['politica'] or POLITICAS:
+            with override_settings(PASSWORD_HASHERS=hashers_para(politica)):
+                self._medir(politica, options['repeticiones'])
+
+    def _medir(self, politica, repeticiones):
+        hasher = get_hasher()
+        with transaction.atomic():
+            user = User.objects.create(username=f'benchmark_login_{politica}')
+            hashes, logins = [], []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                user.password = make_password(PASSWORD)
+                hashes.append(time.perf_counter() - inicio)
+            user.save(update_fields=['password'])
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                autenticado = authenticate(username=user.username, password=PASSWORD)
+                logins.append(time.perf_counter() - inicio)
+                assert autenticado is not None
+            transaction.set_rollback(True)
+
+        login = statistics.median(logins)
+        self.stdout.write(
+            f'{politica} ({hasher.algorithm}): hash {statistics.median(hashes) * 1000:.1f} ms, '
+            f'login {login * 1000:.1f} ms, {1 / login:.0f} logins/s por proceso'
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.explain import revisar
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN sobre las consultas calientes e informa las lecturas secuenciales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Siembra N pacientes de prueba antes de revisar (se descartan al terminar)')
+        parser.add_argument('--plan', action='store_true', help='Muestra el plan completo de cada consulta')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                from core.testing import mock_blockchain, seed_dataset
+                with mock_blockchain():
+                    seed_dataset(pacientes=options['seed'])
+            resultados = revisar()
+            transaction.set_rollback(True)
+
+        if not resultados:
+            raise CommandError('No hay datos para armar las consultas: usar --seed')
+
+        con_scan = 0
+        for nombre, plan, tablas in resultados:
+            if tablas:
+                con_scan += 1
+                self.stdout.write(self.style.ERROR(f'SEQ SCAN  {nombre}: {", ".join(tablas)}'))
+            else:
+                self.stdout.write(f'OK        {nombre}')
+            if options['plan'] or tablas:
+                self.stdout.write('\n'.join(f'          {linea}' for linea in plan.splitlines()))
+
+        if con_scan:
+            raise CommandError(f'{con_scan} consultas calientes leen tablas completas')
+        self.stdout.write(self.style.SUCCESS('Todas las consultas calientes usan índices'))
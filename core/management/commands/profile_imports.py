@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importtime import MODULO_ARRANQUE, medir_importacion, por_paquete, tiempo_total
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de importación del punto de entrada serverless e informa los paquetes más lentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modulo', nargs='?', default=MODULO_ARRANQUE)
+        parser.add_argument('--top', type=int, default=15, help='Cantidad de paquetes y módulos a listar')
+
+    def handle(self, *args, **options):
+        modulo = options['modulo']
+        try:
+            filas = medir_importacion(modulo)
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        total = tiempo_total(filas, modulo)
+        self.stdout.write(f'Importación de {modulo}: {total:.1f} ms ({len(filas)} módulos)')
+
+        self.stdout.write('\nPaquetes por tiempo propio:')
+        for paquete, propio in por_paquete(filas)[:options['top']]:
+            self.stdout.write(f'  {propio:8.1f} ms  {paquete}')
+
+        self.stdout.write('\nMódulos por tiempo acumulado:')
+        for nombre, _, acumulado in sorted(filas, key=lambda fila: -fila[2])[1:options['top'] + 1]:
+            self.stdout.write(f'  {acumulado:8.1f} ms  {nombre}')
+
+        if total > settings.COLD_START_BUDGET_MS:
+            raise CommandError(f'{total:.1f} ms supera COLD_START_BUDGET_MS ({settings.COLD_START_BUDGET_MS} ms)')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.counters import COUNTED_MODELS, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores materializados de los paneles (ejecutar periódicamente, p. ej. con cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nombres', nargs='*', help='Contadores a recalcular (todos por defecto)')
+
+    def handle(self, *args, **options):
+        desconocidos = set(options['nombres']) - set(COUNTED_MODELS)
+        if desconocidos:
+            raise CommandError(f"Contadores desconocidos: {', '.join(sorted(desconocidos))}")
+
+        valores = reconcile(options['nombres'] or None)
+        for nombre, valor in valores.items():
+            self.stdout.write(f'{nombre}: {valor}')
+        self.stdout.write(self.style.SUCCESS('Contadores reconciliados'))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from core.assets import assets_de_pagina, tamano_html, tamanos_asset
+
+PAGINAS = ['/login/', '/']
+
+
+def _kb(valor):
+    return f'{valor / 1024:8.1f} KB'
+
+
+class Command(BaseCommand):
+    help = 'Informa los bytes transferidos por página (HTML y estáticos) después de collectstatic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paginas', nargs='*', default=PAGINAS)
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if h and '*' not in h and not h.startswith('.')), 'testserver')
+        client = Client(SERVER_NAME=host)
+        for pagina in options['paginas']:
+            response = client.get(pagina, follow=True)
+            html = tamano_html(response.content)
+            total = html
+            self.stdout.write(f'{pagina} ({response.status_code})')
+            self.stdout.write(f'  {_kb(html)}  HTML (gzip)')
+            for url in assets_de_pagina(response.content.decode()):
+                tamanos = tamanos_asset(url)
+                if tamanos is None:
+                    self.stdout.write(self.style.WARNING(f'  {"sin collectstatic":>11}  {url}'))
+                    continue
+                total += tamanos['transferido']
+                self.stdout.write(f'  {_kb(tamanos["transferido"])}  {url} (original {_kb(tamanos["original"]).strip()})')
+            self.stdout.write(self.style.SUCCESS(f'  {_kb(total)}  total'))
@@ -0,0 +1,177 @@
+"""
+Métricas por request: consultas SQL, tiempos y tamaño de respuesta.
+
+QueryMetricsMiddleware registra cada request en el registro de este módulo,
+que se exporta en formato de texto Prometheus desde la vista `core:metrics`.
+El registro vive en memoria del proceso: con varios workers cada uno expone
+sus propios contadores (Prometheus los agrega al consultar cada instancia).
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+# Límites de los buckets del histograma de duración (segundos)
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Una vista ejecutó más consultas que su presupuesto en QUERY_BUDGETS"""
+
+
+class RequestMetrics:
+    """Acumula las consultas ejecutadas durante una request"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Usado como execute_wrapper de la conexión
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.query_count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold=None):
+        """Sentencias repetidas con distintos parámetros: patrón típico de N+1"""
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_DUPLICATE_THRESHOLD', 3)
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+
+class MetricsRegistry:
+    """Agregados por vista, seguros entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.duration_sum = defaultdict(float)
+            self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+            self.queries = Counter()
+            self.sql_time = defaultdict(float)
+            self.response_bytes = Counter()
+            self.duplicate_queries = Counter()
+            self.budget_exceeded = Counter()
+
+    def observe(self, view, method, status, duration, query_count, sql_time, response_size,
+                duplicate_count, over_budget):
+        with self._lock:
+            self.requests[(view, method, str(status))] += 1
+            self.duration_sum[view] += duration
+            buckets = self.duration_buckets[view]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            self.queries[view] += query_count
+            self.sql_time[view] += sql_time
+            self.response_bytes[view] += response_size
+            self.duplicate_queries[view] += duplicate_count
+            if over_budget:
+                self.budget_exceeded[view] += 1
+
+    def render_prometheus(self):
+        """Exporta los agregados en formato de exposición de texto Prometheus"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            family('django_http_requests_total', 'counter', 'Requests por vista, método y estado')
+            for (view, method, status), value in sorted(self.requests.items()):
+                lines.append(f'django_http_requests_total{{view="{view}",method="{method}",status="{status}"}} {value}')
+
+            views = sorted({view for view, _, _ in self.requests})
+            counts = Counter()
+            for (view, _, _), value in self.requests.items():
+                counts[view] += value
+
+            family('django_http_request_duration_seconds', 'histogram', 'Duración total de la request')
+            for view in views:
+                for bound, value in zip(DURATION_BUCKETS, self.duration_buckets[view]):
+                    lines.append(f'django_http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {value}')
+                lines.append(f'django_http_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {counts[view]}')
+                lines.append(f'django_http_request_duration_seconds_sum{{view="{view}"}} {self.duration_sum[view]:.6f}')
+                lines.append(f'django_http_request_duration_seconds_count{{view="{view}"}} {counts[view]}')
+
+            family('django_db_queries_total', 'counter', 'Consultas SQL ejecutadas')
+            for view in views:
+                lines.append(f'django_db_queries_total{{view="{view}"}} {self.queries[view]}')
+
+            family('django_db_query_duration_seconds_total', 'counter', 'Tiempo total en SQL')
+            for view in views:
+                lines.append(f'django_db_query_duration_seconds_total{{view="{view}"}} {self.sql_time[view]:.6f}')
+
+            family('django_http_response_size_bytes_total', 'counter', 'Bytes de respuesta enviados')
+            for view in views:
+                lines.append(f'django_http_response_size_bytes_total{{view="{view}"}} {self.response_bytes[view]}')
+
+            family('django_db_duplicate_queries_total', 'counter', 'Sentencias repetidas (posible N+1)')
+            for view in views:
+                lines.append(f'django_db_duplicate_queries_total{{view="{view}"}} {self.duplicate_queries[view]}')
+
+            family('django_db_query_budget_exceeded_total', 'counter', 'Requests que superaron QUERY_BUDGETS')
+            for view in views:
+                lines.append(f'django_db_query_budget_exceeded_total{{view="{view}"}} {self.budget_exceeded[view]}')
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Estadísticas de psycopg_pool exportadas: (clave, métrica, tipo, ayuda)
+POOL_STATS = (
+    ('pool_max', 'django_db_pool_max_connections', 'gauge', 'Tamaño máximo del pool'),
+    ('pool_size', 'django_db_pool_connections', 'gauge', 'Conexiones abiertas por el pool'),
+    ('pool_available', 'django_db_pool_available_connections', 'gauge', 'Conexiones libres en el pool'),
+    ('requests_waiting', 'django_db_pool_requests_waiting', 'gauge', 'Pedidos esperando una conexión'),
+    ('requests_num', 'django_db_pool_requests_total', 'counter', 'Conexiones pedidas al pool'),
+    ('requests_wait_ms', 'django_db_pool_wait_milliseconds_total', 'counter', 'Tiempo total de espera por una conexión'),
+    ('requests_errors', 'django_db_pool_errors_total', 'counter', 'Pedidos que no obtuvieron conexión'),
+)
+
+
+def render_database_stats():
+    """Uso de los pools de conexiones y retraso de las réplicas en formato Prometheus"""
+    from .backends.postgresql_pool.pools import estadisticas
+    from .db_router import lags
+
+    lines = []
+    stats = estadisticas()
+    if stats:
+        for key, name, kind, help_text in POOL_STATS:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for alias, values in sorted(stats.items()):
+                lines.append(f'{name}{{alias="{alias}"}} {values.get(key, 0)}')
+        lines.append("# HELP django_db_pool_utilization Fracción del pool en uso")
+        lines.append("# TYPE django_db_pool_utilization gauge")
+        for alias, values in sorted(stats.items()):
+            in_use = values.get('pool_size', 0) - values.get('pool_available', 0)
+            lines.append(f'django_db_pool_utilization{{alias="{alias}"}} {in_use / max(values.get("pool_max", 1), 1):.3f}')
+
+    measured = {alias: lag for alias, (_, lag) in list(lags.items()) if lag is not None}
+    if measured:
+        lines.append("# HELP django_db_replica_lag_seconds Último retraso medido de cada réplica")
+        lines.append("# TYPE django_db_replica_lag_seconds gauge")
+        for alias, lag in sorted(measured.items()):
+            lines.append(f'django_db_replica_lag_seconds{{alias="{alias}"}} {lag:.3f}')
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def get_query_budget(view_name):
+    """Presupuesto de consultas declarado en settings.QUERY_BUDGETS para una vista"""
+    if not view_name:
+        return None
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
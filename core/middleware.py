@@ -1,10 +1,24 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
 from django.contrib import messages
 
+from . import db_router
+from .metrics import QueryBudgetExceeded, RequestMetrics, get_query_budget, registry
+from .roles import get_request_role
+
+metrics_logger = logging.getLogger('core.metrics')
+
 
 class AdminAccessMiddleware(MiddlewareMixin):
     """
@@ -28,3 +42,119 @@ class AdminAccessMiddleware(MiddlewareMixin):
                 return redirect('core:admin_access_denied')
         
         return None
+
+
+class RequestRoleMiddleware:
+    """
+    Middleware que expone el rol del usuario como `request.role`.
+
+    El rol se arma de forma perezosa con los ids de perfil que RoleModelBackend
+    trae junto con el usuario, de modo que las vistas y plantillas no vuelven a
+    consultar `user.profesional` / `user.paciente` / `user.groups` en cada uso.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: get_request_role(request))
+        request.user._request_role = request.role
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware que envía a las réplicas las lecturas de las vistas de solo
+    lectura (`settings.READ_REPLICA_VIEWS`); ver `core.db_router`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            token = getattr(request, '_replica_token', None)
+            if token is not None:
+                db_router.terminar_lectura(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (settings.DATABASE_REPLICAS and request.method in ('GET', 'HEAD')
+                and request.resolver_match.view_name in settings.READ_REPLICA_VIEWS):
+            request._replica_token = db_router.iniciar_lectura()
+
+
+class QueryMetricsMiddleware:
+    """
+    Middleware que mide cada request: cantidad de consultas, tiempo en SQL,
+    tiempo total y tamaño de la respuesta.
+
+    Los valores se agregan por nombre de URL en `core.metrics.registry`
+    (expuestos en `core:metrics`), se emiten como log estructurado en el logger
+    `core.metrics` y se comparan contra `settings.QUERY_BUDGETS`. Con
+    `QUERY_BUDGETS_STRICT = True` (activado en los tests) superar el presupuesto
+    lanza `QueryBudgetExceeded`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = RequestMetrics()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(request_metrics))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        if response.streaming:
+            response_size = int(response.get('Content-Length', 0) or 0)
+        else:
+            response_size = len(response.content)
+
+        duplicates = request_metrics.duplicates()
+        budget = get_query_budget(view_name)
+        over_budget = budget is not None and request_metrics.query_count > budget
+
+        registry.observe(
+            view=view_name,
+            method=request.method,
+            status=response.status_code,
+            duration=duration,
+            query_count=request_metrics.query_count,
+            sql_time=request_metrics.sql_time,
+            response_size=response_size,
+            duplicate_count=sum(duplicates.values()),
+            over_budget=over_budget,
+        )
+
+        record = {
+            'view': view_name,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': request_metrics.query_count,
+            'sql_ms': round(request_metrics.sql_time * 1000, 2),
+            'total_ms': round(duration * 1000, 2),
+            'response_bytes': response_size,
+        }
+        if duplicates:
+            record['duplicate_queries'] = [
+                {'sql': sql[:200], 'count': count} for sql, count in duplicates.items()
+            ]
+            metrics_logger.warning(json.dumps(record))
+        else:
+            metrics_logger.info(json.dumps(record))
+
+        if over_budget:
+            message = (f"{view_name} ejecutó {request_metrics.query_count} consultas "
+                       f"(presupuesto: {budget})")
+            metrics_logger.warning(message)
+            if getattr(settings, 'QUERY_BUDGETS_STRICT', False):
+                raise QueryBudgetExceeded(message)
+
+        return response
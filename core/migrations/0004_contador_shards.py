@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_version_rol'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contador',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='contador',
+            name='nombre',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='contador',
+            constraint=models.UniqueConstraint(fields=('nombre', 'shard'), name='contador_nombre_shard_uniq'),
+        ),
+    ]
@@ -18,3 +18,30 @@ class ContactMessage(models.Model):
     class Meta:
         ordering = ['-timestamp']
 
+
+
+class Contador(models.Model):
+    """Shard de un conteo materializado de filas de un modelo, mantenido por señales (ver core.counters)"""
+    nombre = models.CharField(max_length=50)
+    shard = models.PositiveSmallIntegerField(default=0)
+    valor = models.BigIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['nombre', 'shard'], name='contador_nombre_shard_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre}[{self.shard}]: {self.valor}"
+
+
+class VersionRol(models.Model):
+    """Versión del rol de un usuario (ver core.roles): cambia con sus perfiles, grupos o permisos"""
+    # Sin restricción de FK: las señales de baja de perfiles la incrementan mientras se borra el usuario
+    user = models.OneToOneField(User, on_delete=models.DO_NOTHING, db_constraint=False,
+                                primary_key=True, related_name='version_rol')
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: v{self.version}"
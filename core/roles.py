@@ -0,0 +1,167 @@
+"""
+Resolución del rol del usuario una sola vez por request.
+
+RoleModelBackend carga `request.user` con los ids de sus perfiles (LEFT JOIN a
+profesional y paciente) y la versión de su rol en la misma consulta, así que el
+rol (profesional, paciente, administrador) no cuesta consultas extra y nunca
+está desactualizado. Los grupos se leen solo si alguien los pide. La versión
+(`core.models.VersionRol`) se incrementa cuando cambian los perfiles, grupos o
+permisos del usuario y forma parte de los ETag de las vistas.
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+from .models import VersionRol
+
+
+class RoleModelBackend(ModelBackend):
+    """ModelBackend que carga el usuario junto con sus perfiles y la versión de su rol"""
+
+    def get_user(self, user_id):
+        user = (User._default_manager.annotate(
+            role_version=Coalesce('version_rol__version', 0),
+            role_profesional_id=F('profesional__id'),
+            role_paciente_id=F('paciente__id'),
+        ).filter(pk=user_id).first())
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+def role_version(user):
+    """Versión actual del rol; sin consulta si el usuario vino de RoleModelBackend"""
+    version = getattr(user, 'role_version', None)
+    if version is None:
+        version = VersionRol.objects.filter(user_id=user.pk).values_list('version', flat=True).first() or 0
+        user.role_version = version
+    return version
+
+
+class RequestRole:
+    """Rol del usuario actual expuesto como `request.role`"""
+
+    def __init__(self, user=None, profesional_id=None, paciente_id=None, groups=None):
+        self.user = user
+        self.profesional_id = profesional_id
+        self.paciente_id = paciente_id
+        self._groups = None if groups is None else frozenset(groups)
+        self._profesional = None
+        self._paciente = None
+
+    @property
+    def is_authenticated(self):
+        return bool(self.user and self.user.is_authenticated)
+
+    @property
+    def is_admin(self):
+        return self.is_authenticated and (self.user.is_staff or self.user.is_superuser)
+
+    @property
+    def is_profesional(self):
+        return self.profesional_id is not None
+
+    @property
+    def is_paciente(self):
+        return self.paciente_id is not None
+
+    @property
+    def name(self):
+        if not self.is_authenticated:
+            return 'anonimo'
+        if self.user.is_superuser:
+            return 'admin'
+        if self.is_profesional:
+            return 'profesional'
+        if self.is_paciente:
+            return 'paciente'
+        if self.user.is_staff:
+            return 'staff'
+        return 'usuario'
+
+    @property
+    def groups(self):
+        """Nombres de los grupos del usuario, consultados la primera vez que se usan"""
+        if self._groups is None:
+            self._groups = frozenset(
+                self.user.groups.values_list('name', flat=True) if self.is_authenticated else ()
+            )
+        return self._groups
+
+    def has_group(self, group_name):
+        return group_name in self.groups
+
+    @property
+    def profesional(self):
+        """Instancia de Profesional, cargada solo si la vista la necesita"""
+        if self._profesional is None and self.is_profesional:
+            from apps.users.models import Profesional
+            self._profesional = Profesional.objects.filter(pk=self.profesional_id).first()
+            if self._profesional is None:
+                # Perfil eliminado desde que se resolvió el rol: se trata como sin rol
+                self.profesional_id = None
+            else:
+                self._profesional.user = self.user
+        return self._profesional
+
+    @property
+    def paciente(self):
+        """Instancia de Paciente, cargada solo si la vista la necesita"""
+        if self._paciente is None and self.is_paciente:
+            from apps.users.models import Paciente
+            self._paciente = Paciente.objects.filter(pk=self.paciente_id).first()
+            if self._paciente is None:
+                self.paciente_id = None
+            else:
+                self._paciente.user = self.user
+        return self._paciente
+
+    def __repr__(self):
+        return f"<RequestRole {self.name} profesional={self.profesional_id} paciente={self.paciente_id}>"
+
+
+def resolve_role(user):
+    """Resuelve el rol de un usuario con una única consulta (LEFT JOIN a perfiles y grupos)"""
+    if not user or not user.is_authenticated:
+        return RequestRole(user=user)
+
+    rows = User.objects.filter(pk=user.pk).values_list('profesional__id', 'paciente__id', 'groups__name')
+    profesional_id = paciente_id = None
+    groups = set()
+    for profesional_id, paciente_id, group_name in rows:
+        if group_name:
+            groups.add(group_name)
+    return RequestRole(user=user, profesional_id=profesional_id, paciente_id=paciente_id, groups=groups)
+
+
+def get_request_role(request):
+    """Rol de request.user: sin consultas si el usuario vino de RoleModelBackend"""
+    user = request.user
+    if not user.is_authenticated:
+        role = RequestRole(user=user)
+    elif hasattr(user, 'role_profesional_id'):
+        role = RequestRole(user=user, profesional_id=user.role_profesional_id, paciente_id=user.role_paciente_id)
+    else:
+        role = resolve_role(user)
+    user._request_role = role
+    return role
+
+
+def get_user_role(user):
+    """Rol de un usuario fuera del ciclo request (por ejemplo en `user_passes_test`)"""
+    role = getattr(user, '_request_role', None)
+    if role is None:
+        role = resolve_role(user)
+        user._request_role = role
+    return role
+
+
+def invalidate_role(user_id):
+    """Incrementa la versión del rol del usuario, lo que invalida los ETag de sus vistas en todos los procesos"""
+    if VersionRol.objects.filter(user_id=user_id).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            VersionRol.objects.create(user_id=user_id, version=1)
+    except IntegrityError:
+        VersionRol.objects.filter(user_id=user_id).update(version=F('version') + 1)
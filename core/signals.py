@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters
+from .roles import invalidate_role
+
+
+@receiver(post_save, sender='users.Profesional')
+@receiver(post_save, sender='users.Paciente')
+def invalidar_rol_por_perfil(sender, instance, created, **kwargs):
+    """Un perfil nuevo cambia el rol del usuario"""
+    if created:
+        invalidate_role(instance.user_id)
+
+
+@receiver(post_delete, sender='users.Profesional')
+@receiver(post_delete, sender='users.Paciente')
+def invalidar_rol_por_perfil_eliminado(sender, instance, **kwargs):
+    invalidate_role(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidar_rol_por_usuario(sender, instance, created, update_fields=None, **kwargs):
+    """Cambios de is_staff/is_superuser; se ignora la actualización de last_login del login"""
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_role(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_rol_por_grupos(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance es el Group: se invalidan los usuarios afectados
+        if action in ('post_add', 'post_remove'):
+            user_ids = pk_set
+        elif action == 'pre_clear':
+            user_ids = instance.user_set.values_list('pk', flat=True)
+        else:
+            return
+        for user_id in user_ids:
+            invalidate_role(user_id)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_role(instance.pk)
+
+
+def _contar_alta(nombre):
+    def handler(sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            counters.increment(nombre, 1)
+    return handler
+
+
+def _contar_baja(nombre):
+    def handler(sender, instance, **kwargs):
+        counters.increment(nombre, -1)
+    return handler
+
+
+for _nombre, _modelo in counters.COUNTED_MODELS.items():
+    post_save.connect(_contar_alta(_nombre), sender=_modelo, weak=False, dispatch_uid=f'contador_alta_{_nombre}')
+    post_delete.connect(_contar_baja(_nombre), sender=_modelo, weak=False, dispatch_uid=f'contador_baja_{_nombre}')
@@ -0,0 +1,20 @@
+"""
+Storage de estáticos para producción.
+
+CompressedManifestStaticFilesStorage, incluso con WHITENOISE_MANIFEST_STRICT
+en False, calcula el hash del archivo cuando no está en el manifiesto y lanza
+ValueError si el archivo tampoco está en STATIC_ROOT: sin la salida de
+collectstatic cada `{% static %}` termina en un 500. Esta variante usa en ese
+caso el nombre sin hash, que collectstatic también publica.
+"""
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class ManifestConRespaldoStorage(CompressedManifestStaticFilesStorage):
+    """Nombre con hash si collectstatic lo generó; si no, el nombre original"""
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
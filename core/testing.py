@@ -0,0 +1,292 @@
+"""
+Utilidades para los tests.
+
+`HospitalTestCase` siembra un hospital mínimo (unos pocos pacientes con dos
+registros por sección) y verifica los presupuestos de consultas de
+`settings.QUERY_BUDGETS` en modo estricto: la cantidad de consultas no depende
+del volumen de datos, así que estos tests son rápidos y deterministas.
+
+`PerformanceTestCase` es opcional (`PERF_TESTS=1`): siembra el conjunto grande
+y compara el tiempo de cada vista contra una línea base en JSON. La primera
+ejecución (o `PERF_UPDATE_BASELINE=1`) graba la línea base; las siguientes
+fallan si una vista es más lenta que `PERF_TOLERANCE` veces su valor grabado.
+Los tiempos dependen de la máquina, por eso no corren en la suite normal.
+
+Variables de entorno:
+    PERF_TESTS            Si es 1, corre los tests de tiempos
+    PERF_SCALE            Cantidad de pacientes a sembrar (por defecto 200)
+    PERF_BASELINE_PATH    Archivo de línea base (por defecto perf_baseline.json)
+    PERF_TOLERANCE        Factor de tolerancia sobre la línea base (por defecto 1.5)
+    PERF_UPDATE_BASELINE  Si es 1, reescribe la línea base con los tiempos actuales
+"""
+import json
+import os
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from .counters import reconcile
+from .metrics import get_query_budget
+
+PERF_TESTS = os.getenv('PERF_TESTS', '0') == '1'
+PERF_SCALE = int(os.getenv('PERF_SCALE', '200'))
+PERF_TOLERANCE = float(os.getenv('PERF_TOLERANCE', '1.5'))
+PERF_BASELINE_PATH = Path(os.getenv('PERF_BASELINE_PATH', settings.BASE_DIR / 'perf_baseline.json'))
+PERF_UPDATE_BASELINE = os.getenv('PERF_UPDATE_BASELINE', '0') == '1'
+
+# Hospital de los tests funcionales: alcanza para paginar y para ver consultas N+1
+DATOS_MINIMOS = {'pacientes': 12, 'registros_por_paciente': 2, 'profesionales': 3, 'salas': 3, 'camas_por_sala': 15}
+
+# Margen absoluto para que el ruido en vistas muy rápidas no produzca falsos positivos
+PERF_ABSOLUTE_SLACK = 0.005
+
+FAKE_BLOCKCHAIN_RESULT = {
+    'polygon': {'transaction_hash': '0x' + '0' * 64, 'block_number': 1},
+    'filecoin': {'status': 'no_file_provided'},
+    'record_hash': '',
+}
+
+
+def mock_blockchain():
+    """Evita las llamadas de red a Polygon al crear registros médicos"""
+    return mock.patch(
+        'apps.users.blockchain_services.MedicalBlockchainService.store_medical_record',
+        return_value=FAKE_BLOCKCHAIN_RESULT,
+    )
+
+
+def seed_dataset(pacientes=PERF_SCALE, registros_por_paciente=3, profesionales=5, salas=10, camas_por_sala=20):
+    """
+    Crea un hospital de prueba. Los registros médicos se crean con save() para
+    que generen sus hashes de blockchain igual que en producción.
+    """
+    from apps.chat.models import ChatMessage
+    from apps.institucion.models import Cama, Enfermero, Operario, Sala
+    from apps.institucion.ocupacion import reconciliar as reconciliar_ocupacion
+    from apps.users.models import (
+        Alergia, Antecedente, Cirugia, CondicionMedica, Medicamento, Paciente,
+        Profesional, PruebaLaboratorio, Tratamiento, Turno,
+    )
+
+    rng = random.Random(42)
+    password = make_password('password123')
+    hoy = date.today()
+
+    users = User.objects.bulk_create([
+        User(username=f'medico{i}', first_name=f'Medico{i}', last_name='Perf', password=password)
+        for i in range(profesionales)
+    ])
+    medicos = [
+        Profesional.objects.create(
+            user=user, especialidad='medicina_general', matricula=f'MP{i:05d}', telefono='000'
+        )
+        for i, user in enumerate(users)
+    ]
+    medicamento = Medicamento.objects.create(
+        nombre='Paracetamol', principio_activo='Paracetamol', concentracion='500mg', forma_farmaceutica='Tableta'
+    )
+
+    users = User.objects.bulk_create([
+        User(username=f'paciente{i}', first_name=f'Nombre{i}', last_name=f'Apellido{i}',
+             email=f'paciente{i}@example.com', password=password)
+        for i in range(pacientes)
+    ])
+    generos = [choice for choice, _ in Paciente.GENDER_CHOICES]
+    lista_pacientes = []
+    for i, user in enumerate(users):
+        paciente = Paciente.objects.create(
+            user=user,
+            cedula=f'{10000000 + i}',
+            genero=rng.choice(generos),
+            fecha_nacimiento=hoy - timedelta(days=rng.randint(365, 90 * 365)),
+            tipo_sangre='O+',
+        )
+        lista_pacientes.append(paciente)
+        medico = medicos[i % len(medicos)]
+        for j in range(registros_por_paciente):
+            fecha = hoy - timedelta(days=rng.randint(1, 3650))
+            Alergia.objects.create(paciente=paciente, sustancia=f'Sustancia {j}', fecha_diagnostico=fecha)
+            CondicionMedica.objects.create(paciente=paciente, codigo=f'C{j:02d}', fecha_diagnostico=fecha)
+            Tratamiento.objects.create(
+                paciente=paciente, profesional=medico, medicamento=medicamento,
+                descripcion=f'Tratamiento {j}', fecha_inicio=fecha,
+            )
+            Antecedente.objects.create(paciente=paciente, tipo='personal', descripcion=f'Antecedente {j}')
+            PruebaLaboratorio.objects.create(
+                paciente=paciente, profesional=medico, nombre_prueba=f'Prueba {j}',
+                fecha_realizacion=fecha, resultados='Normal',
+            )
+            Cirugia.objects.create(
+                paciente=paciente, profesional=medico, nombre_cirugia=f'Cirugia {j}',
+                fecha_cirugia=fecha, descripcion='Sin complicaciones',
+            )
+
+    turnos = []
+    for i, paciente in enumerate(lista_pacientes):
+        medico = medicos[i % len(medicos)]
+        for dias in (0, 1, 3, 10):
+            turnos.append(Turno(
+                paciente=paciente, profesional=medico, motivo='Control',
+                fecha_hora=_at(hoy + timedelta(days=dias), 8 + i % 10),
+            ))
+    Turno.objects.bulk_create(turnos)
+
+    enfermeros = Enfermero.objects.bulk_create([
+        Enfermero(nombre=f'Enfermero{i}', apellido='Perf', especialidad='General', turno='mañana')
+        for i in range(salas * 2)
+    ])
+    Operario.objects.bulk_create([
+        Operario(nombre=f'Operario{i}', apellido='Perf', area='Mantenimiento', turno='tarde')
+        for i in range(salas)
+    ])
+    lista_salas = Sala.objects.bulk_create([
+        Sala(nombre=f'Sala {i}', capacidad=camas_por_sala) for i in range(salas)
+    ])
+    Cama.objects.bulk_create([
+        Cama(numero=n, sala=sala, estado=rng.choice(['disponible', 'ocupada']),
+             enfermero_asignado=enfermeros[(s * 2 + n) % len(enfermeros)])
+        for s, sala in enumerate(lista_salas) for n in range(1, camas_por_sala + 1)
+    ])
+
+    ChatMessage.objects.bulk_create([
+        ChatMessage(user=lista_pacientes[0].user, user_message=f'Pregunta {i}', ai_response=f'Respuesta {i}')
+        for i in range(200)
+    ])
+
+    # Las cargas con bulk_create no emiten señales: se reconcilian los contadores
+    # como lo haría el comando periódico reconciliar_contadores
+    reconcile()
+    reconciliar_ocupacion()
+
+    return {'profesionales': medicos, 'pacientes': lista_pacientes}
+
+
+def _at(day, hour):
+    return timezone.make_aware(datetime.combine(day, dtime(hour=hour)))
+
+
+class PerformanceBaseline:
+    """Línea base de tiempos por vista, persistida en JSON"""
+
+    def __init__(self, path=PERF_BASELINE_PATH):
+        self.path = Path(path)
+        self.recorded = {}
+        try:
+            self.values = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.values = {}
+
+    def check(self, name, seconds):
+        """Devuelve un mensaje de error si el tiempo supera la línea base"""
+        self.recorded[name] = seconds
+        baseline = self.values.get(name)
+        if baseline is None or PERF_UPDATE_BASELINE:
+            return None
+        limit = baseline * PERF_TOLERANCE + PERF_ABSOLUTE_SLACK
+        if seconds > limit:
+            return (f"{name}: {seconds * 1000:.1f} ms supera la línea base "
+                    f"{baseline * 1000:.1f} ms (límite {limit * 1000:.1f} ms)")
+        return None
+
+    def save(self):
+        if not self.recorded:
+            return
+        values = dict(self.values)
+        for name, seconds in self.recorded.items():
+            if PERF_UPDATE_BASELINE or name not in values:
+                values[name] = round(seconds, 6)
+        self.path.write_text(json.dumps(values, indent=2, sort_keys=True) + "\n")
+
+
+@override_settings(QUERY_BUDGETS_STRICT=True)
+class HospitalTestCase(TestCase):
+    """Base de los tests funcionales: hospital mínimo y presupuestos de consultas"""
+
+    datos = DATOS_MINIMOS
+
+    @classmethod
+    def setUpClass(cls):
+        cls._blockchain_patch = mock_blockchain()
+        cls._blockchain_patch.start()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._blockchain_patch.stop()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset(**cls.datos)
+        cls.paciente = cls.data['pacientes'][0]
+        cls.profesional = cls.data['profesionales'][0]
+
+    def setUp(self):
+        super().setUp()
+        # La caché sobrevive al rollback de cada test: se limpia para no arrastrar agendas ni fragmentos
+        cache.clear()
+
+    def login(self, user):
+        self.client.force_login(user)
+
+    def assertQueryBudget(self, url, expected_status=200, method='get', data=None):
+        """Ejecuta la vista y verifica su presupuesto de consultas (QUERY_BUDGETS)"""
+        view_name = resolve(url.split('?')[0]).view_name
+        budget = get_query_budget(view_name)
+        self.assertIsNotNone(budget, f"{view_name} no tiene presupuesto en QUERY_BUDGETS")
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertEqual(response.status_code, expected_status, url)
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{view_name} ejecutó {len(queries)} consultas (presupuesto: {budget})",
+        )
+        return response
+
+
+@skipUnless(PERF_TESTS, 'tests de tiempos desactivados (PERF_TESTS=1 para correrlos)')
+class PerformanceTestCase(HospitalTestCase):
+    """Base de los tests de tiempos: conjunto grande y línea base"""
+
+    datos = {'pacientes': PERF_SCALE}
+    timing_rounds = 3
+
+    @classmethod
+    def setUpClass(cls):
+        cls.baseline = PerformanceBaseline()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.baseline.save()
+
+    def assertViewPerformance(self, url, expected_status=200, method='get', data=None, label=None):
+        """
+        Registra el mejor tiempo de varias rondas de la vista contra la línea
+        base; cada ronda verifica además el presupuesto de consultas.
+        """
+        best = None
+        for _ in range(self.timing_rounds):
+            start = time.perf_counter()
+            response = self.assertQueryBudget(url, expected_status, method, data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        name = f"{self.__class__.__name__}.{label or resolve(url.split('?')[0]).view_name}"
+        error = self.baseline.check(name, best)
+        if error:
+            self.fail(error)
+        return response
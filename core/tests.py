@@ -1,3 +1,332 @@
-from django.test import TestCase
+import base64
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
\ No newline at end of file
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from apps.users.models import Paciente
+
+from .assets import assets_de_pagina
+from . import counters, db_router, hashers
+from .models import Contador
+from .roles import RequestRole, invalidate_role, role_version
+from .storage import ManifestConRespaldoStorage
+from .backends.postgresql_pool import pools
+from .counters import get_counters
+from .explain import SCAN_RE, revisar
+from .importtime import medir_importacion, tiempo_total
+from .metrics import render_database_stats
+from .testing import HospitalTestCase, PerformanceTestCase
+
+
+class CoreViewsQueryBudgetTests(HospitalTestCase):
+    """Presupuestos de consultas de las vistas generales y del chat"""
+
+    def test_index(self):
+        self.login(self.paciente.user)
+        self.assertQueryBudget(reverse('core:index'))
+
+    def test_chat_history(self):
+        self.login(self.paciente.user)
+        response = self.assertQueryBudget(reverse('chat:get_chat_history'))
+        self.assertEqual(len(response.json()['history']), 200)
+
+    def test_metrics_endpoint(self):
+        self.login(self.paciente.user)
+        self.client.get(reverse('core:index'))
+        response = self.client.get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('django_db_queries_total{view="core:index"}', response.content.decode())
+
+
+class ViewTimingTests(PerformanceTestCase):
+    """Tiempos de las vistas principales contra la línea base (solo con PERF_TESTS=1)"""
+
+    def test_vistas_del_paciente(self):
+        self.login(self.paciente.user)
+        for url in (reverse('core:index'), reverse('users:mi_perfil'), reverse('chat:get_chat_history')):
+            with self.subTest(url):
+                self.assertViewPerformance(url)
+
+    def test_vistas_del_profesional(self):
+        self.login(self.profesional.user)
+        session = self.client.session
+        session[f'verified_paciente_{self.paciente.id}'] = True
+        session.save()
+        genesis = self.paciente.blockchain_hashes.get(categoria='genesis')
+        urls = [
+            reverse('users:user_list'),
+            reverse('users:perfil_paciente', args=[self.paciente.id]),
+            reverse('users:panel_profesional'),
+            reverse('users:buscar_pacientes') + '?nombre=Nombre1',
+            reverse('users:patient_blockchain_hashes', args=[self.paciente.id]),
+            reverse('users:hash_detail', args=[genesis.id]),
+            reverse('users:ver_alergia', args=[self.paciente.id, self.paciente.alergias.first().id]),
+        ]
+        for url in urls:
+            with self.subTest(url):
+                self.assertViewPerformance(url)
+
+    def test_vistas_institucionales(self):
+        self.login(User.objects.create_superuser('admin_tiempos', password='password123'))
+        for nombre in ('institucion:lista_camas', 'institucion:institutional_management', 'institucion:ocupacion_salas'):
+            with self.subTest(nombre):
+                self.assertViewPerformance(reverse(nombre))
+
+
+class CountersTests(HospitalTestCase):
+    """Los contadores materializados siguen a las altas y bajas"""
+
+    def test_contadores_coinciden_con_count(self):
+        self.assertEqual(get_counters('pacientes')['pacientes'], Paciente.objects.count())
+
+    def test_baja_actualiza_contador(self):
+        antes = get_counters('pacientes', 'hashes')
+        hashes_paciente = self.paciente.blockchain_hashes.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paciente.delete()
+        despues = get_counters('pacientes', 'hashes')
+        self.assertEqual(despues['pacientes'], antes['pacientes'] - 1)
+        self.assertEqual(despues['hashes'], antes['hashes'] - hashes_paciente)
+
+    @override_settings(COUNTERS_SHARDS=4)
+    def test_incrementos_repartidos_en_shards(self):
+        antes = get_counters('salas')['salas']
+        for _ in range(40):
+            counters.increment('salas', 1)
+        self.assertEqual(get_counters('salas')['salas'], antes + 40)
+        self.assertGreater(Contador.objects.filter(nombre='salas').count(), 1)
+
+        self.assertEqual(counters.reconcile(['salas']), {'salas': antes})
+        self.assertEqual(list(Contador.objects.filter(nombre='salas').values_list('shard', 'valor')), [(0, antes)])
+
+
+class ColdStartTests(SimpleTestCase):
+    """Arranque en frío del punto de entrada serverless"""
+
+    def test_presupuesto_de_importacion(self):
+        filas = medir_importacion()
+        importados = {nombre.split('.')[0] for nombre, _, _ in filas}
+        # web3 solo se importa al usar el servicio de Polygon
+        self.assertNotIn('web3', importados)
+        self.assertLess(tiempo_total(filas), settings.COLD_START_BUDGET_MS)
+
+
+class VercelHandlerTests(SimpleTestCase):
+    """Adaptador WSGI de api/index.py"""
+
+    def setUp(self):
+        from api.index import handler
+        self.handler = handler
+
+    def request(self, method='GET', body=None, headers=None):
+        return SimpleNamespace(method=method, path='/', query_string='', headers=headers or {}, body=body)
+
+    def test_binario_en_base64(self):
+        contenido = bytes(range(256)) * 100
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/pdf')])
+            return iter([contenido[:1000], contenido[1000:]])
+
+        respuesta = self.handler(self.request(), app)
+        self.assertTrue(respuesta['isBase64Encoded'])
+        self.assertEqual(base64.b64decode(respuesta['body']), contenido)
+
+    def test_texto_y_cuerpo_de_entrada(self):
+        cerrado = []
+
+        class Resultado(list):
+            def close(self):
+                cerrado.append(True)
+
+        def app(environ, start_response):
+            cuerpo = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+            start_response('200 OK', [
+                ('Content-Type', 'application/json'), ('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2'),
+            ])
+            return Resultado([cuerpo])
+
+        respuesta = self.handler(self.request('POST', '{"ñ": 1}'.encode(), {'content-type': 'application/json'}), app)
+        self.assertFalse(respuesta['isBase64Encoded'])
+        self.assertEqual(respuesta['body'], '{"ñ": 1}')
+        self.assertEqual(respuesta['multiValueHeaders']['Set-Cookie'], ['a=1', 'b=2'])
+        self.assertEqual(cerrado, [True])
+
+    def test_respuesta_demasiado_grande(self):
+        from api import index
+        cerrado = []
+
+        def bloques():
+            try:
+                while True:
+                    yield b'x' * 1024
+            finally:
+                cerrado.append(True)
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/fhir+ndjson')])
+            return bloques()
+
+        with mock.patch.object(index, 'MAX_BODY_BYTES', 10 * 1024):
+            respuesta = self.handler(self.request(), app)
+        self.assertEqual(respuesta['statusCode'], 502)
+        self.assertEqual(cerrado, [True])
+
+    def test_vista_django(self):
+        respuesta = self.handler(self.request(headers={'host': 'localhost'}))
+        self.assertIn(respuesta['statusCode'], (200, 302))
+
+
+class StaticAssetsTests(SimpleTestCase):
+    """Estáticos referenciados por las páginas (comando static_report)"""
+
+    def test_assets_de_pagina(self):
+        html = (
+            '<link href="/static/css/output.1a2b3c4d5e6f.css" rel="stylesheet">'
+            '<script src="https://unpkg.com/alpinejs@3.x.x/dist/cdn.min.js"></script>'
+            '<img src="/static/img/logo.jpg?v=1"><img src=\'/static/img/logo.jpg\'>'
+            '<a href="/login/">'
+        )
+        self.assertEqual(assets_de_pagina(html), ['/static/css/output.1a2b3c4d5e6f.css', '/static/img/logo.jpg'])
+
+    def test_storage_sin_collectstatic(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            storage = ManifestConRespaldoStorage(location=directorio, base_url='/static/')
+            self.assertEqual(storage.url('css/output.css'), '/static/css/output.css')
+            with open(os.path.join(directorio, 'app.js'), 'w') as archivo:
+                archivo.write('1')
+            self.assertRegex(storage.url('app.js'), r'^/static/app\.[0-9a-f]{12}\.js$')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_MAX_LAG=5)
+class ReplicaRouterTests(SimpleTestCase):
+    """Lecturas en réplicas solo dentro de vistas de consulta y con réplicas al día"""
+
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        self.token = db_router.iniciar_lectura()
+        self.addCleanup(lambda: db_router.terminar_lectura(self.token))
+        patcher = mock.patch('core.db_router.lag_replica', return_value=1.0)
+        self.lag = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lectura_en_replica(self):
+        self.assertEqual(self.router.db_for_read(Paciente), 'replica_1')
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def test_fuera_de_vista_de_consulta(self):
+        db_router.terminar_lectura(self.token)
+        self.assertEqual(self.router.db_for_read(Paciente), 'default')
+        self.token = db_router.iniciar_lectura()
+
+    def test_replica_atrasada_o_caida(self):
+        for lag in (30.0, None):
+            self.lag.return_value = lag
+            self.assertEqual(self.router.db_for_read(Paciente), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+    def test_replica_fija_por_request(self):
+        with mock.patch('core.db_router.random.choice', side_effect=['replica_2', 'replica_1']) as eleccion:
+            self.assertEqual(self.router.db_for_read(Paciente), 'replica_2')
+            self.assertEqual(self.router.db_for_read(Paciente), 'replica_2')
+        self.assertEqual(eleccion.call_count, 1)
+
+    def test_sin_replica_al_dia_toda_la_request_va_al_primario(self):
+        self.lag.return_value = 30.0
+        self.assertEqual(self.router.db_for_read(Paciente), 'default')
+        self.lag.return_value = 1.0
+        self.assertEqual(self.router.db_for_read(Paciente), 'default')
+
+    def test_lee_sus_escrituras(self):
+        self.assertEqual(self.router.db_for_write(Paciente), 'default')
+        self.assertEqual(self.router.db_for_read(Paciente), 'default')
+
+    def test_metricas_del_pool(self):
+        pool = mock.Mock(**{'get_stats.return_value': {'pool_max': 4, 'pool_size': 3, 'pool_available': 1}})
+        with mock.patch.dict(pools.POOLS, {('default', 'arqa'): pool}, clear=True):
+            texto = render_database_stats()
+        self.assertIn('django_db_pool_available_connections{alias="default"} 1', texto)
+        self.assertIn('django_db_pool_utilization{alias="default"} 0.500', texto)
+
+
+class ExplainHotPathsTests(HospitalTestCase):
+    """Las consultas calientes usan índices (comando explain_hot_paths)"""
+
+    def test_sin_lecturas_secuenciales(self):
+        resultados = revisar()
+        self.assertGreaterEqual(len(resultados), 8)
+        self.assertEqual([(nombre, tablas) for nombre, _, tablas in resultados if tablas], [])
+
+    def test_deteccion_de_scan(self):
+        plan = '2 0 0 SCAN institucion_sala\n4 0 0 SCAN users_paciente USING COVERING INDEX x'
+        self.assertEqual(SCAN_RE['sqlite'].findall(plan), ['institucion_sala'])
+
+
+class PasswordHashersTests(HospitalTestCase):
+    """Política de hashers y actualización del hash al iniciar sesión"""
+
+    def test_politicas(self):
+        self.assertEqual(hashers.politica_por_defecto(['manage.py', 'test']), 'rapida')
+        self.assertEqual(hashers.politica_por_defecto(['manage.py', 'benchmark_login']), 'rapida')
+        self.assertEqual(settings.PASSWORD_HASHERS[0], hashers.RAPIDO)
+        self.assertEqual(hashers.hashers_para('produccion', con_argon2=True)[0], hashers.ARGON2)
+        self.assertEqual(hashers.hashers_para('produccion', con_argon2=False), hashers.HEREDADOS)
+        self.assertNotIn(hashers.RAPIDO, hashers.hashers_para('produccion'))
+        with self.assertRaises(ValueError):
+            hashers.hashers_para('otra')
+
+    def test_rehash_al_iniciar_sesion(self):
+        user = self.paciente.user
+        user.password = make_password('password123', hasher='pbkdf2_sha256')
+        user.save(update_fields=['password'])
+        self.assertTrue(self.client.login(username=user.username, password='password123'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('md5$'))
+
+    @skipUnless(hashers.argon2_disponible(), 'argon2-cffi no instalado')
+    def test_argon2_con_costos_de_settings(self):
+        with override_settings(PASSWORD_HASHERS=hashers.hashers_para('produccion')):
+            encoded = make_password('password123')
+            self.assertTrue(encoded.startswith('argon2$'))
+            self.assertFalse(get_hasher().must_update(encoded))
+            with override_settings(ARGON2_TIME_COST=settings.ARGON2_TIME_COST + 1):
+                self.assertTrue(get_hasher().must_update(encoded))
+
+
+class RoleVersionTests(HospitalTestCase):
+    """Rol cargado junto con request.user y versión del rol en la base"""
+
+    def test_rol_sin_consultas_extra(self):
+        self.login(self.profesional.user)
+        # Sesión y usuario (con perfiles y versión del rol); el índice no necesita más
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('core:index'))
+        self.assertEqual(response.wsgi_request.role.profesional_id, self.profesional.pk)
+
+    def test_invalidacion_visible_sin_cache_compartida(self):
+        user = self.profesional.user
+        version = role_version(User.objects.get(pk=user.pk))
+        invalidate_role(user.pk)
+        # Otro proceso: su caché local no sabe nada de la invalidación
+        cache.clear()
+        self.assertEqual(role_version(User.objects.get(pk=user.pk)), version + 1)
+
+    def test_perfil_eliminado_es_sin_rol(self):
+        self.login(self.profesional.user)
+        url = reverse('users:panel_profesional')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.profesional.delete()
+        self.assertRedirects(self.client.get(url), reverse('core:index'), fetch_redirect_response=False)
+
+        role = RequestRole(user=self.profesional.user, profesional_id=999999)
+        self.assertIsNone(role.profesional)
+        self.assertFalse(role.is_profesional)
@@ -8,6 +8,7 @@ urlpatterns = [
     # Páginas principales
     path('', views.index, name='index'),
     path('admin-access-denied/', views.admin_access_denied, name='admin_access_denied'),
+    path('metrics/', views.metrics, name='metrics'),
 
 ]
 
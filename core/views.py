@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -13,8 +15,11 @@ def admin_access_denied(request):
     return render(request, 'admin_access_denied.html')
 
 
+def metrics(request):
+    """Métricas de requests en formato Prometheus, solo accesibles desde IPs locales."""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
 
-
-
-
-
+    from .metrics import registry, render_database_stats
+    return HttpResponse(registry.render_prometheus() + render_database_stats(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,7 @@
 /** @type {import('tailwindcss').Config} */
 module.exports = {
-  content: ['./templates/**/*.html'],
+  // Solo se generan las clases usadas en plantillas y en los widgets de los formularios
+  content: ['./templates/**/*.html', './apps/**/*.py', './core/**/*.py'],
   theme: {
     extend: {},
   },
@@ -9,6 +10,6 @@ module.exports = {
     require('daisyui')
   ],
   daisyui: {
-    themes: ["light", "dark", "synthwave", "retro", "cyberpunk", "valentine", "halloween", "garden", "forest", "aqua", "lofi", "pastel", "fantasy", "wireframe", "black", "luxury", "dracula", "cmyk", "autumn", "business", "acid", "lemonade", "night", "coffee", "winter"],
+    themes: ["light", "synthwave"],  // los que alterna layouts/theme-controller.html
   },
 }
\ No newline at end of file
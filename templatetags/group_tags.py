@@ -1,9 +1,15 @@
 from django import template
 
+from core.roles import RequestRole
+
 register = template.Library()
 
 @register.filter(name='has_group')
 def has_group(user, group_name):
+    """Acepta `request.role` o un usuario; usa los grupos ya resueltos por RequestRoleMiddleware"""
+    role = user if isinstance(user, RequestRole) else getattr(user, '_request_role', None)
+    if role is not None:
+        return role.has_group(group_name)
     return user.groups.filter(name=group_name).exists()
 
 @register.filter